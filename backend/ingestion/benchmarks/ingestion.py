@@ -0,0 +1,299 @@
+"""
+Benchmarks for the ingestion pipeline.
+
+Generates synthetic directory trees of a given shape on tmpfs, so the numbers
+measure the pipeline rather than the disk, and times each stage of a scan and
+refresh end to end: map_file_system, GraphML export, the Merkle trees, the
+rescan after a batch of changes, _find_differences and
+update_graph_with_merkle_tree. A sampler thread records the peak RSS of every
+stage. Results are written as JSON; given an earlier result file, stages that
+got slower than the threshold are reported and the exit status is 1.
+
+Run from backend/ingestion:
+
+    python -m benchmarks.ingestion --entries 10000,100000 --compact
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+
+import psutil
+import networkx as nx
+
+from server.server.system.fstree import FileSystemTree
+from server.server.system.rules import read_mounts
+
+TMPFS = "/dev/shm"
+
+
+class PeakMemory(object):
+    """Samples the RSS of this process while the block runs."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.start = 0
+        self.peak = 0
+        self._stopped = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self) -> "PeakMemory":
+        self.start = self.peak = self.process.memory_info().rss
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def measure(stages: Dict[str, dict], name: str, run: Callable, *args, **kwargs):
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        result = run(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    stages[name] = {
+        "seconds": seconds,
+        "peak_rss": memory.peak,
+        "rss_delta": memory.peak - memory.start,
+    }
+    return result
+
+
+def default_directory() -> str:
+    if read_mounts().get(TMPFS) == "tmpfs":
+        return TMPFS
+    return tempfile.gettempdir()
+
+
+def _touch(path: str) -> None:
+    os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+
+
+def generate_tree(root: str, entries: int, fanout: int = 10, depth: int = 4) -> dict:
+    """
+    Create directories fanout wide and depth deep, breadth first, then spread
+    files over all of them until the tree holds entries entries.
+    """
+    os.makedirs(root)
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                if len(directories) > entries:
+                    break
+                path = os.path.join(parent, f"d{i}")
+                os.mkdir(path)
+                directories.append(path)
+                next_level.append(path)
+        level = next_level
+
+    files = max(0, entries - (len(directories) - 1))
+    for n in range(files):
+        _touch(os.path.join(directories[n % len(directories)], f"f{n}.txt"))
+
+    return {"directories": len(directories) - 1, "files": files}
+
+
+def mutate_tree(root: str, fraction: float, seed: int = 0) -> int:
+    """Delete and add fraction of the files, and add one directory per 1000."""
+    rng = random.Random(seed)
+    files, directories = [], []
+    for path, dirnames, filenames in os.walk(root):
+        directories.append(path)
+        files.extend(os.path.join(path, name) for name in filenames)
+
+    count = max(1, int(len(files) * fraction))
+    for path in rng.sample(files, min(count, len(files))):
+        os.remove(path)
+    for n in range(count):
+        _touch(os.path.join(rng.choice(directories), f"new{n}.txt"))
+    for n in range(max(1, count // 1000)):
+        os.mkdir(os.path.join(rng.choice(directories), f"newdir{n}"))
+
+    return 2 * count
+
+
+def run_benchmark(
+    entries: int,
+    directory: str,
+    fanout: int = 10,
+    depth: int = 4,
+    workers: int = 1,
+    compact: bool = False,
+    mutations: float = 0.01,
+    seed: int = 0,
+) -> dict:
+    base = tempfile.mkdtemp(prefix="ingestion-bench-", dir=directory)
+    root = os.path.join(base, "root")
+    graphml_file = os.path.join(base, "file_tree.graphml")
+    stages = {}
+
+    try:
+        shape = measure(stages, "generate", generate_tree, root, entries, fanout, depth)
+        with FileSystemTree("neo4j://localhost:7687", "neo4j", "") as fst:
+            scan = lambda: fst.map_file_system(root, workers, compact=compact)
+
+            file_tree = measure(stages, "map_file_system", scan)
+            if compact:
+                measure(stages, "write_graphml", file_tree.write_graphml, graphml_file)
+            else:
+                measure(
+                    stages, "write_graphml", nx.write_graphml, file_tree, graphml_file
+                )
+            merkle_tree = measure(
+                stages, "calculate_merkle_tree", fst._calculate_merkle_tree, file_tree
+            )
+
+            changed = mutate_tree(root, mutations, seed)
+            new_tree = measure(stages, "rescan", scan)
+            new_merkle_tree = measure(
+                stages,
+                "calculate_merkle_tree_after",
+                fst._calculate_merkle_tree,
+                new_tree,
+            )
+            differences = measure(
+                stages,
+                "find_differences",
+                fst._find_differences,
+                merkle_tree,
+                new_merkle_tree,
+            )
+            measure(
+                stages,
+                "update_graph_with_merkle_tree",
+                fst.update_graph_with_merkle_tree,
+                new_tree,
+                graphml_file,
+            )
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    return {
+        "entries": entries,
+        "shape": dict(shape, fanout=fanout, depth=depth),
+        "changed": changed,
+        "differences": len(differences),
+        "seconds": sum(
+            stage["seconds"] for name, stage in stages.items() if name != "generate"
+        ),
+        "stages": stages,
+    }
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float, min_seconds: float = 0.01
+) -> List[str]:
+    """
+    Stages at least threshold slower than in the baseline. Stages faster than
+    min_seconds in both runs are timer noise and skipped.
+    """
+    previous = {run["entries"]: run["stages"] for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        for name, stage in run["stages"].items():
+            before = previous.get(run["entries"], {}).get(name)
+            if name == "generate" or before is None:
+                continue
+            if max(before["seconds"], stage["seconds"]) < min_seconds:
+                continue
+            ratio = stage["seconds"] / max(before["seconds"], 1e-9)
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{run['entries']} entries, {name}: {before['seconds']:.3f}s -> "
+                    f"{stage['seconds']:.3f}s ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", default="10000", help="comma separated tree sizes")
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--compact", action="store_true", help="use CompactFileTree")
+    parser.add_argument(
+        "--mutations", type=float, default=0.01, help="fraction changed"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=None, help="where trees are generated")
+    parser.add_argument("--output", default=None, help="result file")
+    parser.add_argument("--compare", default=None, help="earlier result file")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--min-seconds", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    directory = args.dir or default_directory()
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": psutil.cpu_count(),
+            "filesystem": read_mounts().get(directory, "unknown"),
+        },
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "threshold", "min_seconds")
+        },
+        "runs": [],
+    }
+
+    for entries in (int(value) for value in args.entries.split(",")):
+        run = run_benchmark(
+            entries,
+            directory,
+            args.fanout,
+            args.depth,
+            args.workers,
+            args.compact,
+            args.mutations,
+            args.seed,
+        )
+        results["runs"].append(run)
+        print(f"{entries} entries: {run['seconds']:.3f}s")
+        for name, stage in run["stages"].items():
+            print(
+                f"  {name:32} {stage['seconds']:9.3f}s "
+                f"{stage['peak_rss'] / (1 << 20):9.1f} MiB peak"
+            )
+
+    output = args.output or f"ingestion-bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(
+                results, json.load(f), args.threshold, args.min_seconds
+            )
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import json
 import time
 from collections import deque
 from typing import Dict, List, Union
@@ -8,21 +9,155 @@ import platform
 from django.contrib import admin
 from django.urls import path
 from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from ..system.fstree import FileSystemTree
+from ..system.index import PathIndex
+
+MAX_PAGE_SIZE = 1000
+
+file_system = FileSystemTree(
+    os.environ.get("NEO4J_URL", "neo4j://localhost:7687"),
+    os.environ.get("NEO4J_USER", "neo4j"),
+    os.environ.get("NEO4J_PASSWORD", ""),
+)
+# each indexed scan swaps its results into this same object
+path_index = file_system.index = PathIndex()
 
 """
 POST configurations to:
 1. Update connected APIs
 2. Modify refresh interval
+3. Set the I/O budget of background scans (listings_per_second,
+   hash_bytes_per_second, cpu_share)
 """
 
 
+@csrf_exempt
 def configure(req: HttpRequest) -> HttpResponse:
+    if req.method == "GET":
+        return JsonResponse(file_system.configuration())
+
     if req.method == "POST":
-        configuration = req.POST.get("config")
+        configuration = req.POST.get("config") or req.body or "{}"
+        try:
+            config = json.loads(configuration)
+            if not isinstance(config, dict):
+                raise ValueError("config must be a JSON object")
+            return JsonResponse(file_system.configure(config))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse(
+        {"error": "Invalid request method. Use GET or POST."}, status=405
+    )
+
+
+def _query(req: HttpRequest, param: str, lookup) -> JsonResponse:
+    if req.method != "GET":
+        return JsonResponse({"error": "Invalid request method. Use GET."}, status=405)
+
+    value = req.GET.get(param)
+    if not value:
+        return JsonResponse({"error": f"Missing '{param}' parameter."}, status=400)
+
+    try:
+        offset = int(req.GET.get("offset", 0))
+        limit = int(req.GET.get("limit", 100))
+    except ValueError:
+        return JsonResponse({"error": "offset and limit must be integers."}, status=400)
+    if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        return JsonResponse(
+            {"error": f"offset must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}."},
+            status=400,
+        )
+
+    return JsonResponse(lookup(value, req.GET.get("path"), offset, limit))
+
+
+def files_prefix(req: HttpRequest) -> JsonResponse:
+    return _query(
+        req,
+        "path",
+        lambda value, _, offset, limit: path_index.prefix(value, offset, limit),
+    )
+
+
+def files_glob(req: HttpRequest) -> JsonResponse:
+    return _query(
+        req,
+        "pattern",
+        lambda value, _, offset, limit: path_index.glob(value, offset, limit),
+    )
+
+
+def files_name(req: HttpRequest) -> JsonResponse:
+    return _query(req, "name", path_index.name)
+
+
+def files_extension(req: HttpRequest) -> JsonResponse:
+    return _query(req, "ext", path_index.extension)
+
+
+def files_search(req: HttpRequest) -> JsonResponse:
+    return _query(req, "q", path_index.substring)
+
+
+@csrf_exempt
+def scans(req: HttpRequest) -> JsonResponse:
+    if req.method == "GET":
+        return JsonResponse(
+            {"jobs": [job.to_dict() for job in file_system.jobs.jobs()]}
+        )
+
+    if req.method == "POST":
+        root = req.POST.get("root", "/")
+        if not os.path.isabs(root) or not os.path.isdir(root):
+            return JsonResponse({"error": f"{root} is not a directory."}, status=400)
+        # a root that is already being scanned returns the running job
+        job = file_system.jobs.submit(os.path.normpath(root))
+        return JsonResponse(job.to_dict(), status=202)
+
+    return JsonResponse(
+        {"error": "Invalid request method. Use GET or POST."}, status=405
+    )
+
+
+def scan(req: HttpRequest, job_id: str) -> JsonResponse:
+    if req.method != "GET":
+        return JsonResponse({"error": "Invalid request method. Use GET."}, status=405)
+
+    job = file_system.jobs.get(job_id)
+    if job is None:
+        return JsonResponse({"error": f"Unknown job {job_id}."}, status=404)
+
+    response = job.to_dict()
+    last_good = file_system.jobs.last_good(job.root)
+    response["last_good"] = None if last_good is None else last_good.result
+    return JsonResponse(response)
+
+
+def state(req: HttpRequest) -> JsonResponse:
+    """The device state object sent to the model with each command."""
+    if req.method != "GET":
+        return JsonResponse({"error": "Invalid request method. Use GET."}, status=405)
+    # collected in the background from the first request on
+    file_system.state.start()
+    if req.GET.get("status"):
+        return JsonResponse(file_system.state.status())
+    return JsonResponse(file_system.state.state())
 
 
 def get_urls():
     return [
         path("admin/", admin.site.urls),
         path("api/v1/configure", configure, name="configure"),
+        path("api/v1/files/prefix", files_prefix, name="files-prefix"),
+        path("api/v1/files/glob", files_glob, name="files-glob"),
+        path("api/v1/files/name", files_name, name="files-name"),
+        path("api/v1/files/extension", files_extension, name="files-extension"),
+        path("api/v1/files/search", files_search, name="files-search"),
+        path("api/v1/scans", scans, name="scans"),
+        path("api/v1/scans/<str:job_id>", scan, name="scan"),
+        path("api/v1/state", state, name="state"),
     ]
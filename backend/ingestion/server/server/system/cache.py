@@ -0,0 +1,85 @@
+"""
+Directory listing cache for incremental scans.
+
+Each directory is stored with the (st_ino, st_mtime_ns, st_ctime_ns) it had
+when it was last listed. A directory's mtime changes whenever an entry is
+added, removed or renamed inside it, so when the key still matches the cached
+children can be reused without calling scandir again.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+Entry = Tuple[str, bool]
+StatKey = Tuple[int, int, int]
+
+
+def stat_key(path: str) -> Optional[StatKey]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_ctime_ns
+
+
+class DirectoryCache(object):
+    def __init__(self, directories: Optional[Dict[str, tuple]] = None):
+        # previous snapshot, read during a scan
+        self.directories = directories or {}
+        # listings seen by the scan in progress, becomes the snapshot on commit
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, cache_file: str) -> "DirectoryCache":
+        try:
+            with open(cache_file) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls()
+
+        directories = {
+            path: (tuple(key), [(name, is_dir) for name, is_dir in entries])
+            for path, (key, entries) in data.items()
+        }
+        return cls(directories)
+
+    def save(self, cache_file: str) -> None:
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.directories, f)
+        os.replace(tmp_file, cache_file)
+
+    def lookup(self, path: str, key: StatKey) -> Optional[List[Entry]]:
+        cached = self.directories.get(path)
+        if cached is None or tuple(cached[0]) != key:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return cached[1]
+
+    def store(self, path: str, key: StatKey, entries: List[Entry]) -> None:
+        self.current[path] = (key, entries)
+
+    def commit(self, root: str) -> None:
+        # directories under root that the last scan did not visit are dropped
+        prefix = root.rstrip(os.sep) + os.sep
+        directories = {
+            path: cached
+            for path, cached in self.directories.items()
+            if path != root and not path.startswith(prefix)
+        }
+        directories.update(self.current)
+        self.directories = directories
+        self.current = {}
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,548 @@
+"""
+Array-backed file tree for large scans.
+
+Nodes are integer indices. Each node stores an interned name id, a parent
+index, a type byte and the position of its children, which the crawl appends
+as one contiguous run per directory. Full paths are only built on demand.
+Children always come after their parent, so a reverse pass over the indices is
+a post-order traversal; the Merkle hashes are computed that way. The size,
+mtime and digest recorded by content hashing go to columns of their own, the
+digest as a kind byte and the raw sha256 like the Merkle hashes.
+
+The class implements the small part of the networkx.DiGraph read API used by
+the rest of the system, and converts to networkx when a mutable graph is
+needed.
+"""
+
+import os
+import hashlib
+from array import array
+from xml.sax.saxutils import escape, quoteattr
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import networkx as nx
+
+from .merkle import combine
+
+FILE = 0
+DIRECTORY = 1
+
+TYPES = ("file", "directory")
+
+GRAPHML_TYPES = {bool: "boolean", int: "long", float: "double"}
+
+# directories with more children than this get a name to index map on lookup
+CHILD_MAP_THRESHOLD = 32
+
+CONTENT_KEYS = ("size", "mtime", "digest")
+# kinds of digest; 0 in the kind byte is no content, 1 size and mtime only
+DIGEST_KINDS = ("sha256", "sha256-partial")
+DIGEST_SIZE = 33
+
+
+class _NodeView(object):
+    __slots__ = ("_tree",)
+
+    def __init__(self, tree: "CompactFileTree"):
+        self._tree = tree
+
+    def __iter__(self) -> Iterator[str]:
+        for index, path in self._tree.walk():
+            yield path
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    def __contains__(self, path: str) -> bool:
+        return self._tree.has_node(path)
+
+    def __getitem__(self, path: str) -> dict:
+        return self._tree.attributes(self._tree.index(path))
+
+
+class CompactFileTree(object):
+    __slots__ = (
+        "root",
+        "names",
+        "name_ids",
+        "name_index",
+        "parents",
+        "flags",
+        "first_child",
+        "child_count",
+        "extra",
+        "sizes",
+        "mtimes",
+        "digests",
+        "child_maps",
+    )
+
+    def __init__(self, root: str):
+        self.root = root
+        self.names = []
+        self.name_ids = {}
+        self.name_index = array("i")
+        self.parents = array("i")
+        self.flags = bytearray()
+        self.first_child = array("i")
+        self.child_count = array("i")
+        # attributes for nodes that do not match the default type/name record
+        self.extra = {}
+        # content columns, grown to the tree's size when a node first gets one
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self.digests = bytearray()
+        # name -> child index of large directories, built when first looked up
+        self.child_maps = {}
+
+        self._append(-1, "", DIRECTORY)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def _intern(self, name: str) -> int:
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.name_ids[name] = name_id
+        return name_id
+
+    def _append(self, parent: int, name: str, node_type: int) -> int:
+        index = len(self.parents)
+        self.name_index.append(self._intern(name))
+        self.parents.append(parent)
+        self.flags.append(node_type)
+        self.first_child.append(-1)
+        self.child_count.append(0)
+        return index
+
+    def add_children(self, parent: int, entries: List[Tuple[str, bool]]) -> int:
+        """
+        Append the listing of a directory as one contiguous run and return the
+        index of its first child.
+        """
+        first = len(self.parents)
+        self.first_child[parent] = first
+        self.child_count[parent] = len(entries)
+        self.child_maps.pop(parent, None)
+        for name, is_dir in entries:
+            self._append(parent, name, DIRECTORY if is_dir else FILE)
+        return first
+
+    @classmethod
+    def from_listings(cls, path: str, listings) -> "CompactFileTree":
+        tree = cls(path)
+        # only the crawl frontier is keyed by path
+        pending = {path: 0}
+        for current_path, entries in listings:
+            index = tree.add_children(pending.pop(current_path), entries)
+            for offset, (name, is_dir) in enumerate(entries):
+                if is_dir:
+                    pending[os.path.join(current_path, name)] = index + offset
+        return tree
+
+    @classmethod
+    def from_networkx(cls, graph: nx.DiGraph) -> "CompactFileTree":
+        roots = [node for node, degree in graph.in_degree() if degree == 0]
+        if len(roots) != 1:
+            raise ValueError("file tree must have exactly one root")
+
+        tree = cls(roots[0])
+        queue = [(roots[0], 0)]
+        while queue:
+            next_queue = []
+            for path, index in queue:
+                tree.set_attributes(index, graph.nodes[path])
+                children = sorted(graph.successors(path))
+                entries = [
+                    (
+                        os.path.basename(child),
+                        graph.nodes[child].get("type") == "directory",
+                    )
+                    for child in children
+                ]
+                if entries:
+                    first = tree.add_children(index, entries)
+                    next_queue.extend(
+                        (child, first + offset) for offset, child in enumerate(children)
+                    )
+            queue = next_queue
+
+        return tree
+
+    def graft(self, index: int, subtree: "CompactFileTree") -> int:
+        """
+        Append the descendants of subtree's root below the leaf at index, in
+        their order. Subtree node i > 0 becomes node i + offset; returns offset.
+        """
+        offset = len(self) - 1
+        name_ids = [self._intern(name) for name in subtree.names]
+        self.name_index.extend(name_ids[name_id] for name_id in subtree.name_index[1:])
+        self.parents.extend(
+            index if parent == 0 else parent + offset for parent in subtree.parents[1:]
+        )
+        self.flags += subtree.flags[1:]
+        self.first_child.extend(
+            first + offset if first >= 0 else -1 for first in subtree.first_child[1:]
+        )
+        self.child_count.extend(subtree.child_count[1:])
+
+        if subtree.first_child[0] >= 0:
+            self.first_child[index] = subtree.first_child[0] + offset
+            self.child_count[index] = subtree.child_count[0]
+            self.child_maps.pop(index, None)
+        for source, attributes in subtree.extra.items():
+            if source:
+                self.extra[source + offset] = dict(attributes)
+        if len(subtree.sizes) > 1:
+            self._grow_content()
+            end = offset + len(subtree.sizes)
+            self.sizes[offset + 1 : end] = array("q", subtree.sizes[1:])
+            self.mtimes[offset + 1 : end] = array("d", subtree.mtimes[1:])
+            self.digests[DIGEST_SIZE * (offset + 1) : DIGEST_SIZE * end] = (
+                subtree.digests[DIGEST_SIZE:]
+            )
+
+        return offset
+
+    def set_attributes(self, index: int, attributes: dict) -> None:
+        default = self._default_attributes(index)
+        content = self._encode_content(attributes, default)
+        if content is not None or index < len(self.sizes):
+            self._set_content(index, *(content or (0, 0.0, bytes(DIGEST_SIZE))))
+        if content is not None or attributes == default:
+            self.extra.pop(index, None)
+        else:
+            self.extra[index] = dict(attributes)
+
+    def _encode_content(self, attributes: dict, default: dict) -> Optional[tuple]:
+        """
+        The column values of a default record followed by size, mtime and
+        digest, None for attributes that have to be kept as they are.
+        """
+        keys = list(attributes)
+        content = keys[len(default) :]
+        if keys[: len(default)] != list(default) or content not in (
+            ["size", "mtime"],
+            list(CONTENT_KEYS),
+        ):
+            return None
+        if any(attributes[key] != value for key, value in default.items()):
+            return None
+
+        size, mtime = attributes["size"], attributes["mtime"]
+        if type(size) is not int or type(mtime) is not float:
+            return None
+        digest = bytearray(DIGEST_SIZE)
+        digest[0] = 1
+        if "digest" in attributes:
+            kind, _, value = str(attributes["digest"]).partition(":")
+            if kind not in DIGEST_KINDS or len(value) != 64:
+                return None
+            try:
+                digest[1:] = bytes.fromhex(value)
+            except ValueError:
+                return None
+            if digest[1:].hex() != value:
+                return None
+            digest[0] = 2 + DIGEST_KINDS.index(kind)
+        return size, mtime, bytes(digest)
+
+    def _grow_content(self) -> None:
+        missing = len(self) - len(self.sizes)
+        if missing > 0:
+            self.sizes.frombytes(bytes(8 * missing))
+            self.mtimes.frombytes(bytes(8 * missing))
+            self.digests += bytes(DIGEST_SIZE * missing)
+
+    def _set_content(self, index: int, size: int, mtime: float, digest: bytes) -> None:
+        self._grow_content()
+        self.sizes[index] = size
+        self.mtimes[index] = mtime
+        self.digests[DIGEST_SIZE * index : DIGEST_SIZE * index + DIGEST_SIZE] = digest
+
+    def content(self, index: int) -> Optional[dict]:
+        """The size, mtime and digest recorded for a node, None if there are none."""
+        if index >= len(self.sizes) or not self.digests[DIGEST_SIZE * index]:
+            return None
+        content = {"size": self.sizes[index], "mtime": self.mtimes[index]}
+        kind = self.digests[DIGEST_SIZE * index]
+        if kind > 1:
+            digest = self.digests[DIGEST_SIZE * index + 1 : DIGEST_SIZE * (index + 1)]
+            content["digest"] = f"{DIGEST_KINDS[kind - 2]}:{bytes(digest).hex()}"
+        return content
+
+    def name(self, index: int) -> str:
+        return self.names[self.name_index[index]]
+
+    def is_dir(self, index: int) -> bool:
+        return self.flags[index] == DIRECTORY
+
+    def children(self, index: int) -> range:
+        first = self.first_child[index]
+        if first < 0:
+            return range(0)
+        return range(first, first + self.child_count[index])
+
+    def _default_attributes(self, index: int) -> dict:
+        if index == 0:
+            return {"type": TYPES[self.flags[0]]}
+        return {"type": TYPES[self.flags[index]], "name": self.name(index)}
+
+    def attributes(self, index: int) -> dict:
+        extra = self.extra.get(index)
+        if extra is not None:
+            return dict(extra)
+        attributes = self._default_attributes(index)
+        content = self.content(index)
+        if content is not None:
+            attributes.update(content)
+        return attributes
+
+    def path(self, index: int) -> str:
+        names = []
+        while index > 0:
+            names.append(self.name(index))
+            index = self.parents[index]
+        return os.path.join(self.root, *reversed(names))
+
+    def index(self, path: str) -> int:
+        if path == self.root:
+            return 0
+
+        prefix = self.root if self.root.endswith(os.sep) else self.root + os.sep
+        if not path.startswith(prefix):
+            raise KeyError(path)
+
+        index = 0
+        for segment in path[len(prefix) :].split(os.sep):
+            child = self.child(index, segment)
+            if child < 0:
+                raise KeyError(path)
+            index = child
+
+        return index
+
+    def child(self, index: int, name: str) -> int:
+        """The index of the child called name, -1 if there is none."""
+        if self.child_count[index] <= CHILD_MAP_THRESHOLD:
+            for child in self.children(index):
+                if self.name(child) == name:
+                    return child
+            return -1
+
+        child_map = self.child_maps.get(index)
+        if child_map is None:
+            child_map = self.child_maps[index] = {
+                self.name(child): child for child in self.children(index)
+            }
+        return child_map.get(name, -1)
+
+    def walk(
+        self, index: int = 0, path: Optional[str] = None
+    ) -> Iterator[Tuple[int, str]]:
+        for current, current_path, _ in self.walk_with_parents(index, path):
+            yield current, current_path
+
+    def walk_with_parents(
+        self, index: int = 0, path: Optional[str] = None
+    ) -> Iterator[tuple]:
+        """
+        Depth-first (index, path, parent path) over a subtree, building each
+        path from its parent's.
+        """
+        stack = [(index, self.path(index) if path is None else path, None)]
+        while stack:
+            current, current_path, parent_path = stack.pop()
+            yield current, current_path, parent_path
+            for child in reversed(self.children(current)):
+                stack.append(
+                    (child, os.path.join(current_path, self.name(child)), current_path)
+                )
+
+    # networkx.DiGraph compatible read API
+
+    @property
+    def nodes(self) -> _NodeView:
+        return _NodeView(self)
+
+    def number_of_nodes(self) -> int:
+        return len(self)
+
+    def has_node(self, path: str) -> bool:
+        try:
+            self.index(path)
+        except KeyError:
+            return False
+        return True
+
+    def successors(self, path: str) -> Iterator[str]:
+        for child in self.children(self.index(path)):
+            yield os.path.join(path, self.name(child))
+
+    def predecessors(self, path: str) -> Iterator[str]:
+        parent = self.parents[self.index(path)]
+        if parent >= 0:
+            yield self.path(parent)
+
+    def in_degree(self) -> Iterator[Tuple[str, int]]:
+        for index, path in self.walk():
+            yield path, 0 if index == 0 else 1
+
+    def to_networkx(self) -> nx.DiGraph:
+        graph = nx.DiGraph()
+        for index, path, parent_path in self.walk_with_parents():
+            graph.add_node(path, **self.attributes(index))
+            if parent_path is not None:
+                graph.add_edge(parent_path, path)
+        return graph
+
+    def write_graphml(self, graphml_file: str) -> None:
+        """
+        Stream the tree as GraphML without building a networkx graph. The
+        output can be read back with nx.read_graphml.
+        """
+        keys = {"type": ("d0", "string"), "name": ("d1", "string")}
+        for attributes in self.extra.values():
+            for key, value in attributes.items():
+                if key not in keys:
+                    keys[key] = (
+                        f"d{len(keys)}",
+                        GRAPHML_TYPES.get(type(value), "string"),
+                    )
+        kinds = set(self.digests[::DIGEST_SIZE])
+        for key, key_type, kind in (
+            ("size", "long", 1),
+            ("mtime", "double", 1),
+            ("digest", "string", 2),
+        ):
+            if key not in keys and any(k >= kind for k in kinds):
+                keys[key] = (f"d{len(keys)}", key_type)
+
+        with open(graphml_file, "w", encoding="utf-8") as f:
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            f.write(
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+                'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+                'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+            )
+            for key, (key_id, key_type) in keys.items():
+                f.write(
+                    f'  <key id="{key_id}" for="node" attr.name={quoteattr(key)} '
+                    f'attr.type="{key_type}" />\n'
+                )
+            f.write('  <graph edgedefault="directed">\n')
+
+            for index, path, parent_path in self.walk_with_parents():
+                f.write(f"    <node id={quoteattr(path)}>\n")
+                for key, value in self.attributes(index).items():
+                    f.write(
+                        f'      <data key="{keys[key][0]}">{escape(str(value))}</data>\n'
+                    )
+                f.write("    </node>\n")
+                if parent_path is not None:
+                    f.write(
+                        f"    <edge source={quoteattr(parent_path)} "
+                        f"target={quoteattr(path)} />\n"
+                    )
+
+            f.write("  </graph>\n</graphml>\n")
+
+    # Merkle tree
+
+    def merkle_tree(self) -> "CompactMerkleTree":
+        size = len(self)
+        node_hashes = bytearray(32 * size)
+        hashes = bytearray(32 * size)
+
+        for index in range(size - 1, -1, -1):
+            self.hash_node(index, hashes, node_hashes)
+
+        return CompactMerkleTree(self, hashes, node_hashes)
+
+    def hash_node(self, index: int, hashes: bytearray, node_hashes: bytearray) -> None:
+        """Hash one node; the subtree hashes of its children must be set."""
+        node_hash = hashlib.sha256(repr(self.attributes(index)).encode()).digest()
+        node_hashes[32 * index : 32 * index + 32] = node_hash
+
+        children = self.children(index)
+        if children:
+            ordered = sorted(children, key=self.name)
+            node_hash = bytes.fromhex(
+                combine(
+                    node_hash.hex(),
+                    (
+                        (self.name(child), hashes[32 * child : 32 * child + 32].hex())
+                        for child in ordered
+                    ),
+                )
+            )
+        hashes[32 * index : 32 * index + 32] = node_hash
+
+
+class CompactMerkleTree(object):
+    """
+    Subtree and node hashes for a CompactFileTree, stored as packed sha256
+    digests indexed like the tree.
+    """
+
+    __slots__ = ("tree", "hashes", "node_hashes")
+
+    def __init__(
+        self, tree: CompactFileTree, hashes: bytearray, node_hashes: bytearray
+    ):
+        self.tree = tree
+        self.hashes = hashes
+        self.node_hashes = node_hashes
+
+    def subtree_hash(self, index: int) -> bytes:
+        return bytes(self.hashes[32 * index : 32 * index + 32])
+
+    def node_hash(self, index: int) -> bytes:
+        return bytes(self.node_hashes[32 * index : 32 * index + 32])
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def __getitem__(self, path: str) -> str:
+        return self.subtree_hash(self.tree.index(path)).hex()
+
+    def differences(self, new_tree: "CompactMerkleTree") -> Dict[str, Optional[str]]:
+        differences = {}
+        original, new = self.tree, new_tree.tree
+
+        if original.root != new.root:
+            for index, path in original.walk():
+                differences[path] = None
+            for index, path in new.walk():
+                differences[path] = new_tree.subtree_hash(index).hex()
+            return differences
+
+        stack = [(0, 0, original.root)]
+        while stack:
+            i, j, path = stack.pop()
+            if self.subtree_hash(i) == new_tree.subtree_hash(j):
+                continue
+
+            if self.node_hash(i) != new_tree.node_hash(j):
+                differences[path] = new_tree.subtree_hash(j).hex()
+
+            original_children = {original.name(c): c for c in original.children(i)}
+            new_children = {new.name(c): c for c in new.children(j)}
+
+            for name, child in original_children.items():
+                child_path = os.path.join(path, name)
+                if name in new_children:
+                    stack.append((child, new_children[name], child_path))
+                else:
+                    for _, removed in original.walk(child, child_path):
+                        differences[removed] = None
+
+            for name, child in new_children.items():
+                if name not in original_children:
+                    for added, added_path in new.walk(child, os.path.join(path, name)):
+                        differences[added_path] = new_tree.subtree_hash(added).hex()
+
+        return differences
@@ -0,0 +1,232 @@
+"""
+Content hashing for file nodes.
+
+Each file gets its size, mtime and a sha256 digest of its contents recorded as
+node attributes, so the Merkle diff notices edits that keep the directory
+structure intact. Digests are cached by (st_ino, st_size, st_mtime_ns), which
+lets a refresh skip every file that was not written since the last scan.
+
+Files above the partial threshold are sampled instead of read in full: the
+digest covers the size and a block from the start, middle and end of the
+file. Together with the mtime in the cache key that catches real edits without
+rereading large files on every refresh.
+"""
+
+import os
+import json
+import stat
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .compact import CompactFileTree
+from .throttle import ScanBudget
+
+FileKey = Tuple[int, int, int]
+
+FULL = "sha256"
+PARTIAL = "sha256-partial"
+
+
+def file_key(st: os.stat_result) -> FileKey:
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def hash_contents(
+    path: str,
+    chunk_size: int = 1 << 20,
+    throttle: Optional[Callable[[int], None]] = None,
+) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        # one reusable buffer, hashlib releases the GIL on large updates
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            if throttle is not None:
+                throttle(read)
+    return f"{FULL}:{digest.hexdigest()}"
+
+
+def hash_sample(
+    path: str,
+    size: int,
+    block_size: int = 1 << 20,
+    throttle: Optional[Callable[[int], None]] = None,
+) -> str:
+    digest = hashlib.sha256(str(size).encode())
+    middle = max(0, size // 2 - block_size // 2)
+    with open(path, "rb") as f:
+        for offset in (0, middle, max(0, size - block_size)):
+            f.seek(offset)
+            block = f.read(block_size)
+            digest.update(block)
+            if throttle is not None:
+                throttle(len(block))
+    return f"{PARTIAL}:{digest.hexdigest()}"
+
+
+class HashCache(object):
+    def __init__(self, files: Optional[Dict[str, tuple]] = None):
+        # previous snapshot, read during a scan
+        self.files = files or {}
+        # digests seen by the scan in progress, becomes the snapshot on commit
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, cache_file: str) -> "HashCache":
+        try:
+            with open(cache_file) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls()
+        return cls({path: (tuple(key), digest) for path, (key, digest) in data.items()})
+
+    def save(self, cache_file: str) -> None:
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.files, f)
+        os.replace(tmp_file, cache_file)
+
+    def lookup(self, path: str, key: FileKey, mode: str) -> Optional[str]:
+        cached = self.files.get(path)
+        # a digest taken in the other mode does not compare, hash again
+        if (
+            cached is None
+            or tuple(cached[0]) != key
+            or not cached[1].startswith(mode + ":")
+        ):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return cached[1]
+
+    def store(self, path: str, key: FileKey, digest: str) -> None:
+        self.current[path] = (key, digest)
+
+    def commit(self, root: str) -> None:
+        # files under root that the last scan did not hash are dropped
+        prefix = root.rstrip(os.sep) + os.sep
+        files = {
+            path: cached
+            for path, cached in self.files.items()
+            if path != root and not path.startswith(prefix)
+        }
+        files.update(self.current)
+        self.files = files
+        self.current = {}
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+class ContentHasher(object):
+    def __init__(
+        self,
+        cache: Optional[HashCache] = None,
+        workers: int = 4,
+        chunk_size: int = 1 << 20,
+        partial_threshold: int = 0,
+        budget: Optional[ScanBudget] = None,
+    ):
+        self.cache = cache
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # files larger than this are sampled, 0 always reads the whole file
+        self.partial_threshold = partial_threshold
+        self.throttle = None if budget is None else budget.acquire_bytes
+
+    def hash_file(self, path: str) -> Optional[dict]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        attributes = {"size": st.st_size, "mtime": st.st_mtime}
+        if not stat.S_ISREG(st.st_mode):
+            # sockets, fifos and devices have no contents worth reading
+            return attributes
+
+        partial = 0 < self.partial_threshold < st.st_size
+        mode = PARTIAL if partial else FULL
+        key = file_key(st)
+
+        digest = None
+        if self.cache is not None:
+            digest = self.cache.lookup(path, key, mode)
+
+        if digest is None:
+            try:
+                if partial:
+                    digest = hash_sample(
+                        path, st.st_size, self.chunk_size, self.throttle
+                    )
+                else:
+                    digest = hash_contents(path, self.chunk_size, self.throttle)
+            except OSError:
+                return attributes
+
+        if self.cache is not None:
+            self.cache.store(path, key, digest)
+        attributes["digest"] = digest
+        return attributes
+
+    def hash_files(self, paths: List[str]) -> Iterator[Tuple[str, Optional[dict]]]:
+        if self.workers <= 1:
+            for path in paths:
+                yield path, self.hash_file(path)
+            return
+
+        # a few files per worker in flight, not a future for every file
+        window = 4 * self.workers
+        pending = deque()
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="hash"
+        ) as pool:
+            for path in paths:
+                if len(pending) >= window:
+                    done, future = pending.popleft()
+                    yield done, future.result()
+                pending.append((path, pool.submit(self.hash_file, path)))
+            while pending:
+                done, future = pending.popleft()
+                yield done, future.result()
+
+    def hash_tree(self, file_tree) -> int:
+        """Record content attributes on every file node, returning the count."""
+        if isinstance(file_tree, CompactFileTree):
+            files = [
+                (index, path)
+                for index, path in file_tree.walk()
+                if not file_tree.is_dir(index)
+            ]
+            paths = [path for _, path in files]
+            for (index, _), (_, content) in zip(files, self.hash_files(paths)):
+                if content is not None:
+                    attributes = file_tree.attributes(index)
+                    attributes.update(content)
+                    file_tree.set_attributes(index, attributes)
+        else:
+            paths = [
+                path
+                for path, node_type in file_tree.nodes(data="type")
+                if node_type == "file"
+            ]
+            for path, content in self.hash_files(paths):
+                if content is not None:
+                    file_tree.nodes[path].update(content)
+
+        return len(paths)
@@ -0,0 +1,181 @@
+"""
+Directory crawling for FileSystemTree.
+
+The crawl yields one (directory, entries) listing per visited directory, where
+entries is a list of (name, is_dir) pairs. With a single worker the directories
+are visited breadth-first like the original scan; with more workers a thread
+pool pulls directories off a shared frontier so scandir latency overlaps.
+Given a DirectoryCache, directories whose inode and timestamps are unchanged
+since the previous scan reuse their cached children instead of being listed.
+Compiled Rules filter each listing and decide which directories are descended
+into; by default pseudo, volatile and network mounts below the root are pruned.
+With a ScanBudget, every scandir call first takes a token from its listing rate.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .cache import DirectoryCache, stat_key
+from .jobs import ScanProgress
+from .rules import Rules, ScanRules
+from .throttle import ScanBudget
+
+Entry = Tuple[str, bool]
+Listing = Tuple[str, List[Entry]]
+
+
+def list_directory(path: str) -> List[Entry]:
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file():
+                    entries.append((entry.name, False))
+                elif entry.is_dir():
+                    entries.append((entry.name, True))
+    except (PermissionError, FileNotFoundError):
+        pass
+
+    return entries
+
+
+def list_directory_cached(
+    path: str, cache: DirectoryCache, list_entries: Callable = list_directory
+) -> List[Entry]:
+    key = stat_key(path)
+    if key is None:
+        return list_entries(path)
+
+    entries = cache.lookup(path, key)
+    if entries is None:
+        entries = list_entries(path)
+    cache.store(path, key, entries)
+
+    return entries
+
+
+def throttled(budget: ScanBudget) -> Callable[[str], List[Entry]]:
+    def list_entries(path: str) -> List[Entry]:
+        budget.acquire_listing()
+        return list_directory(path)
+
+    return list_entries
+
+
+def lister(
+    cache: Optional[DirectoryCache] = None,
+    rules: Optional[Rules] = None,
+    budget: Optional[ScanBudget] = None,
+) -> Callable[[str], List[Entry]]:
+    list_uncached = list_directory if budget is None else throttled(budget)
+    if cache is None:
+        list_entries = list_uncached
+    else:
+        # cache hits cost a stat, only the listings that miss are budgeted
+        list_entries = lambda path: list_directory_cached(path, cache, list_uncached)
+
+    if rules is None or not rules.patterns:
+        return list_entries
+    # the cache keeps full listings, so changing the rules needs no invalidation
+    return lambda path: rules.filter(path, list_entries(path))
+
+
+def subdirectories(path: str, entries: List[Entry]) -> Iterator[str]:
+    for name, is_dir in entries:
+        if is_dir:
+            yield os.path.join(path, name)
+
+
+def crawl(
+    path: str = "/",
+    workers: int = 1,
+    cache: Optional[DirectoryCache] = None,
+    rules: Optional[Rules] = None,
+    progress: Optional[ScanProgress] = None,
+    budget: Optional[ScanBudget] = None,
+) -> Iterator[Listing]:
+    if rules is None:
+        rules = ScanRules().compile(path)
+    if progress is None:
+        progress = ScanProgress()
+
+    list_entries = lister(cache, rules, budget)
+    if workers <= 1:
+        listings = _crawl_serial(path, list_entries, rules, progress)
+    else:
+        listings = _crawl_parallel(path, workers, list_entries, rules, progress)
+
+    remaining = rules.max_entries
+    for current_path, entries in listings:
+        exhausted = bool(remaining) and len(entries) >= remaining
+        if exhausted:
+            entries = entries[:remaining]
+        elif remaining:
+            remaining -= len(entries)
+
+        progress.update(len(entries))
+        yield current_path, entries
+
+        if exhausted:
+            # out of budget, closing the generator stops the crawl
+            listings.close()
+            return
+
+
+def _crawl_serial(
+    path: str, list_entries: Callable, rules: Rules, progress: ScanProgress
+) -> Iterator[Listing]:
+    queue = deque()
+    queue.append(path)
+
+    while queue:
+        current_path = queue.popleft()
+        entries = list_entries(current_path)
+        progress.queue_depth = len(queue)
+        yield current_path, entries
+        queue.extend(
+            subdir
+            for subdir in subdirectories(current_path, entries)
+            if rules.descend(subdir)
+        )
+
+
+def _crawl_parallel(
+    path: str,
+    workers: int,
+    list_entries: Callable,
+    rules: Rules,
+    progress: ScanProgress,
+) -> Iterator[Listing]:
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawler")
+    pending = {}
+    frontier = deque([path])
+    # listings finish ahead of a slow consumer only up to this many, the rest
+    # of the frontier waits as paths
+    max_pending = 4 * workers
+
+    def fill() -> None:
+        while frontier and len(pending) < max_pending:
+            directory = frontier.popleft()
+            pending[pool.submit(list_entries, directory)] = directory
+
+    try:
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                current_path = pending.pop(future)
+                entries = future.result()
+                frontier.extend(
+                    subdir
+                    for subdir in subdirectories(current_path, entries)
+                    if rules.descend(subdir)
+                )
+                fill()
+                progress.queue_depth = len(pending) + len(frontier)
+                yield current_path, entries
+    finally:
+        # the consumer may stop early, so drop whatever is still queued
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -1,14 +1,44 @@
 import os
 import time
 import hashlib
-from collections import deque
-from typing import Dict, List, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import psutil
 import platform
 from django.apps import AppConfig
 from neo4j import GraphDatabase
 import networkx as nx
 
+from .cache import DirectoryCache
+from .compact import CompactFileTree, CompactMerkleTree
+from .content import ContentHasher, HashCache
+from .index import PathIndex
+from .jobs import JobRunner, ScanProgress
+from .crawler import crawl
+from .merkle import apply_differences, calculate_merkle_tree, find_differences
+from .rules import DEFAULT_EXCLUDED_FS_TYPES, ScanRules, load_patterns
+from .shard import ShardedScan
+from .sink import GraphSink, Neo4jSink, ingest
+from .stream import (
+    Batch,
+    SinkWriter,
+    TreeBuilder,
+    fan_out,
+    hash_batches,
+    prefetch,
+    scan_batches,
+)
+from .state import RecentFiles, StateCollector, default_fields
+from .snapshot import SnapshotFileTree, is_snapshot, load_snapshot, write_snapshot
+from .sync import changes_from_differences, sync_changes
+from .throttle import ScanBudget
+from .watcher import FileSystemWatcher
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
 
 class FileSystemTree(AppConfig):
     def __init__(self, uri, user, password):
@@ -16,6 +46,55 @@ class FileSystemTree(AppConfig):
         self.user = user
         self.password = password
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.workers = int(os.environ.get("CRAWL_WORKERS", 1))
+        self.cache_file = os.environ.get("SCAN_CACHE", "scan_cache.json")
+        self.cache = None
+        # worker processes for sharded refreshes, 0 scans in this process
+        self.shard_processes = int(os.environ.get("SHARD_PROCESSES", 0))
+        self.sharded_scans = {}
+        self.rules = ScanRules(
+            load_patterns(os.environ.get("SCAN_IGNORE_FILE"))
+            + split_list(os.environ.get("SCAN_EXCLUDE")),
+            split_list(os.environ.get("EXCLUDE_FS_TYPES")) or DEFAULT_EXCLUDED_FS_TYPES,
+            same_device=os.environ.get("SAME_DEVICE", "0") == "1",
+            max_depth=int(os.environ.get("MAX_DEPTH", 0)),
+            max_entries=int(os.environ.get("MAX_ENTRIES", 0)),
+        )
+        if self.shard_processes and self.rules.max_entries:
+            raise ValueError(
+                "MAX_ENTRIES bounds a whole scan and cannot be combined with "
+                "SHARD_PROCESSES, set one of them to 0"
+            )
+        self.index = None
+        self.hash_contents = os.environ.get("HASH_CONTENTS", "0") == "1"
+        self.hash_workers = int(os.environ.get("HASH_WORKERS", 4))
+        self.hash_cache_file = os.environ.get("HASH_CACHE", "hash_cache.json")
+        self.hash_cache = None
+        # files above this many bytes get a sampled digest, 0 hashes everything
+        self.partial_hash_threshold = int(os.environ.get("PARTIAL_HASH_THRESHOLD", 0))
+        self.snapshot_file = os.environ.get("SNAPSHOT_FILE", "file_tree.snapshot")
+        # what the graph store holds, kept apart from the scan snapshot
+        self.sync_snapshot_file = os.environ.get(
+            "SYNC_SNAPSHOT_FILE", "graph_store.snapshot"
+        )
+        # refreshes push what changed since the last sync to the graph store
+        self.sync_graph = os.environ.get("SYNC_GRAPH_STORE", "0") == "1"
+        self.interval = float(os.environ.get("INTERVAL_SECONDS", 60))
+        self.batch_size = int(os.environ.get("INGEST_BATCH_SIZE", 10000))
+        self.sessions = int(os.environ.get("INGEST_SESSIONS", 4))
+        self.jobs = JobRunner(self.refresh)
+        # background refreshes share the host with latency-sensitive services
+        self.budget = ScanBudget(
+            float(os.environ.get("SCAN_LISTINGS_PER_SECOND", 2000)),
+            float(os.environ.get("SCAN_HASH_BYTES_PER_SECOND", 32 << 20)),
+            float(os.environ.get("SCAN_CPU_SHARE", 0.25)),
+        )
+        # the "state" object of the prompt, refreshed in the background
+        self.recent_files = RecentFiles(int(os.environ.get("STATE_FILES", 100)))
+        self.state = StateCollector(default_fields(self.recent_files))
+        # refreshed roots are kept current by a watcher until the next refresh
+        self.watch_changes = os.environ.get("WATCH_CHANGES", "1") == "1"
+        self.watchers = {}
 
     def __enter__(self):
         return self
@@ -24,10 +103,98 @@ class FileSystemTree(AppConfig):
         self.close()
 
     def ready(self):
-        file_tree = self.map_file_system("/")
-        nx.write_graphml(file_tree, "file_tree.graphml")
+        # scanning can take minutes, startup only queues it
+        self.jobs.submit("/")
+        self.state.start()
+
+    def refresh(self, path: str = "/", progress: Optional[ScanProgress] = None) -> str:
+        """
+        Scan path and replace its snapshot, returning the snapshot file. The
+        snapshot is swapped in atomically, so readers keep getting the last
+        complete one while the scan runs. What changed since the previous
+        snapshot is applied to the index and the recent files.
+        """
+        merkle_tree = None
+        if self.shard_processes:
+            file_tree, merkle_tree = self.map_file_system_sharded(
+                path, index=path == "/", progress=progress, throttle=True
+            )
+            if self.hash_contents:
+                self.hash_file_contents(file_tree, path, self.budget)
+                merkle_tree = None
+        else:
+            file_tree = self.map_file_system(
+                path,
+                incremental=True,
+                compact=True,
+                index=path == "/",
+                progress=progress,
+                throttle=True,
+            )
+        # the new scan supersedes whatever the previous watcher applied
+        watcher = self.watchers.pop(path, None)
+        if watcher is not None:
+            watcher.stop()
+
+        snapshot_file = self.snapshot_path(path)
+        if is_snapshot(snapshot_file):
+            differences = self.diff_snapshot(file_tree, snapshot_file)
+        else:
+            differences = {node: "" for node in file_tree.nodes}
+        changes = changes_from_differences(differences, file_tree)
+        # a scan of / rebuilt the index, others only touched their subtree
+        if self.index is not None and path != "/":
+            self.index.apply(changes)
+        self.recent_files.apply(changes)
+        self.save_snapshot(file_tree, snapshot_file, merkle_tree)
+        if self.sync_graph:
+            self.sync_graph_store(
+                file_tree,
+                snapshot_file=self.snapshot_path(path, self.sync_snapshot_file),
+            )
+        if self.watch_changes:
+            self.watchers[path] = self.watch_snapshot(file_tree, path, snapshot_file)
+        return snapshot_file
+
+    def watch_snapshot(
+        self,
+        file_tree: Union[nx.DiGraph, CompactFileTree],
+        path: str,
+        snapshot_file: str,
+    ) -> FileSystemWatcher:
+        """
+        Keep snapshot_file current with changes to path, starting from the
+        scanned file_tree, until the returned watcher is stopped.
+        """
+        if isinstance(file_tree, CompactFileTree):
+            file_tree = file_tree.to_networkx()
+        return self.watch(
+            file_tree,
+            path,
+            on_change=lambda changes: self.save_snapshot(file_tree, snapshot_file),
+        )
+
+    def snapshot_path(
+        self, path: str = "/", snapshot_file: Optional[str] = None
+    ) -> str:
+        snapshot_file = snapshot_file or self.snapshot_file
+        if path == "/":
+            return snapshot_file
+        base, ext = os.path.splitext(snapshot_file)
+        digest = hashlib.sha1(path.encode("utf-8", "surrogateescape")).hexdigest()
+        return f"{base}-{digest[:12]}{ext}"
+
+    def latest_snapshot(self, path: str = "/") -> Optional[SnapshotFileTree]:
+        snapshot_file = self.snapshot_path(path)
+        if not is_snapshot(snapshot_file):
+            return None
+        return load_snapshot(snapshot_file)
 
     def close(self):
+        for watcher in self.watchers.values():
+            watcher.stop()
+        self.watchers = {}
+        self.state.stop()
         self.driver.close()
 
     def print_greeting(self, message):
@@ -45,6 +212,78 @@ class FileSystemTree(AppConfig):
         )
         return result.single()[0]
 
+    def graph_sink(self) -> GraphSink:
+        return Neo4jSink(self.driver, sessions=self.sessions)
+
+    def _with_sink(self, sink: Optional[GraphSink], write):
+        if sink is None:
+            with self.graph_sink() as sink:
+                sink.setup()
+                return write(sink)
+        return write(sink)
+
+    def ingest(
+        self,
+        file_tree: Union[nx.DiGraph, CompactFileTree],
+        sink: Optional[GraphSink] = None,
+        batch_size: Optional[int] = None,
+    ) -> Tuple[int, int]:
+        return self._with_sink(
+            sink, lambda sink: ingest(file_tree, sink, batch_size or self.batch_size)
+        )
+
+    def sync_graph_store(
+        self,
+        file_tree: Union[nx.DiGraph, CompactFileTree],
+        sink: Optional[GraphSink] = None,
+        snapshot_file: Optional[str] = None,
+    ) -> int:
+        """
+        Write only what changed since the last sync to the graph store, then
+        record this tree as the synced snapshot. Returns the change sequence.
+        """
+        snapshot_file = snapshot_file or self.sync_snapshot_file
+        if is_snapshot(snapshot_file):
+            differences = self.diff_snapshot(file_tree, snapshot_file)
+        else:
+            differences = {path: "" for path in file_tree.nodes}
+
+        changes = changes_from_differences(differences, file_tree)
+        seq = self._with_sink(
+            sink, lambda sink: sync_changes(changes, file_tree, sink, self.batch_size)
+        )
+        self.save_snapshot(file_tree, snapshot_file)
+        return seq
+
+    def configuration(self) -> Dict[str, Union[float, int]]:
+        return {"interval": self.interval, **self.budget.to_dict()}
+
+    def configure(self, config: Dict[str, float]) -> Dict[str, Union[float, int]]:
+        current = self.configuration()
+        # the adaptive factor is reported, not set
+        del current["factor"]
+        unknown = set(config) - set(current)
+        if unknown:
+            raise ValueError(f"unknown settings: {', '.join(sorted(unknown))}")
+
+        current.update(config)
+        try:
+            values = {key: float(value) for key, value in current.items()}
+        except (TypeError, ValueError):
+            raise ValueError("settings must be numbers")
+        if any(value < 0 for value in values.values()):
+            raise ValueError("settings must not be negative")
+        if not 0 < values["cpu_share"] <= 1:
+            raise ValueError("cpu_share must be in (0, 1]")
+
+        self.interval = values["interval"]
+        self.budget.configure(
+            values["listings_per_second"],
+            values["hash_bytes_per_second"],
+            values["cpu_share"],
+        )
+        return self.configuration()
+
     def get_system_info(self) -> Dict[str, Union[str, int, float]]:
         system_info = {
             "platform": platform.system(),
@@ -59,89 +298,318 @@ class FileSystemTree(AppConfig):
         }
         return system_info
 
-    def map_file_system(self, path: str = "/") -> nx.DiGraph:
-        file_tree = nx.DiGraph()
-        file_tree.add_node(path, type="directory")
-
-        queue = deque()
-        queue.append(path)
-
-        while queue:
-            current_path = queue.popleft()
-
-            if "/dev" in current_path or "/proc" in current_path:
-                continue
-
-            try:
-                with os.scandir(current_path) as entries:
-                    for entry in entries:
-                        if entry.is_file():
-                            file_tree.add_node(
-                                os.path.join(current_path, entry.name),
-                                type="file",
-                                name=entry.name,
-                            )
-                            file_tree.add_edge(
-                                current_path, os.path.join(current_path, entry.name)
-                            )
-                        elif entry.is_dir():
-                            subdir = os.path.join(current_path, entry.name)
-                            file_tree.add_node(
-                                subdir, type="directory", name=entry.name
-                            )
-                            file_tree.add_edge(current_path, subdir)
-                            queue.append(subdir)
-
-            except (PermissionError, FileNotFoundError):
-                pass
+    def map_file_system(
+        self,
+        path: str = "/",
+        workers: Optional[int] = None,
+        incremental: bool = False,
+        compact: bool = False,
+        index: bool = False,
+        hash_contents: Optional[bool] = None,
+        rules: Optional[ScanRules] = None,
+        progress: Optional[ScanProgress] = None,
+        throttle: bool = False,
+        cache: Optional[DirectoryCache] = None,
+    ) -> Union[nx.DiGraph, CompactFileTree]:
+        """
+        Scan path into a tree. Incremental scans reuse the listings in the
+        cache file, or in cache when one is given; that one is kept in memory
+        only.
+        """
+        if workers is None:
+            workers = self.workers
+        if hash_contents is None:
+            hash_contents = self.hash_contents
+
+        cache_file = None
+        if cache is None and incremental:
+            if self.cache is None:
+                self.cache = DirectoryCache.load(self.cache_file)
+            cache = self.cache
+            cache_file = self.cache_file
+        if cache is not None:
+            cache.reset_stats()
+
+        budget = self.budget if throttle else None
+        listings = crawl(
+            path, workers, cache, (rules or self.rules).compile(path), progress, budget
+        )
+        if index:
+            path_index = PathIndex()
+            listings = path_index.index_listings(path, listings)
+
+        if compact:
+            file_tree = CompactFileTree.from_listings(path, listings)
+        else:
+            file_tree = nx.DiGraph()
+            file_tree.add_node(path, type="directory")
+
+            for current_path, entries in listings:
+                for name, is_dir in entries:
+                    child = os.path.join(current_path, name)
+                    file_tree.add_node(
+                        child, type="directory" if is_dir else "file", name=name
+                    )
+                    file_tree.add_edge(current_path, child)
+
+        if cache is not None:
+            cache.commit(path)
+            if cache_file is not None:
+                cache.save(cache_file)
+
+        if index:
+            # swapped in place once complete, so views holding the index keep
+            # answering from the previous scan until then
+            if self.index is None:
+                self.index = path_index
+            else:
+                self.index.replace(path_index)
+
+        if hash_contents:
+            self.hash_file_contents(file_tree, path, budget)
 
         return file_tree
 
+    def map_file_system_sharded(
+        self,
+        path: str = "/",
+        processes: Optional[int] = None,
+        index: bool = False,
+        rules: Optional[ScanRules] = None,
+        progress: Optional[ScanProgress] = None,
+        throttle: bool = False,
+    ) -> Tuple[CompactFileTree, CompactMerkleTree]:
+        """
+        Scan path with one worker process per top-level directory and mount
+        point. Shards that have not changed since the last sharded scan of
+        path are reused. A throttled scan shares the listing budget between
+        the workers. Rules with max_entries are refused.
+        """
+        rules = rules or self.rules
+        scan = self.sharded_scans.get(path)
+        if scan is None or scan.rules is not rules:
+            scan = self.sharded_scans[path] = ShardedScan(path, rules)
+        scan.processes = processes or self.shard_processes or os.cpu_count() or 1
+
+        file_tree, merkle_tree = scan.run(progress, self.budget if throttle else None)
+
+        if index:
+            path_index = PathIndex.build(file_tree)
+            if self.index is None:
+                self.index = path_index
+            else:
+                self.index.replace(path_index)
+
+        return file_tree, merkle_tree
+
+    def hash_file_contents(
+        self,
+        file_tree: Union[nx.DiGraph, CompactFileTree],
+        path: str = "/",
+        budget: Optional[ScanBudget] = None,
+    ) -> int:
+        if self.hash_cache is None:
+            self.hash_cache = HashCache.load(self.hash_cache_file)
+        self.hash_cache.reset_stats()
+
+        hasher = ContentHasher(
+            self.hash_cache,
+            self.hash_workers,
+            partial_threshold=self.partial_hash_threshold,
+            budget=budget,
+        )
+        hashed = hasher.hash_tree(file_tree)
+
+        self.hash_cache.commit(path)
+        self.hash_cache.save(self.hash_cache_file)
+        return hashed
+
+    def stream_file_system(
+        self,
+        path: str = "/",
+        batch_size: int = 1000,
+        workers: Optional[int] = None,
+        incremental: bool = False,
+        hash_contents: Optional[bool] = None,
+        rules: Optional[ScanRules] = None,
+        progress: Optional[ScanProgress] = None,
+        throttle: bool = False,
+    ) -> Iterator[Batch]:
+        """
+        Like map_file_system, but yields batches of entry records while the
+        crawl runs instead of returning a tree at the end.
+        """
+        if workers is None:
+            workers = self.workers
+        if hash_contents is None:
+            hash_contents = self.hash_contents
+
+        cache = None
+        if incremental:
+            if self.cache is None:
+                self.cache = DirectoryCache.load(self.cache_file)
+            cache = self.cache
+            cache.reset_stats()
+
+        budget = self.budget if throttle else None
+        listings = crawl(
+            path, workers, cache, (rules or self.rules).compile(path), progress, budget
+        )
+        batches = scan_batches(path, listings, batch_size)
+
+        if hash_contents:
+            if self.hash_cache is None:
+                self.hash_cache = HashCache.load(self.hash_cache_file)
+            self.hash_cache.reset_stats()
+            hasher = ContentHasher(
+                self.hash_cache,
+                self.hash_workers,
+                partial_threshold=self.partial_hash_threshold,
+                budget=budget,
+            )
+            # hash one batch while the crawl produces the next
+            batches = hash_batches(prefetch(batches), hasher)
+
+        yield from batches
+
+        # caches only advance once the whole tree has been seen
+        if cache is not None:
+            cache.commit(path)
+            cache.save(self.cache_file)
+        if hash_contents:
+            self.hash_cache.commit(path)
+            self.hash_cache.save(self.hash_cache_file)
+
+    def ingest_stream(
+        self,
+        path: str = "/",
+        sink: Optional[GraphSink] = None,
+        index: bool = False,
+        snapshot_file: Optional[str] = None,
+        **options,
+    ) -> CompactFileTree:
+        """
+        Scan path and feed the records to the graph store, the path index and
+        a compact tree as they are produced, then write the snapshot.
+        """
+        builder = TreeBuilder(path)
+        path_index = PathIndex() if index else None
+
+        def run(sink: GraphSink) -> None:
+            consumers = [builder, SinkWriter(sink, self.batch_size)]
+            if path_index is not None:
+                consumers.append(path_index.add_records)
+            fan_out(prefetch(self.stream_file_system(path, **options)), consumers)
+
+        self._with_sink(sink, run)
+
+        if path_index is not None:
+            if self.index is None:
+                self.index = path_index
+            else:
+                self.index.replace(path_index)
+        if snapshot_file is not None:
+            self.save_snapshot(builder.tree, snapshot_file)
+        return builder.tree
+
+    def watch(
+        self,
+        file_tree: nx.DiGraph,
+        path: str = "/",
+        on_change=None,
+        sink: Optional[GraphSink] = None,
+    ) -> FileSystemWatcher:
+        def apply_changes(changes):
+            if self.index is not None:
+                self.index.apply(changes)
+            self.recent_files.apply(changes)
+            if sink is not None:
+                sync_changes(changes, file_tree, sink, self.batch_size)
+            if on_change is not None:
+                on_change(changes)
+
+        # fallback rescans keep their own listings and skip content hashing,
+        # so they neither race nor invalidate the refresh scans' caches
+        cache = DirectoryCache()
+        watcher = FileSystemWatcher(
+            file_tree,
+            path,
+            scan=lambda root: self.map_file_system(
+                root, hash_contents=False, throttle=True, cache=cache
+            ),
+            on_change=apply_changes,
+            rescan_interval=self.interval,
+            rules=self.rules.compile(path),
+        )
+        watcher.start()
+        return watcher
+
+    def save_snapshot(
+        self,
+        file_tree: Union[nx.DiGraph, CompactFileTree],
+        snapshot_file: Optional[str] = None,
+        merkle_tree: Optional[CompactMerkleTree] = None,
+    ) -> None:
+        if not isinstance(file_tree, CompactFileTree):
+            file_tree = CompactFileTree.from_networkx(file_tree)
+        write_snapshot(file_tree, snapshot_file or self.snapshot_file, merkle_tree)
+
+    def diff_snapshot(
+        self,
+        file_tree: Union[nx.DiGraph, CompactFileTree],
+        snapshot_file: Optional[str] = None,
+    ) -> dict:
+        if not isinstance(file_tree, CompactFileTree):
+            file_tree = CompactFileTree.from_networkx(file_tree)
+        # the stored hashes are read lazily, only changed subtrees are touched
+        with load_snapshot(snapshot_file or self.snapshot_file) as snapshot:
+            return self._diff_trees(snapshot, file_tree)
+
     def update_graph_with_merkle_tree(
-        self, file_tree: nx.DiGraph, graphml_file: str
+        self, file_tree: Union[nx.DiGraph, CompactFileTree], graphml_file: str
     ) -> nx.DiGraph:
-        # load the graph from the graphml file
-        G = nx.read_graphml(graphml_file)
+        compact = isinstance(file_tree, CompactFileTree)
 
-        # calculate the Merkle Trees for the original and new file trees
-        original_merkle_tree = self._calculate_merkle_tree(G)
-        new_merkle_tree = self._calculate_merkle_tree(file_tree)
-
-        # find the differences between the two trees
-        differences = self._find_differences(original_merkle_tree, new_merkle_tree)
+        if is_snapshot(graphml_file):
+            # binary snapshots carry their Merkle hashes, reuse them when possible
+            with load_snapshot(graphml_file) as snapshot:
+                G = snapshot.to_networkx()
+                differences = self._diff_trees(snapshot if compact else G, file_tree)
+        else:
+            # load the graph from the graphml file
+            G = nx.read_graphml(graphml_file)
+            original = CompactFileTree.from_networkx(G) if compact else G
+            differences = self._diff_trees(original, file_tree)
 
         # apply the differences to the original graph
-        for node, attributes in differences.items():
-            if attributes is None:
-                G.remove_node(node)
-            else:
-                G.add_node(node, **attributes)
+        apply_differences(G, file_tree, differences)
+        changes = changes_from_differences(differences, file_tree)
+        if self.index is not None:
+            self.index.apply(changes)
+        self.recent_files.apply(changes)
 
         return G
 
-    def _calculate_merkle_tree(self, file_tree: nx.DiGraph) -> dict:
-        merkle_tree = {}
-        for node in sorted(file_tree.nodes):
-            hash_value = hashlib.sha256(
-                repr(file_tree.nodes[node]).encode()
-            ).hexdigest()
-            merkle_tree[node] = hash_value
-
-        return merkle_tree
-
-    def _find_differences(self, original_tree: dict, new_tree: dict) -> dict:
-        differences = {}
-        
-        # find nodes in new_tree that are not in original_tree
-        for node, hash_value in new_tree.items():
-            if node not in original_tree:
-                differences[node] = new_tree[node]
-            elif original_tree[node] != hash_value:
-                differences[node] = new_tree[node]
-
-        # find nodes in original_tree that are not in new_tree
-        for node, hash_value in original_tree.items():
-            if node not in new_tree:
-                differences[node] = None
-
-        return differences
+    def _diff_trees(self, original_tree, new_tree) -> dict:
+        # calculate the Merkle Trees for the original and new file trees
+        original_merkle_tree = self._calculate_merkle_tree(original_tree)
+        new_merkle_tree = self._calculate_merkle_tree(new_tree)
+
+        # find the differences between the two trees
+        return self._find_differences(original_merkle_tree, new_merkle_tree)
+
+    def _calculate_merkle_tree(
+        self, file_tree: Union[nx.DiGraph, CompactFileTree]
+    ) -> Union[dict, CompactMerkleTree]:
+        if isinstance(file_tree, CompactFileTree):
+            return file_tree.merkle_tree()
+        return calculate_merkle_tree(file_tree)
+
+    def _find_differences(
+        self,
+        original_tree: Union[dict, CompactMerkleTree],
+        new_tree: Union[dict, CompactMerkleTree],
+    ) -> dict:
+        if isinstance(original_tree, CompactMerkleTree):
+            return original_tree.differences(new_tree)
+        return find_differences(original_tree, new_tree)
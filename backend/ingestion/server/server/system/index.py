@@ -0,0 +1,487 @@
+"""
+In-memory lookup index over a scanned file tree.
+
+Paths live in a segment trie whose nodes carry subtree entry counts, so prefix
+queries can page through a subtree without walking what they skip. Inverted
+indexes map names and file extensions to sorted posting lists, where the paths
+below a directory are one range found by bisecting, so a page is a slice of
+it. A trigram index over the distinct names answers substring queries without
+scanning every name; the posting lists of the names found are merged.
+
+A glob whose only wildcard is a final "*.ext" segment is a range of the
+extension's posting list. Other globs have to match every path below their
+literal prefix, their sorted matches are kept until the index changes so the
+following pages are slices.
+"""
+
+import os
+import re
+import heapq
+import fnmatch
+import threading
+from bisect import bisect_left
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .compact import CompactFileTree
+
+GLOB_CHARS = re.compile(r"[*?\[]")
+
+# globs whose matches are kept for paging
+GLOB_CACHE_SIZE = 16
+
+
+class _TrieNode(object):
+    __slots__ = ("children", "entry", "is_dir", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.entry = False
+        self.is_dir = False
+        # entries below this node, not counting the node itself
+        self.count = 0
+
+
+class _Postings(object):
+    """
+    Sorted paths in chunks of at most 2 * LOAD, so an insert or removal only
+    moves the paths of one chunk.
+    """
+
+    __slots__ = ("chunks", "maxes", "size")
+
+    LOAD = 512
+
+    def __init__(self):
+        self.chunks = []
+        # the last path of every chunk
+        self.maxes = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, path: str) -> None:
+        if not self.chunks:
+            self.chunks.append([path])
+            self.maxes.append(path)
+            self.size = 1
+            return
+
+        i = min(bisect_left(self.maxes, path), len(self.chunks) - 1)
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, path)
+        if j < len(chunk) and chunk[j] == path:
+            return
+        chunk.insert(j, path)
+        self.maxes[i] = chunk[-1]
+        self.size += 1
+        if len(chunk) > 2 * self.LOAD:
+            self.chunks[i : i + 1] = [chunk[: self.LOAD], chunk[self.LOAD :]]
+            self.maxes[i : i + 1] = [chunk[self.LOAD - 1], chunk[-1]]
+
+    def discard(self, path: str) -> None:
+        i = bisect_left(self.maxes, path)
+        if i == len(self.chunks):
+            return
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, path)
+        if j == len(chunk) or chunk[j] != path:
+            return
+        del chunk[j]
+        self.size -= 1
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def bisect(self, path: str) -> int:
+        """The position of the first path not before path."""
+        i = bisect_left(self.maxes, path)
+        if i == len(self.chunks):
+            return self.size
+        return sum(map(len, self.chunks[:i])) + bisect_left(self.chunks[i], path)
+
+    def under(self, path: Optional[str]) -> Tuple[int, int]:
+        """The range of the paths below path, all of them for no path or /."""
+        if not path or path == "/":
+            return 0, self.size
+        prefix = path.rstrip("/")
+        # "0" follows "/", so the range ends after the last path below prefix
+        return self.bisect(prefix + "/"), self.bisect(prefix + "0")
+
+    def range(self, start: int, stop: int) -> Iterator[str]:
+        # position of the first path of the chunk
+        i = 0
+        for chunk in self.chunks:
+            if i >= stop:
+                return
+            if start < i + len(chunk):
+                yield from chunk[max(0, start - i) : stop - i]
+            i += len(chunk)
+
+
+def split(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+def join(segments: List[str]) -> str:
+    return "/" + "/".join(segments)
+
+
+def suffix(name: str) -> str:
+    return os.path.splitext(name)[1].lstrip(".")
+
+
+def extension(name: str) -> str:
+    return suffix(name).lower()
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class Page(dict):
+    def __init__(self, results: List[str], offset: int, limit: int, total: int):
+        next_offset = offset + len(results)
+        super().__init__(
+            results=results,
+            offset=offset,
+            limit=limit,
+            total=total,
+            next=next_offset if next_offset < total else None,
+        )
+
+
+class PathIndex(object):
+    def __init__(self):
+        self.root = _TrieNode()
+        self.names = {}
+        # keyed by the extension as written, a glob for *.py does not match A.PY
+        self.extensions = {}
+        # lower case extension -> the ways it is written
+        self.extension_cases = {}
+        self.trigrams = {}
+        self.globs = {}
+        self.lock = threading.RLock()
+
+    def replace(self, other: "PathIndex") -> None:
+        """Take over the contents of other, e.g. an index built by a new scan."""
+        with self.lock:
+            self.root = other.root
+            self.names = other.names
+            self.extensions = other.extensions
+            self.extension_cases = other.extension_cases
+            self.trigrams = other.trigrams
+            self.globs = {}
+
+    def __len__(self) -> int:
+        return self.root.count + (1 if self.root.entry else 0)
+
+    @classmethod
+    def build(cls, file_tree) -> "PathIndex":
+        index = cls()
+        if isinstance(file_tree, CompactFileTree):
+            for i, path in file_tree.walk():
+                index.add(path, file_tree.is_dir(i))
+        else:
+            for path, attributes in file_tree.nodes(data=True):
+                index.add(path, attributes.get("type") == "directory")
+        return index
+
+    def index_listings(self, path: str, listings: Iterable) -> Iterator:
+        """
+        Pass crawl listings through while indexing them, so the index is built
+        in the same pass as the tree.
+        """
+        self.add(path, True)
+        for current_path, entries in listings:
+            for name, is_dir in entries:
+                self.add(os.path.join(current_path, name), is_dir)
+            yield current_path, entries
+
+    def add_records(self, records: Iterable[dict]) -> None:
+        """Index a batch of streamed entry records."""
+        for record in records:
+            self.add(record["path"], record["properties"]["type"] == "directory")
+
+    def _find(self, segments: List[str]) -> Optional[_TrieNode]:
+        node = self.root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def add(self, path: str, is_dir: bool = False) -> None:
+        segments = split(path)
+        path = join(segments)
+        with self.lock:
+            node = self.root
+            ancestors = []
+            for segment in segments:
+                ancestors.append(node)
+                node = node.children.setdefault(segment, _TrieNode())
+
+            if node.entry:
+                return
+            self.globs.clear()
+            node.entry = True
+            node.is_dir = is_dir
+            for ancestor in ancestors:
+                ancestor.count += 1
+
+            name = segments[-1] if segments else "/"
+            self._add_name(name, path)
+            if not is_dir:
+                self._add_extension(suffix(name), path)
+
+    def _add_name(self, name: str, path: str) -> None:
+        paths = self.names.get(name)
+        if paths is None:
+            paths = self.names[name] = _Postings()
+            for trigram in trigrams(name.lower()):
+                self.trigrams.setdefault(trigram, set()).add(name)
+        paths.add(path)
+
+    def _add_extension(self, ext: str, path: str) -> None:
+        paths = self.extensions.get(ext)
+        if paths is None:
+            paths = self.extensions[ext] = _Postings()
+            self.extension_cases.setdefault(ext.lower(), set()).add(ext)
+        paths.add(path)
+
+    def _remove_extension(self, ext: str, path: str) -> None:
+        paths = self.extensions.get(ext)
+        if paths is None:
+            return
+        paths.discard(path)
+        if not paths:
+            del self.extensions[ext]
+            cases = self.extension_cases[ext.lower()]
+            cases.discard(ext)
+            if not cases:
+                del self.extension_cases[ext.lower()]
+
+    def _remove_name(self, name: str, path: str) -> None:
+        paths = self.names.get(name)
+        if paths is None:
+            return
+        paths.discard(path)
+        if not paths:
+            del self.names[name]
+            for trigram in trigrams(name.lower()):
+                names = self.trigrams.get(trigram)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self.trigrams[trigram]
+
+    def remove(self, path: str) -> int:
+        """Remove path and everything below it, returning the entries removed."""
+        segments = split(path)
+        with self.lock:
+            ancestors = []
+            node = self.root
+            for segment in segments:
+                ancestors.append(node)
+                node = node.children.get(segment)
+                if node is None:
+                    return 0
+
+            self.globs.clear()
+            removed = 0
+            for entry_path, entry in self._entries(node, segments):
+                removed += 1
+                name = split(entry_path)[-1] if entry_path != "/" else "/"
+                self._remove_name(name, entry_path)
+                if not entry.is_dir:
+                    self._remove_extension(suffix(name), entry_path)
+
+            for ancestor in ancestors:
+                ancestor.count -= removed
+
+            if not segments:
+                self.root = _TrieNode()
+                return removed
+
+            del ancestors[-1].children[segments[-1]]
+            # drop intermediate nodes that no longer lead to any entry
+            for depth in range(len(segments) - 1, 0, -1):
+                parent = ancestors[depth]
+                if parent.entry or parent.children:
+                    break
+                del ancestors[depth - 1].children[segments[depth - 1]]
+
+            return removed
+
+    def apply(self, changes: Dict[str, Optional[dict]]) -> None:
+        """Apply a change set ({path: attributes or None}) from a diff or watcher."""
+        with self.lock:
+            for path in sorted(changes, reverse=True):
+                if changes[path] is None:
+                    self.remove(path)
+            for path in sorted(changes):
+                attributes = changes[path]
+                if attributes is not None:
+                    node = self._find(split(path))
+                    is_dir = attributes.get("type") == "directory"
+                    if node is not None and node.entry and node.is_dir != is_dir:
+                        self.remove(path)
+                    self.add(path, is_dir)
+
+    def _entries(
+        self, node: _TrieNode, segments: List[str]
+    ) -> Iterator[Tuple[str, _TrieNode]]:
+        stack = [(node, segments)]
+        while stack:
+            current, current_segments = stack.pop()
+            if current.entry:
+                yield join(current_segments), current
+            for name in sorted(current.children, reverse=True):
+                stack.append((current.children[name], current_segments + [name]))
+
+    def _page(self, node: _TrieNode, segments: List[str], offset: int, limit: int):
+        """
+        Sorted entries of a subtree from offset. Subtrees that fall entirely
+        before offset are skipped by their counts instead of being walked.
+        """
+        results = []
+        stack = [(node, segments)]
+        while stack and len(results) < limit:
+            current, current_segments = stack.pop()
+            size = current.count + (1 if current.entry else 0)
+            if offset >= size:
+                offset -= size
+                continue
+
+            if current.entry:
+                if offset > 0:
+                    offset -= 1
+                else:
+                    results.append(join(current_segments))
+
+            for name in sorted(current.children, reverse=True):
+                stack.append((current.children[name], current_segments + [name]))
+
+        return results
+
+    def prefix(self, path: str, offset: int = 0, limit: int = 100) -> Page:
+        segments = split(path)
+        with self.lock:
+            node = self._find(segments)
+            if node is None:
+                return Page([], offset, limit, 0)
+            total = node.count + (1 if node.entry else 0)
+            return Page(self._page(node, segments, offset, limit), offset, limit, total)
+
+    def _paginate(
+        self, postings: List[_Postings], path: Optional[str], offset: int, limit: int
+    ) -> Page:
+        """A page of the paths below path in the union of sorted posting lists."""
+        ranges = [(paths, *paths.under(path)) for paths in postings]
+        ranges = [(paths, start, stop) for paths, start, stop in ranges if start < stop]
+        total = sum(stop - start for _, start, stop in ranges)
+        if len(ranges) == 1:
+            paths, start, stop = ranges[0]
+            results = list(
+                paths.range(start + offset, min(stop, start + offset + limit))
+            )
+        else:
+            merged = heapq.merge(
+                *(paths.range(start, stop) for paths, start, stop in ranges)
+            )
+            results = list(islice(merged, offset, offset + limit))
+        return Page(results, offset, limit, total)
+
+    def name(
+        self, name: str, path: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> Page:
+        with self.lock:
+            postings = [self.names[name]] if name in self.names else []
+            return self._paginate(postings, path, offset, limit)
+
+    def extension(
+        self, ext: str, path: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> Page:
+        with self.lock:
+            cases = self.extension_cases.get(ext.lower().lstrip("."), ())
+            postings = [self.extensions[case] for case in sorted(cases)]
+            return self._paginate(postings, path, offset, limit)
+
+    def _names_containing(self, text: str) -> Iterable[str]:
+        text = text.lower()
+        grams = trigrams(text)
+        if not grams:
+            return [name for name in self.names if text in name.lower()]
+
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.trigrams.get(g, ()))):
+            names = self.trigrams.get(gram)
+            if not names:
+                return []
+            candidates = set(names) if candidates is None else candidates & names
+            if not candidates:
+                return []
+        return [name for name in candidates if text in name.lower()]
+
+    def substring(
+        self, text: str, path: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> Page:
+        with self.lock:
+            postings = [self.names[name] for name in self._names_containing(text)]
+            return self._paginate(postings, path, offset, limit)
+
+    def glob(self, pattern: str, offset: int = 0, limit: int = 100) -> Page:
+        # everything before the first wildcard segment narrows the search
+        segments = split(pattern)
+        literal = []
+        for segment in segments:
+            if GLOB_CHARS.search(segment):
+                break
+            literal.append(segment)
+
+        with self.lock:
+            last = segments[-1] if segments else ""
+            ext = last[2:]
+            if (
+                pattern == join(segments)
+                and len(literal) == len(segments) - 1
+                and last.startswith("*.")
+                and ext
+                and not GLOB_CHARS.search(ext)
+                and "." not in ext
+            ):
+                # * also matches /, so every file below the prefix with the
+                # extension matches
+                postings = [self.extensions[ext]] if ext in self.extensions else []
+                return self._paginate(postings, join(literal), offset, limit)
+
+            matches = self.globs.get(pattern)
+            if matches is None:
+                matches = self._match(pattern, segments, literal)
+                if len(self.globs) >= GLOB_CACHE_SIZE:
+                    del self.globs[next(iter(self.globs))]
+                self.globs[pattern] = matches
+            return Page(matches[offset : offset + limit], offset, limit, len(matches))
+
+    def _match(
+        self, pattern: str, segments: List[str], literal: List[str]
+    ) -> List[str]:
+        """Sorted paths matching pattern."""
+        match = re.compile(fnmatch.translate(pattern)).match
+        last = segments[-1] if segments else ""
+        if last.startswith("*.") and not GLOB_CHARS.search(last[2:]):
+            # the posting lists are sorted already
+            cases = self.extension_cases.get(extension(last), ())
+            postings = [self.extensions[case] for case in sorted(cases)]
+            candidates = heapq.merge(
+                *(paths.range(*paths.under(join(literal))) for paths in postings)
+            )
+            return [path for path in candidates if match(path)]
+
+        node = self._find(literal)
+        if node is None:
+            return []
+        return sorted(path for path, _ in self._entries(node, literal) if match(path))
@@ -0,0 +1,153 @@
+"""
+Background scan jobs.
+
+A JobRunner runs scans on daemon threads, off the request path and outside
+app startup, with at most one scan in flight per root: submitting a root that
+is already being scanned returns the running job. Each job carries a
+ScanProgress the crawler updates as it goes, so the API can report how far a
+scan got while the previous snapshot keeps being served.
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class ScanProgress(object):
+    def __init__(self):
+        self.directories = 0
+        self.entries = 0
+        self.queue_depth = 0
+        self.started = None
+        self.finished = None
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+
+    def finish(self) -> None:
+        self.finished = time.monotonic()
+
+    def update(self, entries: int) -> None:
+        # only the thread consuming the crawl writes, readers tolerate staleness
+        self.directories += 1
+        self.entries += entries
+
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def to_dict(self) -> Dict[str, float]:
+        elapsed = self.elapsed()
+        return {
+            "directories": self.directories,
+            "entries": self.entries,
+            "queue_depth": self.queue_depth,
+            "elapsed": round(elapsed, 3),
+            "dirs_per_second": round(self.directories / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class Job(object):
+    def __init__(self, root: str):
+        self.id = uuid.uuid4().hex
+        self.root = root
+        self.state = QUEUED
+        self.progress = ScanProgress()
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "root": self.root,
+            "state": self.state,
+            "created": self.created,
+            "progress": self.progress.to_dict(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRunner(object):
+    def __init__(self, run: Callable[[str, ScanProgress], object], history: int = 50):
+        self.run = run
+        self.history = history
+        self.lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._last_good = {}
+
+    def submit(self, root: str) -> Job:
+        with self.lock:
+            job = self._active.get(root)
+            if job is not None:
+                return job
+
+            job = Job(root)
+            self._active[root] = job
+            self._jobs[job.id] = job
+            # finished jobs beyond the history limit are forgotten
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done():
+                    break
+                self._jobs.popitem(last=False)
+
+        thread = threading.Thread(
+            target=self._execute, args=(job,), name=f"scan-{job.id[:8]}", daemon=True
+        )
+        thread.start()
+        return job
+
+    def _execute(self, job: Job) -> None:
+        job.state = RUNNING
+        job.progress.start()
+        try:
+            job.result = self.run(job.root, job.progress)
+            job.state = SUCCEEDED
+        except Exception as e:
+            logger.exception("scan of %s failed", job.root)
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            job.progress.finish()
+            with self.lock:
+                if job.state == SUCCEEDED:
+                    self._last_good[job.root] = job
+                self._active.pop(job.root, None)
+            job._done.set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self.lock:
+            return list(self._jobs.values())
+
+    def active(self, root: str) -> Optional[Job]:
+        with self.lock:
+            return self._active.get(root)
+
+    def last_good(self, root: str) -> Optional[Job]:
+        with self.lock:
+            return self._last_good.get(root)
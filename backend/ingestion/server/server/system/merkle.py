@@ -0,0 +1,153 @@
+"""
+Hierarchical Merkle trees over a file tree.
+
+Each node's own hash covers its attributes. A directory's subtree hash also
+covers its sorted children's names and subtree hashes, so two trees with equal
+root hashes are identical and the diff can skip any subtree whose hash matches.
+"""
+
+import os
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class MerkleTree(dict):
+    """
+    Maps each node to its subtree hash. The child lists and the per-node
+    attribute hashes are kept alongside so the diff can walk down from the
+    roots.
+    """
+
+    def __init__(
+        self,
+        hashes: Dict[str, str],
+        node_hashes: Dict[str, str],
+        children: Dict[str, List[str]],
+        roots: List[str],
+    ):
+        super().__init__(hashes)
+        self.node_hashes = node_hashes
+        self.children = children
+        self.roots = roots
+
+    def subtree(self, node: str) -> Iterator[str]:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            yield current
+            stack.extend(self.children.get(current, ()))
+
+
+def hash_attributes(attributes: dict) -> str:
+    return hashlib.sha256(repr(attributes).encode()).hexdigest()
+
+
+def combine(node_hash: str, children: Iterable[Tuple[str, str]]) -> str:
+    # children are (name, subtree hash) pairs in sorted order
+    digest = hashlib.sha256(node_hash.encode())
+    for name, hash_value in children:
+        # names that are not valid UTF-8 come from os.scandir surrogate
+        # escaped; the length prefix keeps name and hash apart
+        encoded = name.encode("utf-8", "surrogateescape")
+        digest.update(len(encoded).to_bytes(4, "big"))
+        digest.update(encoded)
+        digest.update(hash_value.encode())
+    return digest.hexdigest()
+
+
+def calculate_merkle_tree(file_tree) -> MerkleTree:
+    node_hashes = {}
+    children = {}
+    for node in file_tree.nodes:
+        node_hashes[node] = hash_attributes(file_tree.nodes[node])
+        children[node] = sorted(file_tree.successors(node))
+
+    roots = sorted(node for node, degree in file_tree.in_degree() if degree == 0)
+
+    # iterative post-order so deep trees do not hit the recursion limit
+    hashes = {}
+    for root in roots:
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if node in hashes:
+                stack.pop()
+                continue
+
+            pending = [child for child in children[node] if child not in hashes]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            if children[node]:
+                hashes[node] = combine(
+                    node_hashes[node],
+                    (
+                        (os.path.basename(child), hashes[child])
+                        for child in children[node]
+                    ),
+                )
+            else:
+                hashes[node] = node_hashes[node]
+
+    return MerkleTree(hashes, node_hashes, children, roots)
+
+
+def find_differences(original_tree: dict, new_tree: dict) -> Dict[str, Optional[str]]:
+    if isinstance(original_tree, MerkleTree) and isinstance(new_tree, MerkleTree):
+        return _find_subtree_differences(original_tree, new_tree)
+
+    differences = {}
+
+    # find nodes in new_tree that are not in original_tree
+    for node, hash_value in new_tree.items():
+        if node not in original_tree:
+            differences[node] = new_tree[node]
+        elif original_tree[node] != hash_value:
+            differences[node] = new_tree[node]
+
+    # find nodes in original_tree that are not in new_tree
+    for node, hash_value in original_tree.items():
+        if node not in new_tree:
+            differences[node] = None
+
+    return differences
+
+
+def _find_subtree_differences(
+    original_tree: MerkleTree, new_tree: MerkleTree
+) -> Dict[str, Optional[str]]:
+    differences = {}
+    stack = sorted(set(original_tree.roots) | set(new_tree.roots))
+
+    while stack:
+        node = stack.pop()
+
+        if node not in original_tree:
+            for added in new_tree.subtree(node):
+                differences[added] = new_tree[added]
+        elif node not in new_tree:
+            for removed in original_tree.subtree(node):
+                differences[removed] = None
+        elif original_tree[node] != new_tree[node]:
+            if original_tree.node_hashes[node] != new_tree.node_hashes[node]:
+                differences[node] = new_tree[node]
+            stack.extend(
+                set(original_tree.children[node]) | set(new_tree.children[node])
+            )
+
+    return differences
+
+
+def apply_differences(graph, file_tree, differences: Dict[str, Optional[str]]) -> None:
+    for node, hash_value in differences.items():
+        if hash_value is None:
+            if graph.has_node(node):
+                graph.remove_node(node)
+        else:
+            if graph.has_node(node):
+                graph.nodes[node].clear()
+            graph.add_node(node, **file_tree.nodes[node])
+            for parent in file_tree.predecessors(node):
+                graph.add_edge(parent, node)
@@ -0,0 +1,312 @@
+"""
+Exclusion and pruning rules for the crawler.
+
+ScanRules holds the configuration and compiles its gitignore-style patterns
+once. compile(root) binds it to a scan root: the mount table is read and the
+mount points below the root whose filesystem type is excluded (proc, sysfs,
+tmpfs, network shares, ...) become a set lookup. The resulting Rules are
+immutable, so crawler threads evaluate them concurrently without locking.
+
+Patterns follow .gitignore: a pattern without a slash matches a name at any
+depth, one with a slash is anchored to the scan root, a trailing slash only
+matches directories, "**" spans directories and a leading "!" re-includes
+what an earlier pattern excluded. The last matching pattern wins.
+
+Symbolic links to directories stay in the tree but are not followed unless
+follow_symlinks is set.
+"""
+
+import os
+import re
+import stat
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+import psutil
+
+Entry = Tuple[str, bool]
+CompiledPattern = Tuple[Pattern, bool, bool]
+
+MOUNTINFO = "/proc/self/mountinfo"
+
+PSEUDO_FILESYSTEMS = frozenset(
+    {
+        "autofs",
+        "binfmt_misc",
+        "bpf",
+        "cgroup",
+        "cgroup2",
+        "configfs",
+        "debugfs",
+        "devpts",
+        "devtmpfs",
+        "efivarfs",
+        "fusectl",
+        "hugetlbfs",
+        "mqueue",
+        "nsfs",
+        "proc",
+        "pstore",
+        "rpc_pipefs",
+        "securityfs",
+        "selinuxfs",
+        "sysfs",
+        "tracefs",
+    }
+)
+VOLATILE_FILESYSTEMS = frozenset({"tmpfs", "ramfs"})
+NETWORK_FILESYSTEMS = frozenset(
+    {
+        "9p",
+        "afs",
+        "ceph",
+        "cifs",
+        "davfs",
+        "fuse.glusterfs",
+        "fuse.rclone",
+        "fuse.sshfs",
+        "glusterfs",
+        "lustre",
+        "nfs",
+        "nfs4",
+        "smb3",
+        "smbfs",
+        "sshfs",
+    }
+)
+DEFAULT_EXCLUDED_FS_TYPES = (
+    PSEUDO_FILESYSTEMS | VOLATILE_FILESYSTEMS | NETWORK_FILESYSTEMS
+)
+
+OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+def read_mounts(mountinfo: str = MOUNTINFO) -> Dict[str, str]:
+    """Mount point -> filesystem type, later mounts shadowing earlier ones."""
+    try:
+        with open(mountinfo) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        # no procfs, fall back to what the platform reports
+        return {
+            partition.mountpoint: partition.fstype
+            for partition in psutil.disk_partitions(all=True)
+        }
+
+    mounts = {}
+    for line in lines:
+        # id parent major:minor root mount-point options [optional...] - type source
+        fields = line.split()
+        try:
+            separator = fields.index("-", 6)
+        except ValueError:
+            continue
+        mount_point = OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), fields[4])
+        mounts[mount_point] = fields[separator + 1]
+    return mounts
+
+
+def load_patterns(ignore_file: Optional[str]) -> List[str]:
+    if not ignore_file:
+        return []
+    try:
+        with open(ignore_file) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def _translate(pattern: str) -> str:
+    i, n = 0, len(pattern)
+    regex = []
+    while i < n:
+        c = pattern[i]
+        segment_start = i == 0 or pattern[i - 1] == "/"
+        if pattern.startswith("**/", i) and segment_start:
+            regex.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i) and segment_start and i + 2 == n:
+            regex.append(".*")
+            i += 2
+            continue
+
+        if c == "*":
+            regex.append("[^/]*")
+        elif c == "?":
+            regex.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                regex.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end].replace("\\", "\\\\")
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                regex.append(f"[{body}]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(c))
+        i += 1
+
+    return "".join(regex)
+
+
+def compile_pattern(pattern: str) -> Optional[CompiledPattern]:
+    pattern = pattern.rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\"):
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    prefix = "" if anchored else "(?:.*/)?"
+    # anything below a matching directory is excluded along with it
+    regex = re.compile(f"{prefix}{_translate(pattern)}(?P<below>/.*)?\\Z", re.S)
+    return regex, negate, dir_only
+
+
+class Rules(object):
+    def __init__(
+        self,
+        root: str,
+        patterns: List[CompiledPattern],
+        excluded_mounts: frozenset,
+        device: Optional[int] = None,
+        max_depth: int = 0,
+        max_entries: int = 0,
+        follow_symlinks: bool = False,
+    ):
+        self.root = root
+        self.prefix = root.rstrip(os.sep) + os.sep
+        self.patterns = patterns
+        self.excluded_mounts = excluded_mounts
+        self.device = device
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.follow_symlinks = follow_symlinks
+
+    def relative(self, path: str) -> str:
+        if path == self.root or not path.startswith(self.prefix):
+            return ""
+        return path[len(self.prefix) :]
+
+    def _match(self, relative: str, is_dir: bool) -> bool:
+        for regex, negate, dir_only in reversed(self.patterns):
+            match = regex.match(relative)
+            if match is None:
+                continue
+            if dir_only and not is_dir and match.group("below") is None:
+                continue
+            return not negate
+        return False
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        relative = self.relative(path)
+        return bool(relative) and self._match(relative, is_dir)
+
+    def filter(self, path: str, entries: List[Entry]) -> List[Entry]:
+        if not self.patterns:
+            return entries
+        relative = self.relative(path)
+        prefix = relative + "/" if relative else ""
+        return [
+            (name, is_dir)
+            for name, is_dir in entries
+            if not self._match(prefix + name, is_dir)
+        ]
+
+    def prune(self, paths: Iterable[str]) -> "Rules":
+        """A copy of these rules that also stops at paths."""
+        return Rules(
+            self.root,
+            self.patterns,
+            self.excluded_mounts | frozenset(paths),
+            self.device,
+            self.max_depth,
+            self.max_entries,
+            self.follow_symlinks,
+        )
+
+    def descend(self, path: str) -> bool:
+        if path == self.root:
+            return True
+        if path in self.excluded_mounts:
+            return False
+        if self.max_depth and self.relative(path).count("/") + 1 >= self.max_depth:
+            return False
+        if self.follow_symlinks and self.device is None:
+            return True
+
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return False
+        # scandir reports links to directories as directories, following them
+        # can loop forever
+        if not self.follow_symlinks and stat.S_ISLNK(st.st_mode):
+            return False
+        return self.device is None or st.st_dev == self.device
+
+
+class ScanRules(object):
+    def __init__(
+        self,
+        patterns: Iterable[str] = (),
+        excluded_fs_types: Iterable[str] = DEFAULT_EXCLUDED_FS_TYPES,
+        same_device: bool = False,
+        max_depth: int = 0,
+        max_entries: int = 0,
+        follow_symlinks: bool = False,
+        mountinfo: str = MOUNTINFO,
+    ):
+        self.patterns = [
+            compiled
+            for compiled in map(compile_pattern, patterns)
+            if compiled is not None
+        ]
+        self.excluded_fs_types = frozenset(excluded_fs_types)
+        self.same_device = same_device
+        # 0 leaves depth and entry count unbounded
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.follow_symlinks = follow_symlinks
+        self.mountinfo = mountinfo
+
+    def compile(self, root: str) -> Rules:
+        prefix = root.rstrip(os.sep) + os.sep
+        # the root was asked for explicitly, only mounts below it are pruned
+        excluded_mounts = frozenset(
+            mount_point
+            for mount_point, fs_type in read_mounts(self.mountinfo).items()
+            if fs_type in self.excluded_fs_types and mount_point.startswith(prefix)
+        )
+
+        device = None
+        if self.same_device:
+            try:
+                device = os.stat(root).st_dev
+            except OSError:
+                pass
+
+        return Rules(
+            root,
+            self.patterns,
+            excluded_mounts,
+            device,
+            self.max_depth,
+            self.max_entries,
+            self.follow_symlinks,
+        )
@@ -0,0 +1,290 @@
+"""
+Sharded scans.
+
+A scan is split into shards, one per top-level directory of the root and one
+per mount point further down, and every shard is crawled and built into a
+CompactFileTree in a worker process, so node construction, which holds the
+GIL, runs on all cores. A shard stops at the mount points that are shards of
+their own.
+
+Workers send back their tree, its Merkle hashes and a signature, a digest of
+the stat keys its directories had before they were listed. The parent lists
+the root itself, grafts each shard below its node and copies the shard's
+hashes, so the only nodes it hashes are the ones no shard covers: the root,
+top-level files and the directories above nested mount points. The merged
+tree and root hash are the ones a single-process scan produces.
+
+A shard whose directories still have the same stat keys on the next run is
+reused as it is, without a worker: a directory's mtime changes whenever an
+entry is added, removed or renamed in it, as for the DirectoryCache.
+
+A throttled scan splits the listing rate and CPU share of its ScanBudget
+evenly between the workers, each of which adapts its own part to host load.
+max_entries bounds a whole scan, which shards cannot honour, so sharded scans
+refuse rules that set it.
+"""
+
+import os
+import hashlib
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import DirectoryCache, stat_key
+from .compact import CompactFileTree, CompactMerkleTree
+from .crawler import Entry, crawl, lister
+from .jobs import ScanProgress
+from .rules import Rules, ScanRules, read_mounts
+from .throttle import ScanBudget
+
+# listings per second and CPU share of one worker
+Limits = Tuple[float, float]
+
+
+def _signature(keys: Iterable) -> str:
+    digest = hashlib.sha256()
+    for key in keys:
+        digest.update(repr(key).encode())
+    return digest.hexdigest()
+
+
+class Shard(object):
+    __slots__ = (
+        "path",
+        "stops",
+        "tree",
+        "hashes",
+        "node_hashes",
+        "listed",
+        "signature",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        stops: frozenset,
+        tree: CompactFileTree,
+        hashes: bytearray,
+        node_hashes: bytearray,
+        listed: array,
+        signature: str,
+    ):
+        self.path = path
+        # nested shards this one stopped at
+        self.stops = stops
+        self.tree = tree
+        self.hashes = hashes
+        self.node_hashes = node_hashes
+        # indices of the directories that were listed
+        self.listed = listed
+        self.signature = signature
+
+    @property
+    def root_hash(self) -> str:
+        return bytes(self.hashes[:32]).hex()
+
+    def changed(self) -> bool:
+        keys = (stat_key(self.tree.path(index)) for index in self.listed)
+        return _signature(keys) != self.signature
+
+
+def scan_shard(
+    path: str,
+    rules: Rules,
+    stops: frozenset = frozenset(),
+    limits: Optional[Limits] = None,
+) -> Shard:
+    """Crawl one shard and hash it. Runs in a worker process."""
+    budget = None
+    if limits is not None:
+        listings_per_second, cpu_share = limits
+        budget = ScanBudget(listings_per_second, cpu_share=cpu_share)
+    cache = DirectoryCache()
+    tree = CompactFileTree(path)
+    # the shard root is a named entry of its parent in the merged tree
+    tree.set_attributes(0, {"type": "directory", "name": os.path.basename(path)})
+
+    pending = {path: 0}
+    listed = array("i")
+    keys = []
+    for current_path, entries in crawl(
+        path, 1, cache, rules.prune(stops), budget=budget
+    ):
+        parent = pending.pop(current_path)
+        index = tree.add_children(parent, entries)
+        for offset, (name, is_dir) in enumerate(entries):
+            if is_dir:
+                pending[os.path.join(current_path, name)] = index + offset
+        listed.append(parent)
+        # taken before the listing, a change during the scan shows up next time
+        keys.append(cache.current.get(current_path, (None,))[0])
+
+    merkle_tree = tree.merkle_tree()
+    return Shard(
+        path,
+        stops,
+        tree,
+        merkle_tree.hashes,
+        merkle_tree.node_hashes,
+        listed,
+        _signature(keys),
+    )
+
+
+def merge_shards(
+    root: str, entries: List[Entry], shards: Iterable[Shard]
+) -> Tuple[CompactFileTree, CompactMerkleTree]:
+    tree = CompactFileTree(root)
+    tree.add_children(0, entries)
+
+    grafted = []
+    # outer shards first, nested mount points are leaves of them until grafted
+    for shard in sorted(shards, key=lambda shard: shard.path.count(os.sep)):
+        try:
+            index = tree.index(shard.path)
+        except KeyError:
+            continue
+        grafted.append((shard, index, tree.graft(index, shard.tree)))
+
+    size = len(tree)
+    hashes = bytearray(32 * size)
+    node_hashes = bytearray(32 * size)
+    covered = bytearray(size)
+    spine = set()
+    for shard, index, offset in grafted:
+        # the shard's nodes are one contiguous run after its root
+        start, end = 32 * (offset + 1), 32 * (offset + len(shard.tree))
+        hashes[start:end] = shard.hashes[32:]
+        node_hashes[start:end] = shard.node_hashes[32:]
+        hashes[32 * index : 32 * index + 32] = shard.hashes[:32]
+        node_hashes[32 * index : 32 * index + 32] = shard.node_hashes[:32]
+        covered[offset + 1 : offset + len(shard.tree)] = b"\x01" * (len(shard.tree) - 1)
+        covered[index] = 1
+        # directories above a shard have to be hashed again
+        parent = tree.parents[index]
+        while parent >= 0:
+            spine.add(parent)
+            parent = tree.parents[parent]
+
+    spine.update(index for index in range(size) if not covered[index])
+    # children come after their parents
+    for index in sorted(spine, reverse=True):
+        tree.hash_node(index, hashes, node_hashes)
+
+    return tree, CompactMerkleTree(tree, hashes, node_hashes)
+
+
+class ShardedScan(object):
+    """
+    Repeated sharded scans of one root. Shards from the previous run are kept
+    and reused while unchanged.
+    """
+
+    def __init__(self, root: str, rules: ScanRules, processes: Optional[int] = None):
+        if rules.max_entries:
+            raise ValueError(
+                "max_entries bounds a whole scan and cannot be split between "
+                "shards, use an unsharded scan"
+            )
+        self.root = root
+        self.rules = rules
+        self.processes = processes or os.cpu_count() or 1
+        self.shards: Dict[str, Shard] = {}
+        self.scanned = 0
+        self.reused = 0
+
+    def plan(self, rules: Rules, entries: List[Entry]) -> Dict[str, frozenset]:
+        """Map each shard path to the nested shards it stops at."""
+        paths = [
+            os.path.join(self.root, name)
+            for name, is_dir in entries
+            if is_dir and rules.descend(os.path.join(self.root, name))
+        ]
+        top_level = set(paths)
+
+        for mount_point in sorted(read_mounts(self.rules.mountinfo)):
+            relative = rules.relative(mount_point)
+            if "/" not in relative:
+                continue
+            if os.path.join(self.root, relative.split("/", 1)[0]) not in top_level:
+                continue
+            # every directory down to the mount point has to be crawled
+            path, reachable = mount_point, True
+            while path not in top_level and reachable:
+                reachable = rules.descend(path) and not rules.excluded(path, True)
+                path = os.path.dirname(path)
+            if reachable:
+                paths.append(mount_point)
+
+        return {
+            path: frozenset(
+                other
+                for other in paths
+                if other.startswith(path.rstrip(os.sep) + os.sep)
+            )
+            for path in paths
+        }
+
+    def run(
+        self,
+        progress: Optional[ScanProgress] = None,
+        budget: Optional[ScanBudget] = None,
+    ) -> Tuple[CompactFileTree, CompactMerkleTree]:
+        rules = self.rules.compile(self.root)
+        entries = lister(rules=rules, budget=budget)(self.root)
+        if progress is not None:
+            progress.update(len(entries))
+
+        shards = {}
+        pending = []
+        for path, stops in self.plan(rules, entries).items():
+            previous = self.shards.get(path)
+            if (
+                previous is not None
+                and previous.stops == stops
+                and not previous.changed()
+            ):
+                shards[path] = previous
+            else:
+                pending.append((path, stops))
+        self.reused = len(shards)
+        self.scanned = len(pending)
+
+        if pending:
+            workers = min(self.processes, len(pending))
+            limits = None
+            if budget is not None:
+                limits = (
+                    budget.listings_per_second * budget.factor / workers,
+                    budget.cpu_share / workers,
+                )
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=_context()
+            ) as pool:
+                results = pool.map(
+                    scan_shard,
+                    [path for path, _ in pending],
+                    [rules] * len(pending),
+                    [stops for _, stops in pending],
+                    [limits] * len(pending),
+                )
+                for shard in results:
+                    shards[shard.path] = shard
+                    if progress is not None:
+                        progress.directories += len(shard.listed)
+                        progress.entries += len(shard.tree) - 1
+
+        self.shards = shards
+        return merge_shards(self.root, entries, shards.values())
+
+
+def _context():
+    # workers are forked from a clean server process rather than from a
+    # parent that may be running other threads
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    context = multiprocessing.get_context("forkserver")
+    # imported once by the server instead of by every worker
+    context.set_forkserver_preload([__name__])
+    return context
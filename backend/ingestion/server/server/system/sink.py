@@ -0,0 +1,311 @@
+"""
+Graph sinks for pushing a scanned file tree into a graph store.
+
+A sink receives batches of node rows ({"path": ..., "properties": {...}}) and
+edge rows ({"parent": ..., "child": ...}). Neo4jSink writes each batch as one
+parameterized UNWIND transaction on a small pool of sessions, left to the
+driver's managed transactions to retry on transient errors, and
+InMemorySink keeps the same data in dicts for tests and benchmarks.
+
+A node removed by a delta stays behind as a tombstone, a node with only its
+path, deleted=true and the sequence of the delta, so a stale upsert that
+arrives later cannot bring it back. Readers of the graph skip nodes with
+deleted set.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from queue import Empty, Queue
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .compact import CompactFileTree
+
+NodeRow = Dict[str, object]
+EdgeRow = Dict[str, str]
+
+CONSTRAINT_QUERY = (
+    "CREATE CONSTRAINT file_system_node_path IF NOT EXISTS "
+    "FOR (n:FileSystemNode) REQUIRE n.path IS UNIQUE"
+)
+
+NODE_QUERY = (
+    "UNWIND $rows AS row "
+    "MERGE (n:FileSystemNode {path: row.path}) "
+    "SET n += row.properties "
+    "REMOVE n.deleted"
+)
+
+EDGE_QUERY = (
+    "UNWIND $rows AS row "
+    "MATCH (parent:FileSystemNode {path: row.parent}) "
+    "MATCH (child:FileSystemNode {path: row.child}) "
+    "WHERE parent.deleted IS NULL AND child.deleted IS NULL "
+    "MERGE (parent)-[:CONTAINS]->(child)"
+)
+
+DELETE_QUERY = (
+    "UNWIND $rows AS path " "MATCH (n:FileSystemNode {path: path}) " "DETACH DELETE n"
+)
+
+# a removal that is part of a delta leaves a tombstone carrying its sequence,
+# created for paths the store has not seen yet, so older upserts stay out
+TOMBSTONE_QUERY = (
+    "UNWIND $rows AS path "
+    "MERGE (n:FileSystemNode {path: path}) "
+    "WITH n, path WHERE coalesce(n.seq, -1) <= $seq "
+    "SET n = {path: path, deleted: true, seq: $seq} "
+    "WITH n "
+    "OPTIONAL MATCH (n)-[r:CONTAINS]-() "
+    "DELETE r"
+)
+
+# rows stamped with an older change sequence than the stored node are skipped,
+# so replaying a delta is harmless and a stale one cannot overwrite newer data
+UPSERT_QUERY = (
+    "UNWIND $rows AS row "
+    "MERGE (n:FileSystemNode {path: row.path}) "
+    "WITH n, row WHERE coalesce(n.seq, -1) <= $seq "
+    "SET n = row.properties, n.path = row.path, n.seq = $seq"
+)
+
+GET_SEQUENCE_QUERY = (
+    "MERGE (s:FileSystemSync {id: $id}) " "RETURN coalesce(s.seq, 0) AS seq"
+)
+
+SET_SEQUENCE_QUERY = "MERGE (s:FileSystemSync {id: $id}) " "SET s.seq = $seq"
+
+
+class GraphSink(ABC):
+    def setup(self) -> None:
+        pass
+
+    @abstractmethod
+    def write_nodes(self, rows: List[NodeRow]) -> None:
+        pass
+
+    @abstractmethod
+    def write_edges(self, rows: List[EdgeRow]) -> None:
+        pass
+
+    @abstractmethod
+    def upsert_nodes(self, rows: List[NodeRow], seq: int) -> None:
+        pass
+
+    @abstractmethod
+    def delete_nodes(self, paths: List[str], seq: Optional[int] = None) -> None:
+        pass
+
+    @abstractmethod
+    def get_sequence(self) -> int:
+        pass
+
+    @abstractmethod
+    def set_sequence(self, seq: int) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class InMemorySink(GraphSink):
+    def __init__(self):
+        self.nodes = {}
+        self.edges = set()
+        self.seqs = {}
+        self.sequence = 0
+        self.transactions = 0
+        self._lock = threading.Lock()
+
+    def write_nodes(self, rows: List[NodeRow]) -> None:
+        with self._lock:
+            self.transactions += 1
+            for row in rows:
+                self.nodes.setdefault(row["path"], {}).update(row["properties"])
+
+    def write_edges(self, rows: List[EdgeRow]) -> None:
+        with self._lock:
+            self.transactions += 1
+            for row in rows:
+                if row["parent"] in self.nodes and row["child"] in self.nodes:
+                    self.edges.add((row["parent"], row["child"]))
+
+    def upsert_nodes(self, rows: List[NodeRow], seq: int) -> None:
+        with self._lock:
+            self.transactions += 1
+            for row in rows:
+                if self.seqs.get(row["path"], -1) <= seq:
+                    self.nodes[row["path"]] = dict(row["properties"])
+                    self.seqs[row["path"]] = seq
+
+    def delete_nodes(self, paths: List[str], seq: Optional[int] = None) -> None:
+        with self._lock:
+            self.transactions += 1
+            deleted = set()
+            for path in paths:
+                if seq is None:
+                    self.nodes.pop(path, None)
+                    self.seqs.pop(path, None)
+                    deleted.add(path)
+                elif self.seqs.get(path, -1) <= seq:
+                    # the tombstone is the sequence without a node
+                    self.nodes.pop(path, None)
+                    self.seqs[path] = seq
+                    deleted.add(path)
+            self.edges = {
+                edge
+                for edge in self.edges
+                if edge[0] not in deleted and edge[1] not in deleted
+            }
+
+    def get_sequence(self) -> int:
+        return self.sequence
+
+    def set_sequence(self, seq: int) -> None:
+        self.sequence = seq
+
+
+class Neo4jSink(GraphSink):
+    def __init__(
+        self,
+        driver,
+        database: Optional[str] = None,
+        sessions: int = 4,
+        sync_id: str = "file_tree",
+    ):
+        self.driver = driver
+        self.sync_id = sync_id
+        self.database = database
+
+        self._sessions = Queue()
+        self._pool = ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="sink")
+        self._pending = deque()
+        # bound the batches waiting on the pool so producers cannot run ahead
+        self._max_pending = 2 * sessions
+
+    def _open_session(self):
+        if self.database is None:
+            return self.driver.session()
+        return self.driver.session(database=self.database)
+
+    def _acquire(self):
+        try:
+            return self._sessions.get_nowait()
+        except Empty:
+            return self._open_session()
+
+    @staticmethod
+    def _write(tx, query: str, rows: list, parameters: dict) -> None:
+        tx.run(query, rows=rows, **parameters).consume()
+
+    def _run(self, query: str, rows: list, parameters: dict) -> None:
+        session = self._acquire()
+        try:
+            # execute_write already retries transient failures with backoff
+            session.execute_write(self._write, query, rows, parameters)
+        except BaseException:
+            # a session whose write failed is not reused
+            session.close()
+            raise
+        self._sessions.put(session)
+
+    def _submit(self, query: str, rows: list, **parameters) -> None:
+        while len(self._pending) >= self._max_pending:
+            self._pending.popleft().result()
+        self._pending.append(self._pool.submit(self._run, query, rows, parameters))
+
+    def setup(self) -> None:
+        with self._open_session() as session:
+            session.run(CONSTRAINT_QUERY).consume()
+
+    def write_nodes(self, rows: List[NodeRow]) -> None:
+        self._submit(NODE_QUERY, rows)
+
+    def write_edges(self, rows: List[EdgeRow]) -> None:
+        self._submit(EDGE_QUERY, rows)
+
+    def upsert_nodes(self, rows: List[NodeRow], seq: int) -> None:
+        self._submit(UPSERT_QUERY, rows, seq=seq)
+
+    def delete_nodes(self, paths: List[str], seq: Optional[int] = None) -> None:
+        if seq is None:
+            self._submit(DELETE_QUERY, paths)
+        else:
+            self._submit(TOMBSTONE_QUERY, paths, seq=seq)
+
+    def get_sequence(self) -> int:
+        with self._open_session() as session:
+            record = session.run(GET_SEQUENCE_QUERY, id=self.sync_id).single()
+        return record["seq"] if record is not None else 0
+
+    def set_sequence(self, seq: int) -> None:
+        with self._open_session() as session:
+            session.run(SET_SEQUENCE_QUERY, id=self.sync_id, seq=seq).consume()
+
+    def flush(self) -> None:
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+            while not self._sessions.empty():
+                self._sessions.get_nowait().close()
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_nodes(file_tree) -> Iterator[NodeRow]:
+    if isinstance(file_tree, CompactFileTree):
+        for index, path in file_tree.walk():
+            yield {"path": path, "properties": file_tree.attributes(index)}
+    else:
+        for path, attributes in file_tree.nodes(data=True):
+            yield {"path": path, "properties": dict(attributes)}
+
+
+def iter_edges(file_tree) -> Iterator[EdgeRow]:
+    if isinstance(file_tree, CompactFileTree):
+        for _, path, parent_path in file_tree.walk_with_parents():
+            if parent_path is not None:
+                yield {"parent": parent_path, "child": path}
+    else:
+        for parent, child in file_tree.edges:
+            yield {"parent": parent, "child": child}
+
+
+def ingest(file_tree, sink: GraphSink, batch_size: int = 10000) -> Tuple[int, int]:
+    nodes = edges = 0
+
+    for batch in batched(iter_nodes(file_tree), batch_size):
+        sink.write_nodes(batch)
+        nodes += len(batch)
+    # relationships match on both endpoints, so every node has to land first
+    sink.flush()
+
+    for batch in batched(iter_edges(file_tree), batch_size):
+        sink.write_edges(batch)
+        edges += len(batch)
+    sink.flush()
+
+    return nodes, edges
@@ -0,0 +1,296 @@
+"""
+Binary snapshots of a CompactFileTree.
+
+Layout (little-endian):
+
+    header   magic "FSTS", version, node count, name count
+    sections (offset, length) table, then each section aligned to 8 bytes:
+             root path, name offsets, name blob, name ids, parents, flags,
+             first child, child count, subtree hashes, node hashes, sizes,
+             mtimes, digests, extra node ids, extra offsets, extra blob
+
+Columns are stored exactly as the in-memory arrays, so loading a snapshot maps
+the file and casts each section to a memoryview. Nothing is decoded until it is
+read: extra attributes are one JSON object per node, found by bisecting the
+sorted node ids. The stored Merkle hashes let the diff open a snapshot and
+only touch the subtrees that changed.
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+from bisect import bisect_left
+from array import array
+from typing import Iterator, Optional, Tuple
+
+from .compact import CompactFileTree, CompactMerkleTree
+
+MAGIC = b"FSTS"
+VERSION = 3
+
+HEADER = struct.Struct("<4sHHQQ")
+SECTION = struct.Struct("<QQ")
+
+SECTIONS = (
+    "root",
+    "name_offsets",
+    "names",
+    "name_index",
+    "parents",
+    "flags",
+    "first_child",
+    "child_count",
+    "hashes",
+    "node_hashes",
+    "sizes",
+    "mtimes",
+    "digests",
+    "extra_index",
+    "extra_offsets",
+    "extra",
+)
+
+
+def _encode(name: str) -> bytes:
+    return name.encode("utf-8", "surrogateescape")
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def is_snapshot(snapshot_file: str) -> bool:
+    try:
+        with open(snapshot_file, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_snapshot(
+    tree: CompactFileTree,
+    snapshot_file: str,
+    merkle_tree: Optional[CompactMerkleTree] = None,
+) -> None:
+    if merkle_tree is None:
+        merkle_tree = tree.merkle_tree()
+
+    name_offsets = array("Q", [0])
+    blob = bytearray()
+    for index in range(len(tree.names)):
+        blob += _encode(tree.names[index])
+        name_offsets.append(len(blob))
+
+    extra_index = array("i", sorted(tree.extra))
+    extra_offsets = array("Q", [0])
+    extra = bytearray()
+    for index in extra_index:
+        extra += json.dumps(tree.extra[index]).encode()
+        extra_offsets.append(len(extra))
+
+    sections = [
+        _encode(tree.root),
+        _little_endian(name_offsets),
+        bytes(blob),
+        _little_endian(array("i", tree.name_index)),
+        _little_endian(array("i", tree.parents)),
+        bytes(tree.flags),
+        _little_endian(array("i", tree.first_child)),
+        _little_endian(array("i", tree.child_count)),
+        bytes(merkle_tree.hashes),
+        bytes(merkle_tree.node_hashes),
+        _little_endian(array("q", tree.sizes)),
+        _little_endian(array("d", tree.mtimes)),
+        bytes(tree.digests),
+        _little_endian(extra_index),
+        _little_endian(extra_offsets),
+        bytes(extra),
+    ]
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for data in sections:
+        offset += -offset % 8
+        table.append((offset, len(data)))
+        offset += len(data)
+
+    tmp_file = snapshot_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(tree), len(tree.names)))
+        for section in table:
+            f.write(SECTION.pack(*section))
+        for (offset, _), data in zip(table, sections):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(data)
+    os.replace(tmp_file, snapshot_file)
+
+
+class _NameTable(object):
+    """Decodes interned names from the mapped blob on access."""
+
+    __slots__ = ("_offsets", "_blob")
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, name_id: int) -> str:
+        start, end = self._offsets[name_id], self._offsets[name_id + 1]
+        return bytes(self._blob[start:end]).decode("utf-8", "surrogateescape")
+
+
+class _ExtraTable(object):
+    """Decodes the extra attributes of a node from the mapped blob on access."""
+
+    __slots__ = ("_index", "_offsets", "_blob")
+
+    def __init__(self, index, offsets, blob):
+        self._index = index
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._index)
+
+    def __contains__(self, index: int) -> bool:
+        return self._position(index) >= 0
+
+    def __getitem__(self, index: int) -> dict:
+        position = self._position(index)
+        if position < 0:
+            raise KeyError(index)
+        return self._decode(position)
+
+    def _position(self, index: int) -> int:
+        position = bisect_left(self._index, index)
+        if position < len(self._index) and self._index[position] == index:
+            return position
+        return -1
+
+    def _decode(self, position: int) -> dict:
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return json.loads(bytes(self._blob[start:end]))
+
+    def get(self, index: int, default=None):
+        position = self._position(index)
+        return default if position < 0 else self._decode(position)
+
+    def keys(self) -> Iterator[int]:
+        return iter(self._index)
+
+    def values(self) -> Iterator[dict]:
+        for position in range(len(self._index)):
+            yield self._decode(position)
+
+    def items(self) -> Iterator[Tuple[int, dict]]:
+        for position, index in enumerate(self._index):
+            yield index, self._decode(position)
+
+
+class SnapshotFileTree(CompactFileTree):
+    """
+    Read-only CompactFileTree backed by a memory-mapped snapshot file.
+    """
+
+    __slots__ = ("_file", "_mmap", "_views", "_hashes", "_node_hashes")
+
+    def __init__(self, snapshot_file: str):
+        self._file = open(snapshot_file, "rb")
+        self._mmap = None
+        self._views = []
+        self.child_maps = {}
+
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, node_count, name_count = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise ValueError(f"{snapshot_file} is not a file tree snapshot")
+            if version != VERSION:
+                raise ValueError(f"unsupported snapshot version {version}")
+
+            table = {
+                name: SECTION.unpack_from(self._mmap, HEADER.size + SECTION.size * i)
+                for i, name in enumerate(SECTIONS)
+            }
+
+            self.root = bytes(self._section(table["root"])).decode(
+                "utf-8", "surrogateescape"
+            )
+            self.names = _NameTable(
+                self._column("Q", table["name_offsets"]), self._section(table["names"])
+            )
+            self.name_ids = None
+            self.name_index = self._column("i", table["name_index"])
+            self.parents = self._column("i", table["parents"])
+            self.flags = self._section(table["flags"])
+            self.first_child = self._column("i", table["first_child"])
+            self.child_count = self._column("i", table["child_count"])
+            self._hashes = self._section(table["hashes"])
+            self._node_hashes = self._section(table["node_hashes"])
+            self.sizes = self._column("q", table["sizes"])
+            self.mtimes = self._column("d", table["mtimes"])
+            self.digests = self._section(table["digests"])
+            self.extra = _ExtraTable(
+                self._column("i", table["extra_index"]),
+                self._column("Q", table["extra_offsets"]),
+                self._section(table["extra"]),
+            )
+        except Exception:
+            self.close()
+            raise
+
+        if len(self.parents) != node_count or len(self.names) != name_count:
+            self.close()
+            raise ValueError(f"{snapshot_file} is truncated")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _section(self, section) -> memoryview:
+        offset, length = section
+        view = memoryview(self._mmap)[offset : offset + length]
+        self._views.append(view)
+        return view
+
+    def _column(self, typecode: str, section):
+        view = self._section(section)
+        if sys.byteorder != "little":
+            column = array(typecode, bytes(view))
+            column.byteswap()
+            return column
+        column = view.cast(typecode)
+        self._views.append(column)
+        return column
+
+    def _append(self, parent: int, name: str, node_type: int) -> int:
+        raise TypeError("snapshots are read-only")
+
+    def merkle_tree(self) -> CompactMerkleTree:
+        return CompactMerkleTree(self, self._hashes, self._node_hashes)
+
+    def close(self) -> None:
+        # views must be released before the map can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+def load_snapshot(snapshot_file: str) -> SnapshotFileTree:
+    return SnapshotFileTree(snapshot_file)
@@ -0,0 +1,309 @@
+"""
+Device state for prompts.
+
+The prompt in prompts/initial.txt sends the model a "state" object next to
+every command (device, battery, connectivity, bluetooth, running apps, files
+and so on). A StateCollector keeps one cached value per field, each with its
+own collector and TTL: static facts are probed once, battery and connectivity
+every few seconds. A background thread refreshes fields as they expire, so
+state() only copies cached references and never waits on a probe; a field
+that has not been collected yet reports its default.
+
+The expensive fields are kept up incrementally. ProcessList only asks psutil
+about processes it has not seen before, and RecentFiles is fed the change sets
+of scans and the watcher instead of walking the file tree.
+"""
+
+import os
+import glob
+import time
+import heapq
+import logging
+import platform
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# interface name prefixes, as named by the kernel and udev
+WIFI_INTERFACES = ("wl", "ath", "ra")
+CELLULAR_INTERFACES = ("wwan", "rmnet", "ccmni", "ppp")
+
+PROC_WIRELESS = "/proc/net/wireless"
+SYS_BLUETOOTH = "/sys/class/bluetooth"
+SYS_RFKILL = "/sys/class/rfkill"
+BLUEZ_STORAGE = "/var/lib/bluetooth"
+DMI_PRODUCT = "/sys/devices/virtual/dmi/id/product_name"
+
+# seconds before a static field that failed is collected again
+RETRY_INTERVAL = 60.0
+
+
+class Field(object):
+    def __init__(
+        self, name: str, collect: Callable[[], Any], ttl: float, default: Any = None
+    ):
+        self.name = name
+        self.collect = collect
+        # seconds a value stays fresh, None never expires
+        self.ttl = ttl
+        self.value = default
+        self.updated = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def expires(self) -> float:
+        if self.updated is None:
+            return 0.0
+        if self.ttl is None:
+            return float("inf") if self.error is None else self.updated + RETRY_INTERVAL
+        return self.updated + self.ttl
+
+    def refresh(self) -> None:
+        # a field is refreshed by one thread at a time, the others skip it
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            value = self.collect()
+            self.value, self.error = value, None
+        except Exception as e:
+            # keep serving the last good value
+            logger.exception("collecting %s failed", self.name)
+            self.error = str(e)
+        finally:
+            self.updated = time.monotonic()
+            self.lock.release()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "age": None if self.updated is None else time.monotonic() - self.updated,
+            "error": self.error,
+        }
+
+
+class StateCollector(object):
+    def __init__(self, fields: List[Field], max_wait: float = 1.0):
+        self.fields = OrderedDict((field.name, field) for field in fields)
+        self.max_wait = max_wait
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def state(self) -> Dict[str, Any]:
+        """
+        The cached state object. Values are shared with the collector and must
+        not be modified.
+        """
+        return {name: field.value for name, field in self.fields.items()}
+
+    def refresh(
+        self, names: Optional[Iterable[str]] = None, force: bool = False
+    ) -> None:
+        """Collect the expired fields, or the given ones, on this thread."""
+        now = time.monotonic()
+        if names is None:
+            fields = self.fields.values()
+        else:
+            fields = [self.fields[name] for name in names]
+        for field in fields:
+            if force or names is not None or field.expires() <= now:
+                field.refresh()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: field.to_dict() for name, field in self.fields.items()}
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="state", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.refresh()
+            next_expiry = min(field.expires() for field in self.fields.values())
+            wait = min(self.max_wait, max(0.0, next_expiry - time.monotonic()))
+            self._stopped.wait(wait)
+
+
+class ProcessList(object):
+    """Names of running processes, looking up only the ones not seen before."""
+
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self.names = {}
+
+    def __call__(self) -> List[str]:
+        pids = set(psutil.pids())
+        for pid in list(self.names):
+            if pid not in pids:
+                del self.names[pid]
+
+        for pid in pids.difference(self.names):
+            try:
+                self.names[pid] = psutil.Process(pid).name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+
+        return sorted(set(self.names.values()))[: self.limit]
+
+
+class RecentFiles(object):
+    """
+    The most recently modified files, newest mtime first, fed by change sets.
+    Files without an mtime (scans that do not hash contents) come after the
+    others, the last changed first.
+    """
+
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        # path -> ((mtime, change number), attributes)
+        self.files = {}
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    def apply(self, changes: Dict[str, Optional[dict]]) -> None:
+        with self.lock:
+            for path in sorted(changes):
+                attributes = changes[path]
+                self.files.pop(path, None)
+                if attributes is not None and attributes.get("type") != "directory":
+                    self.changes += 1
+                    rank = (attributes.get("mtime", float("-inf")), self.changes)
+                    self.files[path] = (rank, attributes)
+            if len(self.files) > self.limit:
+                self.files = dict(
+                    heapq.nlargest(
+                        self.limit, self.files.items(), key=lambda item: item[1][0]
+                    )
+                )
+
+    def __call__(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            newest = sorted(
+                self.files.items(), key=lambda item: item[1][0], reverse=True
+            )
+            return [dict(attributes, path=path) for path, (_, attributes) in newest]
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def device_info() -> Dict[str, str]:
+    memory = round(psutil.virtual_memory().total / (1024 * 1024 * 1024), 2)
+    return {
+        "model": _read(DMI_PRODUCT) or platform.node(),
+        "os_version": f"{platform.system()} {platform.release()}",
+        "hardware_specs": f"{platform.machine()}, {psutil.cpu_count()} CPUs, "
+        f"{memory} GB RAM",
+    }
+
+
+def battery_info() -> Dict[str, Any]:
+    battery = psutil.sensors_battery()
+    if battery is None:
+        return {"level": None, "charging_status": "no battery"}
+    return {
+        "level": round(battery.percent),
+        "charging_status": "charging" if battery.power_plugged else "discharging",
+    }
+
+
+def signal_strength(wireless: str = PROC_WIRELESS) -> Optional[int]:
+    """Signal level in dBm of the first wireless interface."""
+    lines = (_read(wireless) or "").splitlines()
+    # two header lines, then "iface: status link level noise ..."
+    for line in lines[2:]:
+        fields = line.split()
+        try:
+            return int(float(fields[3]))
+        except (IndexError, ValueError):
+            continue
+    return None
+
+
+def connectivity_info() -> Dict[str, Any]:
+    up = [
+        name
+        for name, stats in psutil.net_if_stats().items()
+        if stats.isup and name != "lo"
+    ]
+    wifi = [name for name in up if name.startswith(WIFI_INTERFACES)]
+    cellular = [name for name in up if name.startswith(CELLULAR_INTERFACES)]
+
+    if wifi:
+        network_type = "wifi"
+    elif cellular:
+        network_type = "cellular"
+    elif up:
+        network_type = "ethernet"
+    else:
+        network_type = "none"
+
+    return {
+        "wifi_status": "connected" if wifi else "disconnected",
+        "cellular_status": "connected" if cellular else "disconnected",
+        "signal_strength": signal_strength() if wifi else None,
+        "network_type": network_type,
+    }
+
+
+def bluetooth_info() -> Dict[str, Any]:
+    if not os.path.isdir(SYS_BLUETOOTH) or not os.listdir(SYS_BLUETOOTH):
+        return {"status": "unavailable", "paired_devices": []}
+
+    blocked = any(
+        _read(os.path.join(rfkill, "soft")) == "1"
+        for rfkill in glob.glob(os.path.join(SYS_RFKILL, "*"))
+        if _read(os.path.join(rfkill, "type")) == "bluetooth"
+    )
+
+    # bluez keeps one directory per paired device, named by its address
+    paired = []
+    for info in sorted(glob.glob(os.path.join(BLUEZ_STORAGE, "*", "*", "info"))):
+        address = os.path.basename(os.path.dirname(info))
+        name = next(
+            (
+                line.split("=", 1)[1]
+                for line in (_read(info) or "").splitlines()
+                if line.startswith("Name=")
+            ),
+            address,
+        )
+        paired.append({"address": address, "name": name})
+
+    return {"status": "off" if blocked else "on", "paired_devices": paired}
+
+
+def default_fields(
+    files: RecentFiles, processes: Optional[ProcessList] = None
+) -> List[Field]:
+    """The fields of the prompt's state object, in its order."""
+    processes = processes or ProcessList()
+    return [
+        Field("device", device_info, None, {}),
+        Field("battery", battery_info, 30.0, {}),
+        Field("connectivity", connectivity_info, 5.0, {}),
+        Field("bluetooth", bluetooth_info, 30.0, {}),
+        Field("active_apps", processes, 5.0, []),
+        # nothing on this host provides them
+        Field("contacts", list, None, []),
+        Field("permissions", list, None, []),
+        Field("files", files, 1.0, []),
+        Field("notifications", list, None, []),
+    ]
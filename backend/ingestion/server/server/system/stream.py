@@ -0,0 +1,239 @@
+"""
+Streaming scans.
+
+scan_batches turns the crawl into batches of entry records
+({"path", "parent", "properties"}) while it runs, so consumers can start on
+the first directories instead of waiting for a complete tree. Each directory's
+records are contiguous and every parent comes before its children.
+
+Stages are plain generators chained in one thread, or decoupled with
+prefetch, which runs a stage on its own thread. fan_out feeds every batch to
+several consumers, each on its own thread. All hand-offs go through queues
+of a few batches, so a slow stage stalls the crawl instead of letting batches
+pile up, and memory stays bounded by the queue depths whatever the size of
+the tree.
+"""
+
+import os
+import threading
+from queue import Full, Queue
+from typing import Callable, Iterable, Iterator, List
+
+from .compact import CompactFileTree
+from .content import ContentHasher
+from .sink import GraphSink, batched
+
+Record = dict
+Batch = List[Record]
+
+_DONE = object()
+
+
+def iter_records(path: str, listings) -> Iterator[Record]:
+    yield {"path": path, "parent": None, "properties": {"type": "directory"}}
+    for current_path, entries in listings:
+        for name, is_dir in entries:
+            yield {
+                "path": os.path.join(current_path, name),
+                "parent": current_path,
+                "properties": {"type": "directory" if is_dir else "file", "name": name},
+            }
+
+
+def scan_batches(path: str, listings, batch_size: int = 1000) -> Iterator[Batch]:
+    return batched(iter_records(path, listings), batch_size)
+
+
+def hash_batches(batches: Iterable[Batch], hasher: ContentHasher) -> Iterator[Batch]:
+    for batch in batches:
+        files = [record for record in batch if record["properties"]["type"] == "file"]
+        paths = [record["path"] for record in files]
+        for record, (_, content) in zip(files, hasher.hash_files(paths)):
+            if content is not None:
+                record["properties"].update(content)
+        yield batch
+
+
+def prefetch(batches: Iterable[Batch], depth: int = 2) -> Iterator[Batch]:
+    """
+    Run the upstream stages on a background thread, at most depth batches
+    ahead of the consumer.
+    """
+    queue = Queue(maxsize=depth)
+    stopped = threading.Event()
+    error = []
+
+    def produce() -> None:
+        try:
+            for batch in batches:
+                while not stopped.is_set():
+                    try:
+                        queue.put(batch, timeout=0.1)
+                        break
+                    except Full:
+                        continue
+                if stopped.is_set():
+                    break
+        except BaseException as e:
+            error.append(e)
+        finally:
+            close = getattr(batches, "close", None)
+            if close is not None:
+                close()
+            queue.put(_DONE)
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = queue.get()
+            if batch is _DONE:
+                break
+            yield batch
+    finally:
+        stopped.set()
+        # unblock the producer if it is waiting on a full queue
+        while thread.is_alive():
+            while not queue.empty():
+                queue.get_nowait()
+            thread.join(0.1)
+
+    if error:
+        raise error[0]
+
+
+def fan_out(
+    batches: Iterable[Batch], consumers: List[Callable[[Batch], None]], depth: int = 2
+) -> None:
+    """
+    Feed every batch to each consumer on its own thread. Consumers share the
+    batches and must not modify them; one with a close() method has it
+    called, on its thread, after the last batch.
+    """
+    queues = [Queue(maxsize=depth) for _ in consumers]
+    errors = []
+
+    def consume(consumer, queue: Queue) -> None:
+        try:
+            while True:
+                batch = queue.get()
+                if batch is _DONE:
+                    break
+                consumer(batch)
+            close = getattr(consumer, "close", None)
+            if close is not None:
+                close()
+        except BaseException as e:
+            errors.append(e)
+            # keep draining so the producer never blocks on a dead consumer
+            while queue.get() is not _DONE:
+                pass
+
+    threads = [
+        threading.Thread(target=consume, args=(consumer, queue), daemon=True)
+        for consumer, queue in zip(consumers, queues)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for batch in batches:
+            if errors:
+                break
+            for queue in queues:
+                queue.put(batch)
+    finally:
+        for queue in queues:
+            queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+class SinkWriter(object):
+    """
+    Streams records into a graph sink. Relationships match on both endpoints,
+    so edges are held back until the nodes of their window have been flushed.
+    """
+
+    def __init__(self, sink: GraphSink, batch_size: int = 10000, window: int = 8):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.window = window
+        self.nodes = 0
+        self.edges = 0
+        self._edges = []
+        self._batches = 0
+
+    def __call__(self, batch: Batch) -> None:
+        self.sink.write_nodes(
+            [{"path": r["path"], "properties": dict(r["properties"])} for r in batch]
+        )
+        self.nodes += len(batch)
+        self._edges.extend(
+            {"parent": r["parent"], "child": r["path"]}
+            for r in batch
+            if r["parent"] is not None
+        )
+
+        self._batches += 1
+        if self._batches % self.window == 0:
+            self._write_edges()
+
+    def _write_edges(self) -> None:
+        self.sink.flush()
+        for edges in batched(self._edges, self.batch_size):
+            self.sink.write_edges(edges)
+        self.edges += len(self._edges)
+        self._edges = []
+
+    def close(self) -> None:
+        self._write_edges()
+        self.sink.flush()
+
+
+class TreeBuilder(object):
+    """Assembles a CompactFileTree from records."""
+
+    def __init__(self, path: str):
+        self.tree = CompactFileTree(path)
+        self._pending = {path: 0}
+        self._parent = None
+        self._entries = []
+        self._extra = []
+
+    def __call__(self, batch: Batch) -> None:
+        for record in batch:
+            parent = record["parent"]
+            if parent is None:
+                continue
+            if parent != self._parent:
+                self._flush()
+                self._parent = parent
+
+            properties = record["properties"]
+            self._entries.append(
+                (properties["name"], properties["type"] == "directory")
+            )
+            # records carrying more than type and name, e.g. content hashes
+            if len(properties) > 2:
+                self._extra.append((len(self._entries) - 1, properties))
+
+    def _flush(self) -> None:
+        if self._parent is None:
+            return
+        # a directory's records are contiguous, so this is its whole listing
+        first = self.tree.add_children(self._pending.pop(self._parent), self._entries)
+        for offset, (name, is_dir) in enumerate(self._entries):
+            if is_dir:
+                self._pending[os.path.join(self._parent, name)] = first + offset
+        for offset, properties in self._extra:
+            self.tree.set_attributes(first + offset, properties)
+        self._entries = []
+        self._extra = []
+
+    def close(self) -> None:
+        self._flush()
+        self._parent = None
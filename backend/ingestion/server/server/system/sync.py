@@ -0,0 +1,64 @@
+"""
+Delta sync of file tree changes into a graph sink.
+
+Changes map each path to its new attributes, or None when it was removed. A
+sync stamps every write with the next change sequence number of the store, so
+deltas are idempotent and an older delta can never overwrite a newer one.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from .sink import EdgeRow, GraphSink, NodeRow, batched
+
+Changes = Dict[str, Optional[dict]]
+
+
+def changes_from_differences(
+    differences: Dict[str, Optional[str]], file_tree
+) -> Changes:
+    return {
+        path: None if hash_value is None else dict(file_tree.nodes[path])
+        for path, hash_value in differences.items()
+    }
+
+
+def _rows(
+    changes: Changes, file_tree
+) -> Tuple[List[NodeRow], List[EdgeRow], List[str]]:
+    upserts, edges, deletes = [], [], []
+    for path in sorted(changes):
+        attributes = changes[path]
+        if attributes is None:
+            deletes.append(path)
+            continue
+
+        upserts.append({"path": path, "properties": attributes})
+        for parent in file_tree.predecessors(path):
+            edges.append({"parent": parent, "child": path})
+
+    return upserts, edges, deletes
+
+
+def sync_changes(
+    changes: Changes, file_tree, sink: GraphSink, batch_size: int = 10000
+) -> int:
+    if not changes:
+        return sink.get_sequence()
+
+    seq = sink.get_sequence() + 1
+    upserts, edges, deletes = _rows(changes, file_tree)
+
+    for batch in batched(deletes, batch_size):
+        sink.delete_nodes(batch, seq)
+    for batch in batched(upserts, batch_size):
+        sink.upsert_nodes(batch, seq)
+    # relationships match on both endpoints, so every node has to land first
+    sink.flush()
+
+    for batch in batched(edges, batch_size):
+        sink.write_edges(batch)
+    sink.flush()
+
+    # only advanced once the whole delta is stored, a failed sync is replayed
+    sink.set_sequence(seq)
+    return seq
@@ -0,0 +1,146 @@
+"""
+I/O budgets for background scans.
+
+A ScanBudget holds two token buckets, one for directory listings (scandir
+calls) per second and one for file bytes hashed per second, which crawler and
+hasher threads draw from before doing the work. Roughly once a second the
+budget samples host load with psutil: while CPU plus iowait is above the high
+water mark, or the scan's own process exceeds its CPU share, the rates are
+halved, and they recover gradually once the host is quiet again. That keeps a
+refresh from competing with latency-sensitive services on the same host.
+"""
+
+import time
+import threading
+from typing import Dict
+
+import psutil
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float = 0.0, burst: float = 0.0):
+        # a rate of 0 means unlimited
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float, burst: float = 0.0) -> None:
+        with self._lock:
+            if self.rate <= 0:
+                # leaving unlimited mode starts with a full bucket
+                self.tokens = burst or rate
+                self.updated = time.monotonic()
+            self.rate = rate
+            self.burst = burst or rate
+            self.tokens = min(self.tokens, self.burst)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens, sleeping until they are available. Returns the wait."""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # callers reserve into debt, so concurrent waiters queue up fairly
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ScanBudget(object):
+    def __init__(
+        self,
+        listings_per_second: float = 0.0,
+        bytes_per_second: float = 0.0,
+        cpu_share: float = 1.0,
+        high_load: float = 75.0,
+        low_load: float = 50.0,
+        min_factor: float = 0.05,
+        adapt_interval: float = 1.0,
+    ):
+        self.listings_per_second = listings_per_second
+        self.bytes_per_second = bytes_per_second
+        self.cpu_share = cpu_share
+        self.high_load = high_load
+        self.low_load = low_load
+        self.min_factor = min_factor
+        self.adapt_interval = adapt_interval
+
+        self.factor = 1.0
+        self.listings = TokenBucket()
+        self.bytes = TokenBucket()
+        self._apply()
+
+        self.process = psutil.Process()
+        self.cpu_count = psutil.cpu_count() or 1
+        self._lock = threading.Lock()
+        # the first psutil sample only starts the measurement window
+        self.load()
+        self._next_adapt = time.monotonic() + adapt_interval
+
+    def _apply(self) -> None:
+        # buckets hold one second worth of tokens
+        self.listings.set_rate(self.listings_per_second * self.factor)
+        self.bytes.set_rate(self.bytes_per_second * self.factor)
+
+    def configure(
+        self,
+        listings_per_second: float,
+        bytes_per_second: float,
+        cpu_share: float,
+    ) -> None:
+        with self._lock:
+            self.listings_per_second = listings_per_second
+            self.bytes_per_second = bytes_per_second
+            self.cpu_share = cpu_share
+            self._apply()
+
+    def load(self) -> Dict[str, float]:
+        times = psutil.cpu_times_percent(interval=None)
+        return {
+            "cpu": psutil.cpu_percent(interval=None),
+            "iowait": getattr(times, "iowait", 0.0),
+            "share": self.process.cpu_percent(interval=None) / (100.0 * self.cpu_count),
+        }
+
+    def adapt(self) -> None:
+        now = time.monotonic()
+        if now < self._next_adapt:
+            return
+
+        with self._lock:
+            if now < self._next_adapt:
+                return
+            self._next_adapt = now + self.adapt_interval
+
+            load = self.load()
+            busy = load["cpu"] + load["iowait"]
+            if busy > self.high_load or load["share"] > self.cpu_share:
+                self.factor = max(self.min_factor, self.factor / 2)
+            elif busy < self.low_load and load["share"] < self.cpu_share / 2:
+                self.factor = min(1.0, self.factor * 1.25)
+            self._apply()
+
+    def acquire_listing(self) -> None:
+        self.adapt()
+        self.listings.acquire()
+
+    def acquire_bytes(self, size: int) -> None:
+        self.adapt()
+        self.bytes.acquire(size)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "listings_per_second": self.listings_per_second,
+            "hash_bytes_per_second": self.bytes_per_second,
+            "cpu_share": self.cpu_share,
+            "factor": self.factor,
+        }
@@ -0,0 +1,331 @@
+"""
+Live change watcher for a scanned file tree.
+
+Every scanned directory gets an inotify watch. Events are collected into a set
+of dirty paths until the burst settles, and each dirty path is then reconciled
+against the disk so create/delete/rename sequences collapse into their net
+effect on the graph. If the kernel queue overflows, the watch limit is hit, or
+inotify is unavailable, the watcher falls back to incremental rescans.
+"""
+
+import os
+import stat
+import time
+import ctypes
+import ctypes.util
+import errno
+import select
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import networkx as nx
+
+from .crawler import crawl
+from .merkle import apply_differences, calculate_merkle_tree, find_differences
+from .rules import Rules, ScanRules
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (
+    IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+Event = Tuple[int, int, str]
+Changes = Dict[str, Optional[dict]]
+
+
+class Inotify(object):
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self, path: Optional[str] = None) -> None:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise(path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> List[Event]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+
+        return events
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FileSystemWatcher(object):
+    def __init__(
+        self,
+        file_tree: nx.DiGraph,
+        path: str,
+        scan: Callable[[str], nx.DiGraph],
+        on_change: Optional[Callable[[Changes], None]] = None,
+        coalesce: float = 0.1,
+        max_delay: float = 1.0,
+        rescan_interval: float = 60.0,
+        rules: Optional[Rules] = None,
+    ):
+        self.file_tree = file_tree
+        self.root = path
+        self.rules = rules if rules is not None else ScanRules().compile(path)
+        self.scan = scan
+        self.on_change = on_change
+        self.coalesce = coalesce
+        self.max_delay = max_delay
+        self.rescan_interval = rescan_interval
+
+        self.lock = threading.RLock()
+        self.watches = {}
+        self.paths = {}
+        self.degraded = False
+        self.overflowed = False
+        self._dirty = set()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        try:
+            self.inotify = Inotify()
+        except OSError:
+            self.inotify = None
+            self.degraded = True
+
+    def start(self) -> None:
+        with self.lock:
+            self._watch_tree()
+        self._thread = threading.Thread(target=self._run, name="watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.inotify is not None:
+            self.inotify.close()
+
+    def _watch(self, path: str) -> None:
+        if self.inotify is None or self.degraded or path in self.paths:
+            return
+        if not self.rules.descend(path):
+            return
+
+        try:
+            wd = self.inotify.add_watch(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                # out of watches, periodic rescans cover the rest of the tree
+                self.degraded = True
+            return
+
+        self.watches[wd] = path
+        self.paths[path] = wd
+
+    def _unwatch(self, path: str) -> None:
+        wd = self.paths.pop(path, None)
+        if wd is None:
+            return
+        # a renamed directory keeps its inode and so its wd; when the new
+        # path was reconciled first the watch is already its
+        if self.watches.get(wd) != path:
+            return
+        self.watches.pop(wd, None)
+        if self.inotify is not None:
+            self.inotify.rm_watch(wd)
+
+    def _watch_tree(self) -> None:
+        for node, attributes in self.file_tree.nodes(data=True):
+            if attributes.get("type") == "directory":
+                self._watch(node)
+
+    def _run(self) -> None:
+        next_rescan = time.monotonic() + self.rescan_interval
+
+        while not self._stopped.is_set():
+            if self.inotify is None:
+                self._stopped.wait(self.coalesce)
+            else:
+                self._collect(self.inotify.read_events(self.coalesce))
+
+                # keep reading while the burst continues, up to max_delay
+                deadline = time.monotonic() + self.max_delay
+                while self._dirty and time.monotonic() < deadline:
+                    events = self.inotify.read_events(self.coalesce)
+                    if not events:
+                        break
+                    self._collect(events)
+
+            if self.overflowed:
+                self.rescan()
+            elif self._dirty:
+                self.flush()
+
+            if self.degraded and time.monotonic() >= next_rescan:
+                self.rescan()
+                next_rescan = time.monotonic() + self.rescan_interval
+
+    def _collect(self, events: List[Event]) -> None:
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+
+            if mask & IN_IGNORED:
+                # the kernel dropped the watch, usually because the directory is gone
+                self.watches.pop(wd, None)
+                if self.paths.get(path) == wd:
+                    del self.paths[path]
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._dirty.add(path)
+            elif name:
+                self._dirty.add(os.path.join(path, name))
+
+    def flush(self) -> Changes:
+        changes = {}
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            # parents sort before their children, so new subtrees are scanned once
+            for path in sorted(dirty):
+                self._reconcile(path, changes)
+
+        self._notify(changes)
+        return changes
+
+    def rescan(self) -> Changes:
+        new_tree = self.scan(self.root)
+
+        with self.lock:
+            self.overflowed = False
+            self._dirty = set()
+
+            differences = find_differences(
+                calculate_merkle_tree(self.file_tree), calculate_merkle_tree(new_tree)
+            )
+            apply_differences(self.file_tree, new_tree, differences)
+            changes = {
+                node: None if hash_value is None else dict(new_tree.nodes[node])
+                for node, hash_value in differences.items()
+            }
+
+            for path in list(self.paths):
+                if not self.file_tree.has_node(path):
+                    self._unwatch(path)
+            self._watch_tree()
+
+        self._notify(changes)
+        return changes
+
+    def _notify(self, changes: Changes) -> None:
+        if changes and self.on_change is not None:
+            self.on_change(changes)
+
+    def _reconcile(self, path: str, changes: Changes) -> None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+
+        if st is None or not (stat.S_ISDIR(st.st_mode) or stat.S_ISREG(st.st_mode)):
+            if self.file_tree.has_node(path):
+                self._remove(path, changes)
+            return
+
+        is_dir = stat.S_ISDIR(st.st_mode)
+        if self.rules.excluded(path, is_dir):
+            if self.file_tree.has_node(path):
+                self._remove(path, changes)
+            return
+
+        node_type = "directory" if is_dir else "file"
+
+        if self.file_tree.has_node(path):
+            if self.file_tree.nodes[path].get("type") == node_type:
+                return
+            self._remove(path, changes)
+
+        parent = os.path.dirname(path)
+        if not self.file_tree.has_node(parent):
+            return
+
+        self._add(parent, path, is_dir, changes)
+        if is_dir:
+            self._add_subtree(path, changes)
+
+    def _add(self, parent: str, path: str, is_dir: bool, changes: Changes) -> None:
+        attributes = {
+            "type": "directory" if is_dir else "file",
+            "name": os.path.basename(path),
+        }
+        self.file_tree.add_node(path, **attributes)
+        self.file_tree.add_edge(parent, path)
+        changes[path] = attributes
+
+    def _add_subtree(self, path: str, changes: Changes) -> None:
+        if not self.rules.descend(path):
+            return
+        # entries created before the new watch was in place produce no events
+        for current_path, entries in crawl(path, rules=self.rules):
+            self._watch(current_path)
+            for name, is_dir in entries:
+                child = os.path.join(current_path, name)
+                self._add(current_path, child, is_dir, changes)
+
+    def _remove(self, path: str, changes: Changes) -> None:
+        subtree = nx.descendants(self.file_tree, path)
+        subtree.add(path)
+        for node in subtree:
+            self._unwatch(node)
+            changes[node] = None
+        self.file_tree.remove_nodes_from(subtree)
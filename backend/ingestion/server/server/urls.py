@@ -13,7 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from api.filesystem import get_urls
+from .api.filesystem import get_urls
 
 urlpatterns = []
 urlpatterns.extend(get_urls())
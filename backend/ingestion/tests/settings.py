@@ -0,0 +1,21 @@
+"""
+Django settings for the API tests, the service settings without the apps that
+only exist in the deployed image.
+"""
+
+from server.server.settings import *
+
+INSTALLED_APPS = [
+    "django.contrib.admin",
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+]
+
+ROOT_URLCONF = "server.server.urls"
+
+SECRET_KEY = "test"
+
+ALLOWED_HOSTS = ["testserver"]
@@ -0,0 +1,96 @@
+import os
+import json
+import tempfile
+import django
+from django.test import Client, RequestFactory, SimpleTestCase
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from server.server.api import filesystem
+
+
+def tearDownModule() -> None:
+    filesystem.file_system.close()
+
+
+class TestFileSystemViews(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = self.tmp.name
+        with open(os.path.join(self.test_dir, "a.txt"), "w") as f:
+            f.write("a")
+
+        # like any API client, without a CSRF token
+        self.client = Client(enforce_csrf_checks=True)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_submit_scan(self) -> None:
+        file_system = filesystem.file_system
+        file_system.snapshot_file = os.path.join(self.test_dir, "file_tree.snapshot")
+        file_system.cache_file = os.path.join(self.test_dir, "scan_cache.json")
+        file_system.watch_changes = False
+
+        response = self.client.post("/api/v1/scans", {"root": self.test_dir})
+        assert response.status_code == 202, response.content
+        job = file_system.jobs.get(response.json()["id"])
+        assert job.wait(10) and job.error is None
+
+        response = self.client.get(f"/api/v1/scans/{job.id}")
+        assert response.json()["last_good"] == file_system.snapshot_path(self.test_dir)
+
+    def test_configure(self) -> None:
+        file_system = filesystem.file_system
+        previous = file_system.configuration()
+        try:
+            response = self.client.post(
+                "/api/v1/configure",
+                '{"interval": 30, "cpu_share": 0.5}',
+                content_type="application/json",
+            )
+            assert response.status_code == 200, response.content
+            assert response.json()["interval"] == 30
+            assert self.client.get("/api/v1/configure").json()["cpu_share"] == 0.5
+        finally:
+            del previous["factor"]
+            file_system.configure(previous)
+
+
+class TestStateView(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        os.makedirs(self.test_dir)
+        with open(os.path.join(self.test_dir, "a.txt"), "w") as f:
+            f.write("a")
+
+        self.file_system = filesystem.file_system
+        self.file_system.snapshot_file = os.path.join(
+            self.tmp.name, "file_tree.snapshot"
+        )
+        self.file_system.cache_file = os.path.join(self.tmp.name, "scan_cache.json")
+        self.file_system.watch_changes = False
+
+    def tearDown(self) -> None:
+        self.file_system.state.stop()
+        self.tmp.cleanup()
+
+    def test_recent_files_follow_refreshes(self) -> None:
+        self.file_system.refresh(self.test_dir)
+        path = os.path.join(self.test_dir, "b.txt")
+        with open(path, "w") as f:
+            f.write("b")
+        self.file_system.refresh(self.test_dir)
+
+        # collected here instead of waiting for the background thread
+        self.file_system.state.refresh(["device", "files"])
+        response = filesystem.state(RequestFactory().get("/api/v1/state"))
+        state = json.loads(response.content)
+
+        assert "os_version" in state["device"]
+        assert [file["path"] for file in state["files"]][:2] == [
+            path,
+            os.path.join(self.test_dir, "a.txt"),
+        ]
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+from benchmarks.ingestion import compare, generate_tree, run_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_generate_tree(self) -> None:
+        root = os.path.join(self.tmp.name, "root")
+        shape = generate_tree(root, 100, fanout=3, depth=2)
+        assert shape == {"directories": 12, "files": 88}
+        assert sum(len(dirs) + len(files) for _, dirs, files in os.walk(root)) == 100
+
+    def test_run_benchmark(self) -> None:
+        for compact in (False, True):
+            run = run_benchmark(300, self.tmp.name, fanout=3, depth=3, compact=compact)
+            assert run["differences"] > 0
+            assert set(run["stages"]) >= {
+                "map_file_system",
+                "calculate_merkle_tree",
+                "find_differences",
+                "update_graph_with_merkle_tree",
+            }
+            assert all(stage["peak_rss"] > 0 for stage in run["stages"].values())
+        assert os.listdir(self.tmp.name) == []
+
+        baseline = {"runs": [run]}
+        slower = {"runs": [dict(run, stages={"rescan": {"seconds": 10.0}})]}
+        assert compare(baseline, baseline, 0.2) == []
+        assert len(compare(slower, baseline, 0.2)) == 1
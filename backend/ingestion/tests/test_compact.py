@@ -0,0 +1,119 @@
+import os
+import time
+import tempfile
+import unittest
+import networkx as nx
+from server.server.system.fstree import FileSystemTree
+from server.server.system.compact import CompactFileTree
+
+
+class TestCompactFileTree(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = self.tmp.name
+        for name in ("a", "b", "b/c"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(3):
+                with open(os.path.join(self.test_dir, name, f"file{i}.txt"), "w") as f:
+                    f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_matches_networkx_scan(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir)
+        tree = self.fst.map_file_system(self.test_dir, workers=4, compact=True)
+
+        assert len(tree) == graph.number_of_nodes()
+        exported = tree.to_networkx()
+        assert dict(exported.nodes(data=True)) == dict(graph.nodes(data=True))
+        assert set(exported.edges) == set(graph.edges)
+
+        path = os.path.join(self.test_dir, "b", "c", "file1.txt")
+        assert tree.nodes[path] == {"type": "file", "name": "file1.txt"}
+        assert list(tree.predecessors(path)) == [os.path.join(self.test_dir, "b", "c")]
+        assert not tree.has_node(os.path.join(self.test_dir, "missing"))
+
+    def test_non_utf8_names(self) -> None:
+        # os.scandir returns this name surrogate escaped
+        path = os.path.join(os.fsencode(self.test_dir), b"bad\xff.txt")
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY))
+        bad = os.path.join(self.test_dir, os.fsdecode(b"bad\xff.txt"))
+
+        graph = self.fst.map_file_system(self.test_dir)
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        graph_merkle = self.fst._calculate_merkle_tree(graph)
+        compact_merkle = self.fst._calculate_merkle_tree(tree)
+        assert bad in graph_merkle
+        assert compact_merkle[self.test_dir] == graph_merkle[self.test_dir]
+
+    def test_lookup_in_large_directory(self) -> None:
+        names = [f"file{i}.txt" for i in range(50000)]
+        tree = CompactFileTree.from_listings(
+            "/big", [("/big", [(name, False) for name in reversed(names)])]
+        )
+        paths = [os.path.join("/big", name) for name in names[::10]]
+
+        start = time.perf_counter()
+        for path in paths:
+            assert tree.nodes[path]["name"] == os.path.basename(path)
+        # the directory is indexed once instead of scanned per lookup
+        assert time.perf_counter() - start < 0.5
+        assert not tree.has_node("/big/missing.txt")
+
+        # a new listing of the directory replaces its map
+        tree.add_children(0, [("only.txt", False)])
+        assert tree.has_node("/big/only.txt") and not tree.has_node(paths[0])
+
+    def test_merkle_tree_and_differences(self) -> None:
+        original_graph = self.fst.map_file_system(self.test_dir)
+        original_tree = self.fst.map_file_system(self.test_dir, compact=True)
+
+        os.remove(os.path.join(self.test_dir, "b", "c", "file0.txt"))
+        os.makedirs(os.path.join(self.test_dir, "d"))
+        new_graph = self.fst.map_file_system(self.test_dir)
+        new_tree = self.fst.map_file_system(self.test_dir, compact=True)
+
+        compact_merkle = self.fst._calculate_merkle_tree(new_tree)
+        graph_merkle = self.fst._calculate_merkle_tree(new_graph)
+        for node in new_graph.nodes:
+            assert compact_merkle[node] == graph_merkle[node]
+
+        differences = self.fst._find_differences(
+            self.fst._calculate_merkle_tree(original_tree), compact_merkle
+        )
+        assert differences == self.fst._find_differences(
+            self.fst._calculate_merkle_tree(original_graph), graph_merkle
+        )
+        assert differences == {
+            os.path.join(self.test_dir, "b", "c", "file0.txt"): None,
+            os.path.join(self.test_dir, "d"): graph_merkle[
+                os.path.join(self.test_dir, "d")
+            ],
+        }
+
+    def test_write_graphml(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir)
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        graphml_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(graphml_dir.cleanup)
+        graphml_file = os.path.join(graphml_dir.name, "file_tree.graphml")
+        tree.write_graphml(graphml_file)
+
+        loaded = nx.read_graphml(graphml_file)
+        assert dict(loaded.nodes(data=True)) == dict(graph.nodes(data=True))
+        assert set(loaded.edges) == set(graph.edges)
+
+        # round trip through the GraphML snapshot and apply a change
+        with open(os.path.join(self.test_dir, "a", "new.txt"), "w") as f:
+            f.write("data")
+        new_tree = self.fst.map_file_system(self.test_dir, compact=True)
+        updated = self.fst.update_graph_with_merkle_tree(new_tree, graphml_file)
+        assert updated.has_edge(
+            os.path.join(self.test_dir, "a"),
+            os.path.join(self.test_dir, "a", "new.txt"),
+        )
+        assert len(CompactFileTree.from_networkx(updated)) == len(new_tree)
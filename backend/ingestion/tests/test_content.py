@@ -0,0 +1,112 @@
+import os
+import hashlib
+import tempfile
+import unittest
+from server.server.system.content import ContentHasher, HashCache
+from server.server.system.fstree import FileSystemTree
+from server.server.system.snapshot import load_snapshot
+
+
+class TestContentHashing(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(5):
+                self.write(os.path.join(name, f"file{i}.txt"), f"data {name} {i}")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.hash_cache_file = os.path.join(self.tmp.name, "hash_cache.json")
+        self.fst.snapshot_file = os.path.join(self.tmp.name, "file_tree.snapshot")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def write(self, name: str, data: str) -> str:
+        path = os.path.join(self.test_dir, name)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def test_records_contents(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir, hash_contents=True)
+        path = os.path.join(self.test_dir, "a", "file1.txt")
+        attributes = graph.nodes[path]
+        assert attributes["size"] == len("data a 1")
+        assert attributes["mtime"] == os.stat(path).st_mtime
+        assert attributes["digest"] == (
+            "sha256:" + hashlib.sha256(b"data a 1").hexdigest()
+        )
+        assert "digest" not in graph.nodes[os.path.join(self.test_dir, "a")]
+
+        tree = self.fst.map_file_system(self.test_dir, compact=True, hash_contents=True)
+        assert dict(tree.to_networkx().nodes(data=True)) == dict(graph.nodes(data=True))
+        # digests live in the content columns, not in a dict per file
+        assert not tree.extra
+        assert len(tree.digests) == 33 * len(tree)
+        assert tree.content(tree.index(path)) == {
+            key: attributes[key] for key in ("size", "mtime", "digest")
+        }
+
+    def test_detects_content_change(self) -> None:
+        saved = self.fst.map_file_system(
+            self.test_dir, compact=True, hash_contents=True
+        )
+        self.fst.save_snapshot(saved)
+        path = self.write(os.path.join("b", "file2.txt"), "same size")
+        os.utime(path, ns=(0, 0))
+
+        tree = self.fst.map_file_system(self.test_dir, compact=True, hash_contents=True)
+        assert self.fst.hash_cache.misses == 1
+        assert self.fst.hash_cache.hits == 9
+        assert set(self.fst.diff_snapshot(tree)) == {path}
+
+        with load_snapshot(self.fst.snapshot_file) as snapshot:
+            assert "digest" in snapshot.attributes(snapshot.index(path))
+            assert dict(snapshot.to_networkx().nodes(data=True)) == dict(
+                saved.to_networkx().nodes(data=True)
+            )
+
+    def test_cache_persists(self) -> None:
+        self.fst.map_file_system(self.test_dir, hash_contents=True)
+        assert self.fst.hash_cache.misses == 10
+
+        self.fst.hash_cache = None
+        graph = self.fst.map_file_system(self.test_dir, hash_contents=True)
+        assert self.fst.hash_cache.hits == 10
+        assert all(
+            "digest" in attributes
+            for _, attributes in graph.nodes(data=True)
+            if attributes["type"] == "file"
+        )
+
+    def test_partial_hash(self) -> None:
+        path = self.write("large.bin", "x" * 10000)
+        cache = HashCache()
+        hasher = ContentHasher(cache, workers=1, chunk_size=100, partial_threshold=1000)
+        sampled = hasher.hash_file(path)
+        assert sampled["digest"].startswith("sha256-partial:")
+
+        # the edit lands in the sampled head block
+        with open(path, "r+") as f:
+            f.seek(5)
+            f.write("y")
+        assert hasher.hash_file(path)["digest"] != sampled["digest"]
+
+        full = ContentHasher(cache, workers=1, chunk_size=100).hash_file(path)
+        assert full["digest"] == (
+            "sha256:" + hashlib.sha256(b"x" * 5 + b"y" + b"x" * 9994).hexdigest()
+        )
+
+    def test_hash_files_in_order(self) -> None:
+        paths = [
+            os.path.join(self.test_dir, name, f"file{i}.txt")
+            for name in ("a", "b")
+            for i in range(5)
+        ]
+        hasher = ContentHasher(workers=2)
+        hashed = list(hasher.hash_files(paths))
+        assert [path for path, _ in hashed] == paths
+        assert all(content == hasher.hash_file(path) for path, content in hashed)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 import platform
 import networkx as nx
@@ -51,21 +52,44 @@ class TestFileSystemTree(unittest.TestCase):
 
     def test_get_system_info(self) -> None:
         # get system info using the function
-        with FileSystemTree(
-                self.test_uri, self.test_user, self.test_password
-            ) as fst:
+        with FileSystemTree(self.test_uri, self.test_user, self.test_password) as fst:
             system_info = fst.get_system_info()
 
             # verify that the output is correct
             assert isinstance(system_info, dict)
-            assert "platform" in system_info and system_info["platform"] == platform.system()
-            assert "platform-release" in system_info and system_info["platform-release"] == platform.release()
-            assert "platform-version" in system_info and system_info["platform-version"] == platform.version()
-            assert "architecture" in system_info and system_info["architecture"] == platform.machine()
-            assert "hostname" in system_info and system_info["hostname"] == platform.node()
-            assert "processor" in system_info and system_info["processor"] == platform.processor()
-            assert "ram" in system_info and isinstance(system_info["ram"], str) and "GB" in system_info["ram"]
-            assert "uptime" in system_info and isinstance(system_info["uptime"], int) and system_info["uptime"] > 0
+            assert (
+                "platform" in system_info
+                and system_info["platform"] == platform.system()
+            )
+            assert (
+                "platform-release" in system_info
+                and system_info["platform-release"] == platform.release()
+            )
+            assert (
+                "platform-version" in system_info
+                and system_info["platform-version"] == platform.version()
+            )
+            assert (
+                "architecture" in system_info
+                and system_info["architecture"] == platform.machine()
+            )
+            assert (
+                "hostname" in system_info and system_info["hostname"] == platform.node()
+            )
+            assert (
+                "processor" in system_info
+                and system_info["processor"] == platform.processor()
+            )
+            assert (
+                "ram" in system_info
+                and isinstance(system_info["ram"], str)
+                and "GB" in system_info["ram"]
+            )
+            assert (
+                "uptime" in system_info
+                and isinstance(system_info["uptime"], int)
+                and system_info["uptime"] > 0
+            )
 
     def test_map_file_system(self) -> None:
         def cleanup(test_dir: str) -> None:
@@ -87,9 +111,7 @@ class TestFileSystemTree(unittest.TestCase):
             f.write("Goodbye, world!")
 
         # run the map_file_system function
-        with FileSystemTree(
-                self.test_uri, self.test_user, self.test_password
-            ) as fst:
+        with FileSystemTree(self.test_uri, self.test_user, self.test_password) as fst:
             file_tree = fst.map_file_system(test_dir)
             print(nx.to_dict_of_dicts(file_tree))
 
@@ -98,17 +120,77 @@ class TestFileSystemTree(unittest.TestCase):
             assert file_tree.has_node(test_dir)
 
             print(f'file1: {os.path.join(test_dir, "file1.txt")}')
-            print(f'tree: {nx.to_dict_of_dicts(file_tree)}')
+            print(f"tree: {nx.to_dict_of_dicts(file_tree)}")
 
             assert file_tree.has_node(os.path.join(test_dir, "file1.txt"))
             assert file_tree.has_node(os.path.join(test_dir, "subdir"))
             assert file_tree.has_node(os.path.join(test_dir, "subdir", "file2.txt"))
             assert file_tree.nodes[test_dir]["type"] == "directory"
-            assert file_tree.nodes[os.path.join(test_dir, "file1.txt")]["type"] == "file"
-            assert file_tree.nodes[os.path.join(test_dir, "subdir")]["type"] == "directory"
-            assert file_tree.nodes[os.path.join(test_dir, "subdir", "file2.txt")]["type"] == "file"
-            assert file_tree.successors(test_dir) == [os.path.join(test_dir, "file1.txt"), os.path.join(test_dir, "subdir")]
-            assert file_tree.successors(os.path.join(test_dir, "subdir")) == [os.path.join(test_dir, "subdir", "file2.txt")]
+            assert (
+                file_tree.nodes[os.path.join(test_dir, "file1.txt")]["type"] == "file"
+            )
+            assert (
+                file_tree.nodes[os.path.join(test_dir, "subdir")]["type"] == "directory"
+            )
+            assert (
+                file_tree.nodes[os.path.join(test_dir, "subdir", "file2.txt")]["type"]
+                == "file"
+            )
+            assert file_tree.successors(test_dir) == [
+                os.path.join(test_dir, "file1.txt"),
+                os.path.join(test_dir, "subdir"),
+            ]
+            assert file_tree.successors(os.path.join(test_dir, "subdir")) == [
+                os.path.join(test_dir, "subdir", "file2.txt")
+            ]
+
+    def test_map_file_system_parallel(self) -> None:
+        with tempfile.TemporaryDirectory() as test_dir:
+            for i in range(5):
+                subdir = os.path.join(test_dir, f"dir{i}", "nested")
+                os.makedirs(subdir)
+                for j in range(3):
+                    with open(os.path.join(subdir, f"file{j}.txt"), "w") as f:
+                        f.write("data")
+
+            with FileSystemTree(
+                self.test_uri, self.test_user, self.test_password
+            ) as fst:
+                serial_tree = fst.map_file_system(test_dir, workers=1)
+                parallel_tree = fst.map_file_system(test_dir, workers=4)
+
+                assert serial_tree.number_of_nodes() == 1 + 5 * 2 + 5 * 3
+                assert dict(parallel_tree.nodes(data=True)) == dict(
+                    serial_tree.nodes(data=True)
+                )
+                assert set(parallel_tree.edges) == set(serial_tree.edges)
+
+    def test_map_file_system_incremental(self) -> None:
+        with tempfile.TemporaryDirectory() as test_dir:
+            scan_dir = os.path.join(test_dir, "root")
+            for name in ("a", "b"):
+                os.makedirs(os.path.join(scan_dir, name))
+                with open(os.path.join(scan_dir, name, "file.txt"), "w") as f:
+                    f.write("data")
+
+            with FileSystemTree(
+                self.test_uri, self.test_user, self.test_password
+            ) as fst:
+                fst.cache_file = os.path.join(test_dir, "scan_cache.json")
+                full_tree = fst.map_file_system(scan_dir, incremental=True)
+                assert fst.cache.misses == 3
+
+                # a fresh instance reloads the persisted cache
+                fst.cache = None
+                cached_tree = fst.map_file_system(scan_dir, incremental=True)
+                assert (fst.cache.hits, fst.cache.misses) == (3, 0)
+                assert set(cached_tree.edges) == set(full_tree.edges)
+
+                with open(os.path.join(scan_dir, "b", "new.txt"), "w") as f:
+                    f.write("data")
+                updated_tree = fst.map_file_system(scan_dir, incremental=True)
+                assert (fst.cache.hits, fst.cache.misses) == (2, 1)
+                assert updated_tree.has_node(os.path.join(scan_dir, "b", "new.txt"))
 
     def test__calculate_merkle_tree(self) -> None:
         # Create a graph with nodes and attributes
@@ -119,30 +201,32 @@ class TestFileSystemTree(unittest.TestCase):
         G.add_edge("a", "b")
         G.add_edge("a", "c")
 
-        with FileSystemTree(
-                self.test_uri, self.test_user, self.test_password
-            ) as fst:
+        with FileSystemTree(self.test_uri, self.test_user, self.test_password) as fst:
 
             # Calculate the Merkle tree
             merkle_tree = fst._calculate_merkle_tree(G)
 
             # Verify the expected hash values for each node
+            b = sha256(repr({"type": "file", "name": "file1.txt"}).encode()).hexdigest()
+            c = sha256(repr({"type": "file", "name": "file2.txt"}).encode()).hexdigest()
+            a = sha256(repr({"type": "directory"}).encode()).hexdigest()
             expected_hashes = {
-                "a": sha256(repr({"type": "directory"}).encode()).hexdigest(),
-                "b": sha256(repr({"type": "file", "name": "file1.txt"}).encode()).hexdigest(),
-                "c": sha256(repr({"type": "file", "name": "file2.txt"}).encode()).hexdigest(),
+                "a": sha256(
+                    (a + "\0\0\0\x01b" + b + "\0\0\0\x01c" + c).encode()
+                ).hexdigest(),
+                "b": b,
+                "c": c,
             }
             assert merkle_tree == expected_hashes
-
+            assert merkle_tree.roots == ["a"]
+            assert merkle_tree.children["a"] == ["b", "c"]
 
     def test__find_differences(self) -> None:
         # Create two Merkle trees
         original_tree = {"a": "hash1", "b": "hash2", "c": "hash3"}
         new_tree = {"a": "hash1", "b": "newhash", "d": "hash4"}
 
-        with FileSystemTree(
-                self.test_uri, self.test_user, self.test_password
-            ) as fst:
+        with FileSystemTree(self.test_uri, self.test_user, self.test_password) as fst:
             # Find the differences between the two trees
             differences = fst._find_differences(original_tree, new_tree)
 
@@ -150,6 +234,36 @@ class TestFileSystemTree(unittest.TestCase):
             expected_differences = {"b": "newhash", "c": None, "d": "hash4"}
             assert differences == expected_differences
 
+    def test__find_differences_prunes_subtrees(self) -> None:
+        original = nx.DiGraph()
+        original.add_node("/", type="directory")
+        for d in ("/x", "/y"):
+            original.add_node(d, type="directory", name=d[1:])
+            original.add_edge("/", d)
+            for f in ("1", "2"):
+                original.add_node(f"{d}/{f}", type="file", name=f)
+                original.add_edge(d, f"{d}/{f}")
+
+        new = original.copy()
+        new.nodes["/y/1"]["size"] = 10
+        new.remove_node("/y/2")
+        new.add_node("/y/3", type="file", name="3")
+        new.add_edge("/y", "/y/3")
+
+        with FileSystemTree(self.test_uri, self.test_user, self.test_password) as fst:
+            original_tree = fst._calculate_merkle_tree(original)
+            new_tree = fst._calculate_merkle_tree(new)
+
+            # an unchanged subtree keeps its hash and is never descended into
+            assert original_tree["/x"] == new_tree["/x"]
+            del original_tree.children["/x"]
+
+            differences = fst._find_differences(original_tree, new_tree)
+            assert differences == {
+                "/y/1": new_tree["/y/1"],
+                "/y/2": None,
+                "/y/3": new_tree["/y/3"],
+            }
 
     def test_update_graph_with_merkle_tree(self) -> None:
         # Create a graph with nodes and edges
@@ -172,9 +286,7 @@ class TestFileSystemTree(unittest.TestCase):
         new_tree.add_node("d", type="file", name="file3.txt")
         new_tree.add_edge("a", "d")
 
-        with FileSystemTree(
-                self.test_uri, self.test_user, self.test_password
-            ) as fst:
+        with FileSystemTree(self.test_uri, self.test_user, self.test_password) as fst:
 
             # Update the original graph with the differences
             updated_graph = fst.update_graph_with_merkle_tree(new_tree, graphml_file)
@@ -189,4 +301,3 @@ class TestFileSystemTree(unittest.TestCase):
 
             # Clean up the test file
             os.remove(graphml_file)
-
@@ -0,0 +1,154 @@
+import os
+import time
+import tempfile
+import unittest
+import networkx as nx
+from server.server.system.fstree import FileSystemTree
+from server.server.system.index import PathIndex
+
+
+class TestPathIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for name in ("a", "b", "b/nested"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(5):
+                with open(os.path.join(self.test_dir, name, f"file{i}.txt"), "w") as f:
+                    f.write("data")
+            with open(os.path.join(self.test_dir, name, "notes.md"), "w") as f:
+                f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def path(self, *parts) -> str:
+        return os.path.join(self.test_dir, *parts)
+
+    def test_matches_scanned_tree(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir, index=True)
+        index = self.fst.index
+        assert len(index) == graph.number_of_nodes()
+
+        page = index.prefix(self.test_dir, limit=1000)
+        assert page["results"] == sorted(graph.nodes)
+        assert page["total"] == len(graph)
+        assert page["next"] is None
+
+        compact = PathIndex.build(self.fst.map_file_system(self.test_dir, compact=True))
+        assert compact.prefix("/", limit=1000) == index.prefix("/", limit=1000)
+
+    def test_prefix_pagination(self) -> None:
+        self.fst.map_file_system(self.test_dir, index=True)
+        index = self.fst.index
+        expected = index.prefix(self.path("b"), limit=1000)["results"]
+        assert len(expected) == 14
+
+        paged, offset = [], 0
+        while offset is not None:
+            page = index.prefix(self.path("b"), offset=offset, limit=3)
+            assert len(page["results"]) <= 3
+            paged.extend(page["results"])
+            offset = page["next"]
+        assert paged == expected
+
+        assert index.prefix(self.path("missing"))["total"] == 0
+
+    def test_lookups(self) -> None:
+        self.fst.map_file_system(self.test_dir, index=True)
+        index = self.fst.index
+
+        assert index.name("notes.md")["total"] == 3
+        assert index.extension("md", self.path("b"))["results"] == [
+            self.path("b", "nested", "notes.md"),
+            self.path("b", "notes.md"),
+        ]
+        assert index.extension(".TXT")["total"] == 15
+        assert index.substring("NOTE", self.path("a"))["results"] == [
+            self.path("a", "notes.md")
+        ]
+        assert index.substring("ile3")["total"] == 3
+
+        page = index.glob(self.path("b", "*", "file?.txt"))
+        assert page["results"] == [
+            self.path("b", "nested", f"file{i}.txt") for i in range(5)
+        ]
+        assert index.glob(self.path("**", "*.md"))["total"] == 3
+
+    def test_apply_changes(self) -> None:
+        index = PathIndex()
+        index.apply({"/x": {"type": "directory"}, "/x/y.py": {"type": "file"}})
+        assert index.extension("py")["results"] == ["/x/y.py"]
+
+        index.apply({"/x/z.py": {"type": "file"}, "/x/y.py": None})
+        assert index.prefix("/x")["results"] == ["/x", "/x/z.py"]
+        assert index.name("y.py")["total"] == 0
+
+        index.apply({"/x": None})
+        assert len(index) == 0
+        assert index.substring("z.p")["total"] == 0
+        assert index.root.children == {}
+
+    def test_follows_diff(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir, index=True)
+        graphml_file = os.path.join(self.tmp.name, "file_tree.graphml")
+        nx.write_graphml(graph, graphml_file)
+        os.remove(self.path("a", "notes.md"))
+        with open(self.path("a", "new.md"), "w") as f:
+            f.write("data")
+
+        index = self.fst.index
+        self.fst.update_graph_with_merkle_tree(
+            self.fst.map_file_system(self.test_dir), graphml_file
+        )
+        assert self.fst.index is index
+        assert index.extension("md", self.path("a"))["results"] == [
+            self.path("a", "new.md")
+        ]
+
+    def test_pages_are_slices(self) -> None:
+        index = PathIndex()
+        paths = []
+        for i in range(200):
+            index.add(f"/d{i}", True)
+            for j in range(500):
+                path = f"/d{i}/f{j}.{'py' if j % 2 else 'TXT'}"
+                index.add(path)
+                paths.append(path)
+        py = sorted(path for path in paths if path.endswith(".py"))
+        under = sorted(path for path in py if path.startswith("/d7/"))
+
+        start = time.perf_counter()
+        for offset in range(0, 50000, 500):
+            assert index.extension("py", offset=offset, limit=10)["results"] == (
+                py[offset : offset + 10]
+            )
+            assert index.glob("/*.py", offset=offset, limit=10)["results"] == (
+                py[offset : offset + 10]
+            )
+            assert (
+                index.extension("py", "/d7", offset=offset % 250, limit=10)["results"]
+                == under[offset % 250 : offset % 250 + 10]
+            )
+            assert index.name("f1.py", "/d7")["results"] == ["/d7/f1.py"]
+        elapsed = time.perf_counter() - start
+        # sorting the 50000 matches for every page takes seconds
+        assert elapsed < 1.0, elapsed
+
+        assert index.glob("/*.py")["total"] == len(py)
+        assert index.glob("/*.txt")["total"] == 0
+        assert index.extension("txt")["total"] == len(paths) - len(py)
+        page = index.substring("f49", "/d3", offset=2, limit=3)
+        expected = sorted(path for path in paths if path.startswith("/d3/f49"))
+        assert page["results"] == expected[2:5]
+        assert page["total"] == len(expected)
+
+        # a general glob is matched once, then paged from the kept matches
+        assert index.glob("/d1?/f1?.py", offset=5, limit=5)["total"] == 50
+        assert "/d1?/f1?.py" in index.globs
+        index.remove("/d10")
+        assert not index.globs
+        assert index.glob("/d1?/f1?.py")["total"] == 45
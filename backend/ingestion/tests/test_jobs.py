@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import unittest
+from server.server.system.fstree import FileSystemTree
+from server.server.system.jobs import FAILED, SUCCEEDED, JobRunner, ScanProgress
+
+
+class TestJobRunner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for name in ("a", "b", "b/c"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(3):
+                with open(os.path.join(self.test_dir, name, f"file{i}.txt"), "w") as f:
+                    f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.snapshot_file = os.path.join(self.tmp.name, "file_tree.snapshot")
+        self.fst.cache_file = os.path.join(self.tmp.name, "scan_cache.json")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_one_scan_per_root(self) -> None:
+        release = threading.Event()
+        runner = JobRunner(lambda root, progress: release.wait(5) and root)
+
+        job = runner.submit("/a")
+        assert runner.submit("/a") is job
+        other = runner.submit("/b")
+        assert other is not job
+
+        release.set()
+        assert job.wait(5) and other.wait(5)
+        assert job.state == SUCCEEDED and job.result == "/a"
+        assert runner.last_good("/a") is job
+        assert runner.active("/a") is None
+        assert runner.submit("/a") is not job
+
+    def test_failure_keeps_last_good(self) -> None:
+        fail = False
+
+        def run(root, progress):
+            if fail:
+                raise OSError("disk went away")
+            return root
+
+        runner = JobRunner(run)
+        good = runner.submit("/a")
+        good.wait(5)
+
+        fail = True
+        failed = runner.submit("/a")
+        failed.wait(5)
+        assert failed.state == FAILED
+        assert failed.to_dict()["error"] == "disk went away"
+        assert runner.last_good("/a") is good
+
+    def test_refresh_reports_progress(self) -> None:
+        job = self.fst.jobs.submit(self.test_dir)
+        assert job.wait(10)
+        assert job.state == SUCCEEDED, job.error
+
+        progress = job.to_dict()["progress"]
+        assert progress["directories"] == 4
+        assert progress["entries"] == 12
+        assert progress["queue_depth"] == 0
+        assert progress["dirs_per_second"] > 0
+
+        with self.fst.latest_snapshot(self.test_dir) as snapshot:
+            assert job.result == self.fst.snapshot_path(self.test_dir)
+            assert len(snapshot) == 13
+
+    def test_index_served_during_scan(self) -> None:
+        self.fst.map_file_system(self.test_dir, index=True)
+        index = self.fst.index
+        os.remove(os.path.join(self.test_dir, "a", "file0.txt"))
+
+        served = []
+
+        class Progress(ScanProgress):
+            def update(progress, entries: int) -> None:
+                super().update(entries)
+                served.append(index.prefix(self.test_dir)["total"])
+
+        tree = self.fst.map_file_system(self.test_dir, index=True, progress=Progress())
+        # the previous scan answers queries until the new one completes
+        assert served == [13] * 4
+        assert self.fst.index is index
+        assert index.prefix(self.test_dir)["total"] == len(tree) == 12
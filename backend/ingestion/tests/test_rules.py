@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from server.server.system.crawler import crawl
+from server.server.system.fstree import FileSystemTree
+from server.server.system.rules import ScanRules, read_mounts
+
+
+class TestScanRules(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for name in ("src/pkg", "src/node_modules/dep", "devtools", "build", "logs"):
+            os.makedirs(os.path.join(self.test_dir, name))
+        for name in (
+            "src/main.py",
+            "src/pkg/module.py",
+            "src/node_modules/dep/index.js",
+            "devtools/tool.py",
+            "build/out.o",
+            "logs/a.log",
+            "logs/keep.log",
+            "build.txt",
+        ):
+            with open(os.path.join(self.test_dir, name), "w") as f:
+                f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def scan(self, rules: ScanRules) -> set:
+        graph = self.fst.map_file_system(self.test_dir, rules=rules)
+        return {os.path.relpath(node, self.test_dir) for node in graph.nodes}
+
+    def test_default_keeps_dev_named_paths(self) -> None:
+        # the old substring check dropped anything containing "/dev"
+        nodes = self.scan(ScanRules())
+        assert "devtools/tool.py" in nodes
+        assert len(nodes) == 16
+
+    def test_gitignore_patterns(self) -> None:
+        patterns = ["# comment", "node_modules/", "/build/", "*.log", "!keep.log"]
+        rules = ScanRules(patterns + ["src/**/*.py"])
+        nodes = self.scan(rules)
+        assert "src/node_modules" not in nodes
+        assert "src/node_modules/dep/index.js" not in nodes
+        assert "build" not in nodes
+        # a trailing slash only matches directories
+        assert "build.txt" in nodes
+        assert "logs/a.log" not in nodes
+        assert "logs/keep.log" in nodes
+        assert "src/main.py" not in nodes and "src/pkg/module.py" not in nodes
+        assert "src/pkg" in nodes
+
+        compiled = rules.compile(self.test_dir)
+        assert compiled.excluded(os.path.join(self.test_dir, "logs", "b.log"), False)
+        assert not compiled.excluded(self.test_dir, True)
+
+    def test_depth_and_entry_limits(self) -> None:
+        nodes = self.scan(ScanRules(max_depth=1))
+        assert nodes == {".", "src", "devtools", "build", "logs", "build.txt"}
+
+        nodes = self.scan(ScanRules(max_depth=2))
+        assert "src/pkg" in nodes and "src/pkg/module.py" not in nodes
+
+        rules = ScanRules(max_entries=7).compile(self.test_dir)
+        for workers in (1, 4):
+            listings = list(crawl(self.test_dir, workers, rules=rules))
+            assert sum(len(entries) for _, entries in listings) == 7
+
+    def test_excluded_mounts(self) -> None:
+        build = os.path.join(self.test_dir, "build")
+        escaped = os.path.join(self.test_dir, "dev\\040tools")
+        mountinfo = os.path.join(self.tmp.name, "mountinfo")
+        with open(mountinfo, "w") as f:
+            f.write("28 1 254:0 / / rw,relatime - ext4 /dev/vda rw\n")
+            f.write(f"40 28 0:40 / {build} rw shared:1 - tmpfs tmpfs rw\n")
+            f.write(f"41 28 0:41 / {escaped} rw - proc proc rw\n")
+
+        mounts = read_mounts(mountinfo)
+        assert mounts[os.path.join(self.test_dir, "dev tools")] == "proc"
+
+        nodes = self.scan(ScanRules(mountinfo=mountinfo))
+        # the mount point stays in the tree, its contents are not scanned
+        assert "build" in nodes and "build/out.o" not in nodes
+
+        nodes = self.scan(ScanRules(excluded_fs_types=["proc"], mountinfo=mountinfo))
+        assert "build/out.o" in nodes
+
+        # mounts at or above the scan root never prune it
+        assert not ScanRules(mountinfo=mountinfo).compile(build).excluded_mounts
+
+    def test_same_device(self) -> None:
+        rules = ScanRules(same_device=True).compile(self.test_dir)
+        assert rules.device == os.stat(self.test_dir).st_dev
+        assert rules.descend(os.path.join(self.test_dir, "src"))
+        if os.path.ismount("/proc") and os.stat("/proc").st_dev != os.stat("/").st_dev:
+            assert not ScanRules(same_device=True).compile("/").descend("/proc")
@@ -0,0 +1,117 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from server.server.system.fstree import FileSystemTree
+from server.server.system.rules import ScanRules
+from server.server.system.shard import ShardedScan, scan_shard
+from server.server.system.snapshot import load_snapshot
+
+
+class TestShardedScan(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for i in range(4):
+            for path in ("nested/deep", "data/inner", "tmp"):
+                os.makedirs(os.path.join(self.test_dir, f"dir{i}", path))
+            for path in (
+                "file.txt",
+                "debug.log",
+                "nested/deep/file.txt",
+                "data/inner/file.txt",
+                "tmp/file.txt",
+            ):
+                with open(os.path.join(self.test_dir, f"dir{i}", path), "w") as f:
+                    f.write(path)
+        with open(os.path.join(self.test_dir, "top.txt"), "w") as f:
+            f.write("top")
+
+        self.data = os.path.join(self.test_dir, "dir1", "data")
+        mountinfo = os.path.join(self.tmp.name, "mountinfo")
+        with open(mountinfo, "w") as f:
+            f.write("28 1 254:0 / / rw,relatime - ext4 /dev/vda rw\n")
+            f.write(f"40 28 8:16 / {self.data} rw - ext4 /dev/vdb rw\n")
+            tmp = os.path.join(self.test_dir, "dir2", "tmp")
+            f.write(f"41 28 0:41 / {tmp} rw - tmpfs tmpfs rw\n")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.rules = ScanRules(["*.log"], mountinfo=mountinfo)
+        self.fst.snapshot_file = os.path.join(self.tmp.name, "file_tree.snapshot")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def assert_matches_single_process(self, tree, merkle_tree) -> None:
+        single = self.fst.map_file_system(self.test_dir, compact=True)
+        graph = single.to_networkx()
+        assert dict(tree.to_networkx().nodes(data=True)) == dict(graph.nodes(data=True))
+        assert set(tree.to_networkx().edges) == set(graph.edges)
+
+        expected = single.merkle_tree()
+        assert merkle_tree.subtree_hash(0) == expected.subtree_hash(0)
+        assert merkle_tree.differences(expected) == {}
+        assert merkle_tree.hashes == tree.merkle_tree().hashes
+
+    def test_matches_single_process(self) -> None:
+        tree, merkle_tree = self.fst.map_file_system_sharded(self.test_dir, processes=2)
+        self.assert_matches_single_process(tree, merkle_tree)
+
+        scan = self.fst.sharded_scans[self.test_dir]
+        assert sorted(scan.shards) == sorted(
+            [os.path.join(self.test_dir, f"dir{i}") for i in range(4)] + [self.data]
+        )
+        assert scan.shards[os.path.join(self.test_dir, "dir1")].stops == {self.data}
+        assert os.path.join(self.test_dir, "dir0", "debug.log") not in tree.nodes
+        assert os.path.join(self.test_dir, "dir2", "tmp", "file.txt") not in tree.nodes
+
+    def test_reuses_unchanged_shards(self) -> None:
+        self.fst.map_file_system_sharded(self.test_dir, processes=2)
+        scan = self.fst.sharded_scans[self.test_dir]
+
+        tree, merkle_tree = self.fst.map_file_system_sharded(self.test_dir, processes=2)
+        assert (scan.scanned, scan.reused) == (0, 5)
+        self.assert_matches_single_process(tree, merkle_tree)
+
+        with open(os.path.join(self.data, "inner", "new.txt"), "w") as f:
+            f.write("new")
+        os.makedirs(os.path.join(self.test_dir, "dir4"))
+        tree, merkle_tree = self.fst.map_file_system_sharded(self.test_dir, processes=2)
+        assert (scan.scanned, scan.reused) == (2, 4)
+        self.assert_matches_single_process(tree, merkle_tree)
+
+    def test_sharded_refresh(self) -> None:
+        self.fst.shard_processes = 2
+        snapshot_file = self.fst.refresh(self.test_dir)
+        graph = self.fst.map_file_system(self.test_dir)
+        with load_snapshot(snapshot_file) as snapshot:
+            assert set(snapshot.to_networkx().edges) == set(graph.edges)
+            assert snapshot.merkle_tree().subtree_hash(0) == (
+                self.fst.map_file_system(self.test_dir, compact=True)
+                .merkle_tree()
+                .subtree_hash(0)
+            )
+
+    def test_workers_share_the_budget(self) -> None:
+        self.fst.budget.configure(20, 0, 0.5)
+        with patch(
+            "server.server.system.shard.ProcessPoolExecutor.map",
+            side_effect=lambda fn, *args: list(map(fn, *args)),
+        ) as pool_map:
+            self.fst.map_file_system_sharded(self.test_dir, processes=2, throttle=True)
+        assert list(pool_map.call_args.args[-1]) == [(10.0, 0.25)] * 5
+
+        # four directories at two listings a second, the first two are free
+        start = time.monotonic()
+        scan_shard(
+            os.path.join(self.test_dir, "dir0"),
+            self.fst.rules.compile(self.test_dir),
+            limits=(2.0, 1.0),
+        )
+        assert time.monotonic() - start >= 0.9
+
+    def test_refuses_max_entries(self) -> None:
+        with self.assertRaises(ValueError):
+            ShardedScan(self.test_dir, ScanRules(max_entries=10))
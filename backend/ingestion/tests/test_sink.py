@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from neo4j.exceptions import TransientError
+from server.server.system.fstree import FileSystemTree
+from server.server.system.sink import (
+    DELETE_QUERY,
+    EDGE_QUERY,
+    NODE_QUERY,
+    TOMBSTONE_QUERY,
+    GraphSink,
+    InMemorySink,
+    Neo4jSink,
+    ingest,
+)
+
+
+class TestGraphSink(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = self.tmp.name
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(4):
+                with open(os.path.join(self.test_dir, name, f"file{i}.txt"), "w") as f:
+                    f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_ingest_in_memory(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir)
+        for file_tree in (graph, self.fst.map_file_system(self.test_dir, compact=True)):
+            sink = InMemorySink()
+            nodes, edges = self.fst.ingest(file_tree, sink, batch_size=4)
+
+            assert (nodes, edges) == (11, 10)
+            # three node batches and three edge batches
+            assert sink.transactions == 6
+            assert sink.nodes == dict(graph.nodes(data=True))
+            assert sink.edges == set(graph.edges)
+
+    def test_neo4j_sink_batches(self) -> None:
+        driver = MagicMock()
+        session = driver.session.return_value
+
+        graph = self.fst.map_file_system(self.test_dir)
+        with Neo4jSink(driver, sessions=1) as sink:
+            nodes, edges = ingest(graph, sink, batch_size=10)
+
+        calls = session.execute_write.call_args_list
+        assert [call.args[1] for call in calls] == [
+            NODE_QUERY,
+            NODE_QUERY,
+            EDGE_QUERY,
+        ]
+        assert [len(call.args[2]) for call in calls] == [10, 1, 10]
+        assert (nodes, edges) == (11, 10)
+        # one session serves every batch
+        assert driver.session.call_count == 1
+
+    def test_neo4j_sink_discards_failed_sessions(self) -> None:
+        driver = MagicMock()
+        session = MagicMock()
+        # raised once the driver has given up retrying
+        session.execute_write.side_effect = TransientError("busy")
+        driver.session.return_value = session
+
+        sink = Neo4jSink(driver, sessions=1)
+        sink.write_nodes([{"path": "/", "properties": {"type": "directory"}}])
+        with self.assertRaises(TransientError):
+            sink.flush()
+        # the write is not retried again, and the failed session is not reused
+        session.execute_write.assert_called_once()
+        assert sink._sessions.empty()
+        session.close.assert_called_once()
+        sink.close()
+
+    def test_graph_sink_is_abstract(self) -> None:
+        with self.assertRaises(TypeError):
+            GraphSink()
+
+    def test_deletes_leave_tombstones(self) -> None:
+        driver = MagicMock()
+        session = driver.session.return_value
+        with Neo4jSink(driver, sessions=1) as sink:
+            sink.delete_nodes(["/a"], seq=2)
+            sink.flush()
+            sink.delete_nodes(["/b"])
+
+        calls = session.execute_write.call_args_list
+        assert [call.args[1] for call in calls] == [TOMBSTONE_QUERY, DELETE_QUERY]
+        assert calls[0].args[3] == {"seq": 2}
+
+        sink = InMemorySink()
+        sink.upsert_nodes([{"path": "/a", "properties": {"type": "file"}}], seq=3)
+        sink.delete_nodes(["/a", "/b"], seq=4)
+        sink.upsert_nodes([{"path": "/b", "properties": {"type": "file"}}], seq=2)
+        assert sink.nodes == {} and sink.seqs == {"/a": 4, "/b": 4}
+
+        # a removal outside of a delta leaves nothing behind
+        sink.delete_nodes(["/a"])
+        sink.upsert_nodes([{"path": "/a", "properties": {"type": "file"}}], seq=1)
+        assert sink.nodes == {"/a": {"type": "file"}}
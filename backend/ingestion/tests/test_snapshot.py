@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+import networkx as nx
+from server.server.system.fstree import FileSystemTree
+from server.server.system.snapshot import is_snapshot, load_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for name in ("a", "b", "b/ç"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(3):
+                with open(os.path.join(self.test_dir, name, f"file{i}.txt"), "w") as f:
+                    f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.snapshot_file = os.path.join(self.tmp.name, "file_tree.snapshot")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_round_trip(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir)
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        self.fst.save_snapshot(tree)
+        assert is_snapshot(self.fst.snapshot_file)
+
+        with load_snapshot(self.fst.snapshot_file) as snapshot:
+            assert snapshot.root == self.test_dir
+            assert len(snapshot) == len(tree)
+            loaded = snapshot.to_networkx()
+            assert dict(loaded.nodes(data=True)) == dict(graph.nodes(data=True))
+            assert set(loaded.edges) == set(graph.edges)
+
+            merkle_tree = self.fst._calculate_merkle_tree(graph)
+            stored = self.fst._calculate_merkle_tree(snapshot)
+            for node in graph.nodes:
+                assert stored[node] == merkle_tree[node]
+
+        graphml_file = os.path.join(self.tmp.name, "file_tree.graphml")
+        tree.write_graphml(graphml_file)
+        assert not is_snapshot(graphml_file)
+        assert os.path.getsize(self.fst.snapshot_file) < os.path.getsize(graphml_file)
+
+    def test_extra_attributes(self) -> None:
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        path = os.path.join(self.test_dir, "b", "file1.txt")
+        index = tree.index(path)
+        tree.set_attributes(index, {"type": "file", "name": "file1.txt", "size": 4})
+        self.fst.save_snapshot(tree)
+
+        with load_snapshot(self.fst.snapshot_file) as snapshot:
+            assert len(snapshot.extra) == len(tree.extra)
+            assert index in snapshot.extra and 1 not in snapshot.extra
+            assert snapshot.attributes(index)["size"] == 4
+            assert snapshot.attributes(1) == tree.attributes(1)
+            assert dict(snapshot.extra.items()) == tree.extra
+
+    def test_diff_snapshot(self) -> None:
+        self.fst.save_snapshot(self.fst.map_file_system(self.test_dir))
+        os.remove(os.path.join(self.test_dir, "a", "file1.txt"))
+        with open(os.path.join(self.test_dir, "b", "ç", "new.txt"), "w") as f:
+            f.write("data")
+
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        differences = self.fst.diff_snapshot(tree)
+        assert set(differences) == {
+            os.path.join(self.test_dir, "a", "file1.txt"),
+            os.path.join(self.test_dir, "b", "ç", "new.txt"),
+        }
+        assert differences[os.path.join(self.test_dir, "a", "file1.txt")] is None
+
+        updated = self.fst.update_graph_with_merkle_tree(tree, self.fst.snapshot_file)
+        assert set(updated.nodes) == set(tree.to_networkx().nodes)
+
+    def test_rejects_other_files(self) -> None:
+        graphml_file = os.path.join(self.tmp.name, "file_tree.graphml")
+        nx.write_graphml(self.fst.map_file_system(self.test_dir), graphml_file)
+        with self.assertRaises(ValueError):
+            load_snapshot(graphml_file)
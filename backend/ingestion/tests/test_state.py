@@ -0,0 +1,105 @@
+import os
+import time
+import unittest
+from server.server.system.state import (
+    Field,
+    ProcessList,
+    RecentFiles,
+    StateCollector,
+    default_fields,
+)
+
+
+class Counter(object):
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def __call__(self) -> int:
+        time.sleep(self.delay)
+        self.calls += 1
+        return self.calls
+
+
+class TestStateCollector(unittest.TestCase):
+    def test_ttl(self) -> None:
+        fast, static = Counter(), Counter()
+        collector = StateCollector(
+            [Field("fast", fast, 0.1), Field("static", static, None)]
+        )
+        collector.refresh()
+        collector.refresh()
+        assert collector.state() == {"fast": 1, "static": 1}
+
+        time.sleep(0.15)
+        collector.refresh()
+        assert collector.state() == {"fast": 2, "static": 1}
+
+        collector.refresh(["static"])
+        assert static.calls == 2
+
+    def test_state_never_waits(self) -> None:
+        slow = Counter(delay=0.3)
+        collector = StateCollector([Field("slow", slow, 0.5, default=0)])
+        collector.start()
+        try:
+            start = time.monotonic()
+            assert collector.state() == {"slow": 0}
+            assert time.monotonic() - start < 0.005
+
+            time.sleep(0.5)
+            assert collector.state()["slow"] >= 1
+        finally:
+            collector.stop()
+
+    def test_failed_field_keeps_value(self) -> None:
+        values = iter([{"level": 80}])
+        collector = StateCollector([Field("battery", lambda: next(values), 0.0)])
+        collector.refresh()
+        collector.refresh()
+        assert collector.state()["battery"] == {"level": 80}
+        assert collector.status()["battery"]["error"] is not None
+
+    def test_recent_files(self) -> None:
+        files = RecentFiles(limit=2)
+        files.apply({"/a": {"type": "file", "name": "a"}, "/d": {"type": "directory"}})
+        files.apply({"/b": {"type": "file", "name": "b"}})
+        files.apply({"/c": {"type": "file", "name": "c"}, "/b": None})
+        assert [f["path"] for f in files()] == ["/c", "/a"]
+        files.apply({"/d/e": {"type": "file", "name": "e"}})
+        assert [f["path"] for f in files()] == ["/d/e", "/c"]
+
+        # files with an mtime are ordered by it, whatever their path
+        files.apply(
+            {
+                "/x": {"type": "file", "name": "x", "mtime": 20.0},
+                "/y": {"type": "file", "name": "y", "mtime": 10.0},
+                "/z": {"type": "file", "name": "z", "mtime": 30.0},
+            }
+        )
+        assert [f["path"] for f in files()] == ["/z", "/x"]
+
+    def test_default_fields(self) -> None:
+        processes = ProcessList(limit=10000)
+        collector = StateCollector(default_fields(RecentFiles(), processes))
+        collector.refresh()
+        names = dict(processes.names)
+        assert names[os.getpid()] in collector.state()["active_apps"]
+
+        start = time.monotonic()
+        state = collector.state()
+        assert time.monotonic() - start < 0.005
+        assert list(state) == [
+            "device",
+            "battery",
+            "connectivity",
+            "bluetooth",
+            "active_apps",
+            "contacts",
+            "permissions",
+            "files",
+            "notifications",
+        ]
+        assert "os_version" in state["device"]
+        assert "network_type" in state["connectivity"]
+        assert collector.status()["device"]["error"] is None
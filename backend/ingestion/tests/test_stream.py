@@ -0,0 +1,102 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from server.server.system.fstree import FileSystemTree
+from server.server.system.sink import InMemorySink
+from server.server.system.snapshot import load_snapshot
+from server.server.system.stream import fan_out, prefetch
+
+
+class TestStreamingScan(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for i in range(10):
+            directory = os.path.join(self.test_dir, f"dir{i}", "nested")
+            os.makedirs(directory)
+            for j in range(20):
+                with open(os.path.join(directory, f"file{j}.txt"), "w") as f:
+                    f.write(f"data {i} {j}")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.hash_cache_file = os.path.join(self.tmp.name, "hash_cache.json")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_batches_match_tree(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir)
+        for workers in (1, 4):
+            batches = list(
+                self.fst.stream_file_system(
+                    self.test_dir, batch_size=16, workers=workers
+                )
+            )
+            assert all(len(batch) <= 16 for batch in batches)
+
+            records = [record for batch in batches for record in batch]
+            seen = set()
+            for record in records:
+                # parents always come before their children
+                assert record["parent"] is None or record["parent"] in seen
+                seen.add(record["path"])
+            assert {r["path"]: r["properties"] for r in records} == dict(
+                graph.nodes(data=True)
+            )
+
+    def test_ingest_stream(self) -> None:
+        sink = InMemorySink()
+        snapshot_file = os.path.join(self.tmp.name, "file_tree.snapshot")
+        tree = self.fst.ingest_stream(
+            self.test_dir,
+            sink,
+            index=True,
+            snapshot_file=snapshot_file,
+            batch_size=16,
+            hash_contents=True,
+        )
+        graph = self.fst.map_file_system(self.test_dir, hash_contents=True)
+
+        assert sink.nodes == dict(graph.nodes(data=True))
+        assert sink.edges == set(graph.edges)
+        assert dict(tree.to_networkx().nodes(data=True)) == dict(graph.nodes(data=True))
+        assert self.fst.index.extension("txt")["total"] == 200
+        with load_snapshot(snapshot_file) as snapshot:
+            assert set(snapshot.to_networkx().edges) == set(graph.edges)
+
+    def test_backpressure(self) -> None:
+        produced = []
+        release = threading.Event()
+
+        def batches():
+            for i in range(100):
+                produced.append(i)
+                yield [i]
+
+        def slow(batch):
+            release.wait(5)
+
+        thread = threading.Thread(target=fan_out, args=(prefetch(batches()), [slow]))
+        thread.start()
+        time.sleep(0.2)
+        # one batch in the consumer, its queue, the prefetch queue and the
+        # prefetch thread's hand
+        assert len(produced) <= 8
+        release.set()
+        thread.join(5)
+        assert len(produced) == 100
+
+    def test_early_stop(self) -> None:
+        stream = self.fst.stream_file_system(self.test_dir, batch_size=4, workers=4)
+        first = next(stream)
+        assert first[0]["path"] == self.test_dir
+        stream.close()
+
+        def failing(batch):
+            raise RuntimeError("store unavailable")
+
+        with self.assertRaises(RuntimeError):
+            fan_out(self.fst.stream_file_system(self.test_dir, batch_size=4), [failing])
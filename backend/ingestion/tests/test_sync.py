@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from server.server.system.fstree import FileSystemTree
+from server.server.system.sink import InMemorySink
+from server.server.system.sync import sync_changes
+
+
+class TestDeltaSync(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(self.test_dir, name))
+            for i in range(10):
+                with open(os.path.join(self.test_dir, name, f"file{i}.txt"), "w") as f:
+                    f.write("data")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.sync_snapshot_file = os.path.join(
+            self.tmp.name, "graph_store.snapshot"
+        )
+        self.sink = InMemorySink()
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def assert_store_matches(self, graph) -> None:
+        assert self.sink.nodes == dict(graph.nodes(data=True))
+        assert self.sink.edges == set(graph.edges)
+
+    def test_sync_writes_only_changes(self) -> None:
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        assert self.fst.sync_graph_store(tree, self.sink) == 1
+        self.assert_store_matches(tree.to_networkx())
+
+        os.remove(os.path.join(self.test_dir, "a", "file3.txt"))
+        os.makedirs(os.path.join(self.test_dir, "c"))
+        self.sink.transactions = 0
+        tree = self.fst.map_file_system(self.test_dir, compact=True)
+        assert self.fst.sync_graph_store(tree, self.sink) == 2
+
+        # one delete batch, one upsert batch and one edge batch
+        assert self.sink.transactions == 3
+        assert self.sink.seqs[os.path.join(self.test_dir, "c")] == 2
+        assert self.sink.seqs[os.path.join(self.test_dir, "b", "file1.txt")] == 1
+        self.assert_store_matches(tree.to_networkx())
+
+        # nothing changed, nothing written
+        self.sink.transactions = 0
+        assert self.fst.sync_graph_store(tree, self.sink) == 2
+        assert self.sink.transactions == 0
+
+    def test_replay_is_idempotent(self) -> None:
+        graph = self.fst.map_file_system(self.test_dir)
+        path = os.path.join(self.test_dir, "a", "file1.txt")
+        changes = {path: {"type": "file", "name": "file1.txt", "size": 4}}
+
+        assert sync_changes(changes, graph, self.sink) == 1
+        # a sync that failed before recording its sequence is simply replayed
+        self.sink.sequence = 0
+        assert sync_changes(changes, graph, self.sink) == 1
+        assert self.sink.nodes[path]["size"] == 4
+
+        self.sink.sequence = 5
+        sync_changes({path: None}, graph, self.sink)
+        assert path not in self.sink.nodes
+
+        # a stale delta cannot bring the node back
+        self.sink.upsert_nodes([{"path": path, "properties": changes[path]}], seq=3)
+        assert path not in self.sink.nodes
+
+    def test_refresh_syncs_changes(self) -> None:
+        self.fst.snapshot_file = os.path.join(self.tmp.name, "file_tree.snapshot")
+        self.fst.cache_file = os.path.join(self.tmp.name, "scan_cache.json")
+        self.fst.sync_graph = True
+        self.fst.watch_changes = False
+        self.fst.graph_sink = lambda: self.sink
+
+        written = []
+        upsert_nodes, delete_nodes = self.sink.upsert_nodes, self.sink.delete_nodes
+        self.sink.upsert_nodes = lambda rows, seq: (
+            written.extend(row["path"] for row in rows),
+            upsert_nodes(rows, seq),
+        )
+        self.sink.delete_nodes = lambda paths, seq=None: (
+            written.extend(paths),
+            delete_nodes(paths, seq),
+        )
+
+        job = self.fst.jobs.submit(self.test_dir)
+        assert job.wait(10) and job.error is None
+        assert len(written) == 23
+        with self.fst.latest_snapshot(self.test_dir) as snapshot:
+            self.assert_store_matches(snapshot.to_networkx())
+
+        removed = os.path.join(self.test_dir, "a", "file3.txt")
+        os.remove(removed)
+        os.makedirs(os.path.join(self.test_dir, "c"))
+        written.clear()
+        job = self.fst.jobs.submit(self.test_dir)
+        assert job.wait(10) and job.error is None
+
+        # only the new directory and the tombstone of the removed file
+        assert sorted(written) == [removed, os.path.join(self.test_dir, "c")]
+        assert self.sink.seqs[removed] == 2 and removed not in self.sink.nodes
+        with self.fst.latest_snapshot(self.test_dir) as snapshot:
+            self.assert_store_matches(snapshot.to_networkx())
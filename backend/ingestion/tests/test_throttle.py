@@ -0,0 +1,99 @@
+import os
+import time
+import tempfile
+import unittest
+from server.server.system.fstree import FileSystemTree
+from server.server.system.throttle import ScanBudget, TokenBucket
+
+
+class LoadedBudget(ScanBudget):
+    def __init__(self, *args, **kwargs):
+        self.busy = 0.0
+        self.share = 0.0
+        super().__init__(*args, adapt_interval=0.0, **kwargs)
+
+    def load(self) -> dict:
+        return {"cpu": self.busy, "iowait": 0.0, "share": self.share}
+
+
+class TestThrottle(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp.name, "root")
+        for i in range(8):
+            os.makedirs(os.path.join(self.test_dir, f"dir{i}"))
+            with open(os.path.join(self.test_dir, f"dir{i}", "file.txt"), "w") as f:
+                f.write("x" * 1000)
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.hash_cache_file = os.path.join(self.tmp.name, "hash_cache.json")
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_token_bucket(self) -> None:
+        bucket = TokenBucket(rate=100, burst=10)
+        start = time.monotonic()
+        waited = sum(bucket.acquire() for _ in range(30))
+        elapsed = time.monotonic() - start
+        assert 0.15 < elapsed < 1.0
+        assert waited > 0
+
+        assert TokenBucket().acquire(1e9) == 0.0
+
+    def test_adapts_to_load(self) -> None:
+        budget = LoadedBudget(1000, 1 << 20, cpu_share=0.5)
+        budget.busy = 95.0
+        for _ in range(3):
+            budget.adapt()
+        assert budget.factor == 0.125
+        assert budget.listings.rate == 125
+
+        budget.busy = 10.0
+        budget.share = 0.9
+        budget.adapt()
+        # the scan itself is over its CPU share
+        assert budget.factor == 0.0625
+
+        budget.share = 0.0
+        for _ in range(20):
+            budget.adapt()
+        assert budget.factor == 1.0
+        assert budget.listings.rate == 1000
+
+    def test_throttled_scan(self) -> None:
+        self.fst.budget = LoadedBudget(listings_per_second=10)
+        start = time.monotonic()
+        graph = self.fst.map_file_system(self.test_dir, workers=4, throttle=True)
+        # 9 listings fit in a burst of 10
+        assert time.monotonic() - start < 0.5
+        assert len(graph) == 17
+
+        self.fst.budget.configure(5, 0, 1.0)
+        start = time.monotonic()
+        self.fst.map_file_system(self.test_dir, workers=4, throttle=True)
+        assert time.monotonic() - start > 0.5
+
+        self.fst.budget = LoadedBudget(bytes_per_second=4000)
+        start = time.monotonic()
+        self.fst.map_file_system(self.test_dir, hash_contents=True, throttle=True)
+        # 8000 bytes, half of them beyond the burst
+        assert time.monotonic() - start > 0.75
+
+        start = time.monotonic()
+        self.fst.map_file_system(self.test_dir, hash_contents=True)
+        assert time.monotonic() - start < 0.5
+
+    def test_configure(self) -> None:
+        config = self.fst.configure({"interval": 30, "listings_per_second": "500"})
+        assert config["interval"] == 30
+        assert config["listings_per_second"] == 500
+        assert self.fst.budget.listings.rate == 500
+        assert self.fst.interval == 30
+
+        invalid_settings = [{"factor": 1}, {"cpu_share": 0}, {"interval": -1}]
+        for invalid in invalid_settings + [{"cpu_share": "x"}]:
+            with self.assertRaises(ValueError):
+                self.fst.configure(invalid)
+        assert self.fst.configuration()["cpu_share"] == 0.25
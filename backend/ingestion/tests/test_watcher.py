@@ -0,0 +1,170 @@
+import os
+import time
+import errno
+import tempfile
+import unittest
+from unittest.mock import patch
+from server.server.system.fstree import FileSystemTree
+from server.server.system.watcher import FileSystemWatcher, Inotify, IN_Q_OVERFLOW
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+class TestFileSystemWatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.test_dir = self.tmp.name
+        os.makedirs(os.path.join(self.test_dir, "docs"))
+        with open(os.path.join(self.test_dir, "docs", "a.txt"), "w") as f:
+            f.write("a")
+
+        self.fst = FileSystemTree("neo4j://localhost:7687", "neo4j", "password")
+        self.fst.cache_file = os.path.join(self.test_dir, "scan_cache.json")
+        self.file_tree = self.fst.map_file_system(self.test_dir)
+
+    def tearDown(self) -> None:
+        self.fst.close()
+        self.tmp.cleanup()
+
+    def test_live_updates(self) -> None:
+        changes = []
+        watcher = self.fst.watch(self.file_tree, self.test_dir, changes.append)
+        try:
+            docs = os.path.join(self.test_dir, "docs")
+            new_dir = os.path.join(self.test_dir, "new")
+            os.makedirs(os.path.join(new_dir, "nested"))
+            with open(os.path.join(new_dir, "nested", "b.txt"), "w") as f:
+                f.write("b")
+            os.rename(os.path.join(docs, "a.txt"), os.path.join(docs, "c.txt"))
+
+            assert wait_for(
+                lambda: self.file_tree.has_node(
+                    os.path.join(new_dir, "nested", "b.txt")
+                )
+                and self.file_tree.has_node(os.path.join(docs, "c.txt"))
+                and not self.file_tree.has_node(os.path.join(docs, "a.txt"))
+            )
+            assert self.file_tree.has_edge(new_dir, os.path.join(new_dir, "nested"))
+            assert self.file_tree.nodes[new_dir]["type"] == "directory"
+
+            os.remove(os.path.join(new_dir, "nested", "b.txt"))
+            os.rmdir(os.path.join(new_dir, "nested"))
+            assert wait_for(
+                lambda: not self.file_tree.has_node(os.path.join(new_dir, "nested"))
+            )
+
+            applied = {}
+            for batch in changes:
+                applied.update(batch)
+            assert applied[os.path.join(docs, "a.txt")] is None
+            assert applied[os.path.join(docs, "c.txt")] == {
+                "type": "file",
+                "name": "c.txt",
+            }
+        finally:
+            watcher.stop()
+
+    def test_renamed_directory_keeps_its_watch(self) -> None:
+        watcher = self.fst.watch(self.file_tree, self.test_dir)
+        try:
+            # the new name sorts before the old one, then after it
+            for old, new in (("docs", "adir"), ("adir", "zdir")):
+                os.rename(
+                    os.path.join(self.test_dir, old), os.path.join(self.test_dir, new)
+                )
+                assert wait_for(
+                    lambda: self.file_tree.has_node(
+                        os.path.join(self.test_dir, new, "a.txt")
+                    )
+                )
+                with open(
+                    os.path.join(self.test_dir, new, f"after-{new}.txt"), "w"
+                ) as f:
+                    f.write("x")
+                path = os.path.join(self.test_dir, new, f"after-{new}.txt")
+                assert wait_for(lambda: self.file_tree.has_node(path))
+        finally:
+            watcher.stop()
+
+    def test_watch_limit_falls_back_to_rescan(self) -> None:
+        error = OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        with patch.object(Inotify, "add_watch", side_effect=error):
+            watcher = FileSystemWatcher(
+                self.file_tree, self.test_dir, scan=self.fst.map_file_system
+            )
+            watcher._watch_tree()
+        assert watcher.degraded
+
+        with open(os.path.join(self.test_dir, "b.txt"), "w") as f:
+            f.write("b")
+        changes = watcher.rescan()
+        watcher.stop()
+
+        assert changes == {
+            os.path.join(self.test_dir, "b.txt"): {"type": "file", "name": "b.txt"}
+        }
+        assert self.file_tree.has_edge(
+            self.test_dir, os.path.join(self.test_dir, "b.txt")
+        )
+
+    def test_queue_overflow_triggers_rescan(self) -> None:
+        watcher = FileSystemWatcher(
+            self.file_tree, self.test_dir, scan=self.fst.map_file_system
+        )
+        watcher._collect([(-1, IN_Q_OVERFLOW, "")])
+        assert watcher.overflowed
+
+        os.remove(os.path.join(self.test_dir, "docs", "a.txt"))
+        watcher.rescan()
+        watcher.stop()
+
+        assert not watcher.overflowed
+        assert not self.file_tree.has_node(os.path.join(self.test_dir, "docs", "a.txt"))
+
+    def test_refresh_keeps_snapshot_current(self) -> None:
+        self.fst.snapshot_file = os.path.join(self.test_dir, "file_tree.snapshot")
+        snapshot_file = self.fst.refresh(self.test_dir)
+        assert list(self.fst.watchers) == [self.test_dir]
+
+        path = os.path.join(self.test_dir, "docs", "b.txt")
+        with open(path, "w") as f:
+            f.write("b")
+
+        def in_snapshot() -> bool:
+            with self.fst.latest_snapshot(self.test_dir) as snapshot:
+                return path in snapshot.nodes
+
+        assert wait_for(in_snapshot)
+        assert self.fst.snapshot_path(self.test_dir) == snapshot_file
+
+        # a later refresh replaces the watcher
+        watcher = self.fst.watchers[self.test_dir]
+        self.fst.refresh(self.test_dir)
+        assert self.fst.watchers[self.test_dir] is not watcher
+
+    def test_fallback_rescan_keeps_its_own_cache(self) -> None:
+        self.fst.hash_contents = True
+        self.fst.hash_cache_file = os.path.join(self.test_dir, "hash_cache.json")
+        self.fst.map_file_system(self.test_dir, incremental=True)
+        cache = self.fst.cache
+        directories = dict(cache.directories)
+
+        watcher = self.fst.watch(self.file_tree, self.test_dir)
+        watcher.stop()
+        with open(os.path.join(self.test_dir, "b.txt"), "w") as f:
+            f.write("b")
+        changes = watcher.rescan()
+
+        # listed, but not hashed
+        assert changes[os.path.join(self.test_dir, "b.txt")] == {
+            "type": "file",
+            "name": "b.txt",
+        }
+        assert self.fst.cache is cache and cache.directories == directories
@@ -1,13 +1,47 @@
 import os
-import uuid
-from pydub import AudioSegment
+import time
+import logging
+from concurrent.futures import TimeoutError
+from typing import Optional
+
+from django.conf import settings
 from django.urls import path
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from model.speech.whisper import Whisper
-
-model = Whisper(os.environ.get("MODEL", "openai/whisper-tiny"))
+from model.speech.audio import AudioDecodeError, decode
+from model.speech.batching import BatchScheduler
+from model.speech.longform import (
+    WINDOW_SECONDS,
+    join,
+    overlap_words,
+    split_windows,
+    stitch,
+)
+from model.speech.registry import READY, ModelRegistry
+from model.speech.vad import detector_from_env
+
+logger = logging.getLogger(__name__)
+
+# loaded on first use, or preloaded by the server before it forks workers
+registry = ModelRegistry(os.environ.get("MODEL", "openai/whisper-tiny"))
+SAMPLING_RATE = int(os.environ.get("SAMPLING_RATE", 16000))
+# concurrent requests share generate calls
+scheduler = BatchScheduler(
+    registry.get,
+    max_batch_size=int(os.environ.get("MAX_BATCH_SIZE", 8)),
+    max_wait=float(os.environ.get("MAX_BATCH_WAIT_MS", 20)) / 1000,
+)
+
+# silence is cut out of streams before they reach the model, unless VAD=0
+vad = detector_from_env()
+# and out of uploads only with UPLOAD_VAD=1: the threshold is absolute, so a
+# quiet recording would come back empty
+upload_vad = vad if os.environ.get("UPLOAD_VAD", "0") == "1" else None
+# seconds an upload may take to transcribe, waiting for batches included
+TRANSCRIBE_TIMEOUT = float(os.environ.get("TRANSCRIBE_TIMEOUT", 120))
+# audio longer than one window is transcribed in windows this far apart
+LONG_FORM_STRIDE = float(os.environ.get("LONG_FORM_STRIDE", 25))
 
 ALLOWED_EXTENSIONS = {"mp3", "wav", "ogg", "m4a", "flac", "webm"}
 
@@ -16,10 +50,49 @@ def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def transcribe_long(clips, sampling_rate: int, timeout: Optional[float] = None) -> str:
+    # every window is queued at once, so they share batches with each other
+    # and with concurrent requests
+    futures = [
+        [
+            scheduler.submit(window, sampling_rate)
+            for window in split_windows(
+                clip, sampling_rate, WINDOW_SECONDS, LONG_FORM_STRIDE
+            )
+        ]
+        for clip in clips
+    ]
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def result(future):
+        if deadline is None:
+            return future.result()
+        return future.result(max(0.0, deadline - time.monotonic()))
+
+    max_overlap = overlap_words(WINDOW_SECONDS, LONG_FORM_STRIDE)
+    try:
+        return join(
+            [
+                stitch([result(future) for future in clip], max_overlap)
+                for clip in futures
+            ]
+        )
+    except TimeoutError:
+        # windows still waiting for a batch are dropped from the queue
+        for clip in futures:
+            for future in clip:
+                future.cancel()
+        raise
+
+
 @csrf_exempt
 def transcribe_audio(request):
     if request.method == "POST":
         if "file" not in request.FILES:
+            # the memory-only upload handler drops files over the limit
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+            if content_length > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                return JsonResponse({"error": "File too large."}, status=413)
             return JsonResponse({"error": "No file provided."}, status=400)
 
         file = request.FILES["file"]
@@ -28,40 +101,69 @@ def transcribe_audio(request):
                 {"error": "Invalid file type. Please upload an audio file."}, status=400
             )
 
-        os.makedirs("media", exist_ok=True)
-
-        # Save the received file
-        filename = f"{uuid.uuid4()}.{file.name.rsplit('.', 1)[1].lower()}"
-        filepath = os.path.join("media", filename)
-
-        with open(filepath, "wb") as f:
-            for chunk in file.chunks():
-                f.write(chunk)
-
-        # Convert the file to .wav format
+        # Decode the upload in memory to float32 mono samples
         input_format = file.name.rsplit(".", 1)[1].lower()
-        if input_format != "wav":
-            wav_filename = f"{uuid.uuid4()}.wav"
-            wav_filepath = os.path.join("media", wav_filename)
-            sound = AudioSegment.from_file(filepath, format=input_format)
-            sound.export(wav_filepath, format="wav")
-            os.remove(filepath)  # Remove the original file
+        try:
+            audio = decode(file.read(), input_format, SAMPLING_RATE)
+        except AudioDecodeError as e:
+            return JsonResponse({"error": f"Could not decode audio: {e}"}, status=400)
+
+        # Only the speech goes to the model, cut at pauses into clips that fit
+        # its window
+        if upload_vad is not None:
+            clips = upload_vad.split(audio, SAMPLING_RATE, WINDOW_SECONDS)
         else:
-            wav_filepath = filepath
+            clips = [audio]
+        if not clips:
+            # no speech found, the model did not run
+            return JsonResponse({"transcription": [""], "vad_skipped": True})
 
         # Call the transcription function
-        # transcription = transcribe(wav_filepath)
-        transcription = model.transcribe(wav_filepath)
-
-        # Remove the .wav file
-        os.remove(wav_filepath)
-
-        return JsonResponse({"transcription": transcription})
+        try:
+            transcription = [transcribe_long(clips, SAMPLING_RATE, TRANSCRIBE_TIMEOUT)]
+        except TimeoutError:
+            return JsonResponse({"error": "Transcription timed out."}, status=504)
+        except Exception as e:
+            if registry.entry().state != READY:
+                return JsonResponse({"error": f"Model unavailable: {e}"}, status=503)
+            logger.exception("transcription failed")
+            return JsonResponse({"error": f"Transcription failed: {e}"}, status=500)
+
+        return JsonResponse({"transcription": transcription, "vad_skipped": False})
     else:
         return JsonResponse({"error": "Invalid request method. Use POST."}, status=405)
 
 
+def readiness(request):
+    """
+    200 once the model is loaded and warmed up in this worker, 503 until then.
+    The first check starts loading in the background.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request method. Use GET."}, status=405)
+
+    if not registry.ready():
+        registry.load_async()
+    status = registry.status()
+    return JsonResponse(status, status=200 if status["state"] == "ready" else 503)
+
+
+def metrics(request):
+    """
+    Batch sizes and time spent queued for a batch in this worker, and the
+    audio that voice activity detection kept from the model.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request method. Use GET."}, status=405)
+    metrics = scheduler.metrics.to_dict()
+    if vad is not None:
+        metrics["vad"] = vad.metrics.to_dict()
+    return JsonResponse(metrics)
+
+
 def get_urlpatterns():
     return [
         path("transcribe/", transcribe_audio, name="transcribe"),
+        path("ready/", readiness, name="ready"),
+        path("metrics/", metrics, name="metrics"),
     ]
@@ -0,0 +1,279 @@
+"""
+Streaming transcription over a WebSocket.
+
+A client connects to /ws/transcribe/?format=pcm16&rate=16000 and sends audio
+as binary messages while the user speaks: 16-bit or float32 little-endian
+mono PCM (format=pcm16 or f32) at the given rate, or WebM or Ogg Opus as a
+browser's MediaRecorder produces it (format=webm or ogg), decoded by ffmpeg.
+The server answers on the same connection with JSON messages,
+
+    {"type": "partial", "text": "turn on the", "start": 0.0, "end": 1.0}
+    {"type": "final", "text": "Turn on the lights.", "start": 0.0, "end": 1.9}
+
+partials as the audio comes in and a final one after every pause. The client
+sends {"type": "end"} when it is done; the server sends the last final
+transcript and closes the connection.
+
+The audio goes through a StreamingTranscriber per connection, whose
+inferences run through the shared BatchScheduler and so batch with other
+streams and uploads. At most max_connections streams run at once, further
+ones are closed with 1013. When audio arrives faster than it is transcribed,
+the server stops reading the socket until the lag is back under max_lag
+seconds, which pushes back on the client through TCP, and closes a stream
+that stays behind for lag_timeout seconds. A partial that is waiting to be
+sent is replaced by a newer one rather than queued behind it.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from model.speech.audio import SAMPLING_RATE, AudioDecodeError, StreamDecoder
+from model.speech.batching import BatchScheduler
+from model.speech.streaming import QueueSource, StreamingTranscriber, Transcript
+from model.speech.vad import VoiceActivityDetector
+
+from .speech import scheduler, vad
+
+logger = logging.getLogger(__name__)
+
+PATH = "/ws/transcribe/"
+
+PCM_FORMATS = {"pcm16": np.int16, "f32": np.float32}
+CONTAINER_FORMATS = {"webm", "ogg"}
+
+
+class ScheduledModel(object):
+    """Runs a transcriber's inferences through a BatchScheduler."""
+
+    def __init__(self, scheduler: BatchScheduler):
+        self.scheduler = scheduler
+
+    def speech_to_text(self, audio: np.ndarray, sampling_rate: int):
+        return [self.scheduler.transcribe(audio, sampling_rate)]
+
+
+def to_samples(data: bytes, format: str, remainder: bytes) -> Tuple[np.ndarray, bytes]:
+    """Float32 samples of a PCM message, and the bytes of a sample cut in two."""
+    dtype = np.dtype(PCM_FORMATS[format])
+    data = remainder + data
+    usable = len(data) - len(data) % dtype.itemsize
+    samples = np.frombuffer(data[:usable], dtype=dtype.newbyteorder("<"))
+    if dtype == np.int16:
+        samples = samples.astype(np.float32) / 32768.0
+    return samples.astype(np.float32, copy=False), data[usable:]
+
+
+class _Outbox(object):
+    """Events waiting to be sent, None once the transcriber is done."""
+
+    def __init__(self):
+        self.events = deque()
+        self.ready = asyncio.Event()
+
+    def put(self, event: Union[Transcript, Exception, None]) -> None:
+        last = self.events[-1] if self.events else None
+        if (
+            isinstance(event, Transcript)
+            and isinstance(last, Transcript)
+            and not last.final
+        ):
+            # the client has not been sent that partial yet, it is out of date
+            self.events[-1] = event
+        else:
+            self.events.append(event)
+        self.ready.set()
+
+    async def get(self) -> Union[Transcript, Exception, None]:
+        while not self.events:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.events.popleft()
+
+
+class TranscriptionSocket(object):
+    def __init__(
+        self,
+        model,
+        vad: Optional[VoiceActivityDetector] = None,
+        max_connections: int = 4,
+        max_lag: float = 5.0,
+        lag_timeout: float = 10.0,
+        step: float = 1.0,
+        max_segment: float = 10.0,
+    ):
+        # anything with speech_to_text(clips, sampling_rate)
+        self.model = model
+        self.vad = vad
+        self.max_connections = max_connections
+        self.max_lag = max_lag
+        self.lag_timeout = lag_timeout
+        self.step = step
+        self.max_segment = max_segment
+        self.connections = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        params = parse_qs(scope.get("query_string", b"").decode())
+        format = params.get("format", ["pcm16"])[0]
+        try:
+            rate = int(params.get("rate", [SAMPLING_RATE])[0])
+        except ValueError:
+            rate = 0
+
+        await send({"type": "websocket.accept"})
+        if format not in PCM_FORMATS and format not in CONTAINER_FORMATS or rate <= 0:
+            await self._close(send, 1003, f"Unsupported format {format} at {rate} Hz.")
+            return
+        if self.connections >= self.max_connections:
+            await self._close(send, 1013, "Too many streams, try again later.")
+            return
+
+        self.connections += 1
+        try:
+            await self._stream(receive, send, format, rate)
+        finally:
+            self.connections -= 1
+
+    async def _close(self, send, code: int, error: Optional[str] = None) -> None:
+        if error is not None:
+            await send(
+                {
+                    "type": "websocket.send",
+                    "text": json.dumps({"type": "error", "error": error}),
+                }
+            )
+        await send({"type": "websocket.close", "code": code})
+
+    async def _stream(self, receive, send, format: str, rate: int) -> None:
+        loop = asyncio.get_running_loop()
+        source = QueueSource()
+        decoder = None
+        if format in CONTAINER_FORMATS:
+            try:
+                decoder = StreamDecoder(format, source.put, SAMPLING_RATE)
+            except AudioDecodeError as e:
+                await self._close(send, 1011, str(e))
+                return
+            rate = SAMPLING_RATE
+
+        transcriber = StreamingTranscriber(
+            self.model,
+            source,
+            rate,
+            step=self.step,
+            max_segment=self.max_segment,
+            vad=self.vad,
+        )
+        outbox = _Outbox()
+        closed = threading.Event()
+
+        def deliver(event: Union[Transcript, Exception, None]) -> None:
+            # an inference still running when the connection closed has
+            # nowhere to go
+            if not closed.is_set():
+                loop.call_soon_threadsafe(outbox.put, event)
+
+        def run() -> None:
+            try:
+                transcriber.run(deliver)
+            except Exception as e:
+                logger.exception("stream failed")
+                deliver(e)
+            finally:
+                deliver(None)
+
+        threading.Thread(target=run, name="stream", daemon=True).start()
+        sender = asyncio.create_task(self._send_events(outbox, send))
+
+        remainder = b""
+        try:
+            while not sender.done():
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+
+                if message.get("text") is not None:
+                    try:
+                        ended = json.loads(message["text"]).get("type") == "end"
+                    except (ValueError, AttributeError):
+                        ended = False
+                    if ended:
+                        break
+                    continue
+
+                data = message.get("bytes") or b""
+                if decoder is not None:
+                    await loop.run_in_executor(None, decoder.feed, data)
+                else:
+                    samples, remainder = to_samples(data, format, remainder)
+                    source.put(samples)
+
+                if not await self._catch_up(transcriber, source, rate):
+                    await self._close(
+                        send, 1013, "Audio is arriving faster than it is transcribed."
+                    )
+                    return
+
+            if decoder is not None:
+                await loop.run_in_executor(None, decoder.close)
+            source.end()
+            # the last final transcript is sent before the connection closes
+            if await sender:
+                await self._close(send, 1000)
+        except AudioDecodeError as e:
+            await self._close(send, 1007, f"Could not decode audio: {e}")
+        finally:
+            closed.set()
+            transcriber.stop()
+            sender.cancel()
+            if decoder is not None and decoder.process.poll() is None:
+                decoder.process.kill()
+
+    async def _catch_up(
+        self, transcriber: StreamingTranscriber, source: QueueSource, rate: int
+    ) -> bool:
+        # not reading the socket while behind makes the client wait
+        deadline = asyncio.get_running_loop().time() + self.lag_timeout
+        while (source.samples - transcriber.transcribed) / rate > self.max_lag:
+            if asyncio.get_running_loop().time() > deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def _send_events(self, outbox: _Outbox, send) -> bool:
+        """Send events until the transcriber is done, False if it failed."""
+        while True:
+            event = await outbox.get()
+            if event is None:
+                return True
+            if isinstance(event, Exception):
+                await self._close(send, 1011, f"Transcription failed: {event}")
+                return False
+            message = {
+                "type": "final" if event.final else "partial",
+                "text": event.text.strip(),
+                "start": round(event.start, 3),
+                "end": round(event.end, 3),
+            }
+            await send({"type": "websocket.send", "text": json.dumps(message)})
+
+
+# the streams share the scheduler of the upload endpoint and the VAD detector
+transcription_socket = TranscriptionSocket(
+    ScheduledModel(scheduler),
+    vad=vad,
+    max_connections=int(os.environ.get("MAX_STREAMS", 4)),
+    max_lag=float(os.environ.get("MAX_STREAM_LAG", 5)),
+    step=float(os.environ.get("STREAM_STEP", 1)),
+)
@@ -2,6 +2,8 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django, WebSocket connections to /ws/transcribe/ to the
+streaming transcription endpoint.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +15,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once Django is set up, it shares the views' model and scheduler
+from backend.api import stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        if scope["path"] == stream.PATH:
+            await stream.transcription_socket(scope, receive, send)
+        else:
+            # closing before accepting rejects the handshake with a 403
+            await receive()
+            await send({"type": "websocket.close", "code": 1000})
+        return
+    await django_application(scope, receive, send)
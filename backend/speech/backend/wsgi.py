@@ -16,9 +16,16 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 application = get_wsgi_application()
 
+if os.environ.get("PRELOAD_MODEL", "0") == "1":
+    # under gunicorn --preload this runs in the master, and the forked workers
+    # share the weights
+    from backend.api.speech import registry
+
+    registry.preload()
+
 
 def shutdown_handler():
-    shutil.rmtree("media/")
+    shutil.rmtree("media/", ignore_errors=True)
 
 
 atexit.register(shutdown_handler)
@@ -0,0 +1,163 @@
+"""
+In-memory audio decoding.
+
+decode turns the bytes of an upload into the float32 mono array at 16 kHz
+that Whisper's processor expects, without touching the disk. WAV, FLAC and
+Ogg are read by soundfile straight from a BytesIO, then downmixed and
+resampled with a polyphase filter. Everything else (mp3, m4a, webm) is piped
+through ffmpeg, which decodes, downmixes and resamples in one pass and writes
+raw float32 samples to stdout.
+
+StreamDecoder does the same for a stream whose bytes arrive over time, like
+the WebM or Ogg Opus chunks a browser's MediaRecorder produces, through one
+ffmpeg process that lives as long as the stream.
+"""
+
+import io
+import subprocess
+import threading
+from math import gcd
+from typing import Callable
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+SAMPLING_RATE = 16000
+
+SOUNDFILE_FORMATS = {"wav", "flac", "ogg"}
+
+
+class AudioDecodeError(ValueError):
+    pass
+
+
+def to_mono(data: np.ndarray) -> np.ndarray:
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    return data.astype(np.float32, copy=False)
+
+
+def resample(
+    data: np.ndarray, rate: int, target_rate: int = SAMPLING_RATE
+) -> np.ndarray:
+    if rate == target_rate:
+        return data
+    divisor = gcd(rate, target_rate)
+    return resample_poly(data, target_rate // divisor, rate // divisor).astype(
+        np.float32, copy=False
+    )
+
+
+def decode_ffmpeg(buffer: bytes, target_rate: int = SAMPLING_RATE) -> np.ndarray:
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-nostdin",
+                "-loglevel",
+                "error",
+                "-i",
+                "pipe:0",
+                "-f",
+                "f32le",
+                "-ac",
+                "1",
+                "-ar",
+                str(target_rate),
+                "pipe:1",
+            ],
+            input=buffer,
+            capture_output=True,
+            check=True,
+        )
+    except FileNotFoundError:
+        raise AudioDecodeError("ffmpeg is not installed")
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(
+            e.stderr.decode(errors="replace").strip() or "ffmpeg failed"
+        )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def decode(buffer: bytes, format: str, target_rate: int = SAMPLING_RATE) -> np.ndarray:
+    """Decode an encoded audio buffer to float32 mono samples at target_rate."""
+    if format in SOUNDFILE_FORMATS:
+        try:
+            data, rate = sf.read(io.BytesIO(buffer), dtype="float32", always_2d=False)
+        except RuntimeError:
+            # encodings libsndfile does not know, ffmpeg gets a try
+            return decode_ffmpeg(buffer, target_rate)
+        return resample(to_mono(data), rate, target_rate)
+
+    return decode_ffmpeg(buffer, target_rate)
+
+
+class StreamDecoder(object):
+    """Decodes a container stream as it arrives, handing samples to on_samples."""
+
+    def __init__(
+        self,
+        format: str,
+        on_samples: Callable[[np.ndarray], None],
+        target_rate: int = SAMPLING_RATE,
+        block: int = 4096,
+    ):
+        self.on_samples = on_samples
+        self.block = block
+        try:
+            self.process = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-nostdin",
+                    "-loglevel",
+                    "error",
+                    "-f",
+                    format,
+                    "-i",
+                    "pipe:0",
+                    "-f",
+                    "f32le",
+                    "-ac",
+                    "1",
+                    "-ar",
+                    str(target_rate),
+                    "pipe:1",
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            raise AudioDecodeError("ffmpeg is not installed")
+        self._thread = threading.Thread(target=self._read, name="ffmpeg", daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        remainder = b""
+        while True:
+            data = self.process.stdout.read1(4 * self.block)
+            if not data:
+                break
+            # ffmpeg's writes need not end on a sample boundary
+            data = remainder + data
+            usable = len(data) - len(data) % 4
+            remainder = data[usable:]
+            if usable:
+                self.on_samples(np.frombuffer(data[:usable], dtype=np.float32))
+
+    def feed(self, buffer: bytes) -> None:
+        try:
+            self.process.stdin.write(buffer)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            raise AudioDecodeError("ffmpeg stopped decoding the stream")
+
+    def close(self) -> None:
+        """Decode what is left, returns once every sample was handed over."""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._thread.join()
+        self.process.wait()
@@ -0,0 +1,165 @@
+"""
+Micro-batching of concurrent transcriptions.
+
+A request on its own runs generate on a batch of one, which leaves most of
+the CPU idle while other requests wait for their turn. A BatchScheduler queues
+clips from all request threads; its worker takes the first one, then keeps
+collecting until the batch is max_batch_size clips or max_wait seconds have
+passed since that first clip arrived, and runs the whole batch through one
+speech_to_text call. The processor pads every clip to Whisper's 30-second
+window, so any clips sampled at the same rate batch together. Each caller
+gets its own transcript back through a Future; one cancelled while it is still
+queued is left out of its batch.
+
+The worker thread is started on first use in each process, so a scheduler
+created before a server forks its workers still runs in every worker.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _Request(object):
+    __slots__ = ("audio", "sampling_rate", "future", "queued")
+
+    def __init__(self, audio: np.ndarray, sampling_rate: int):
+        self.audio = audio
+        self.sampling_rate = sampling_rate
+        self.future = Future()
+        self.queued = time.monotonic()
+
+
+class BatchMetrics(object):
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.sizes = {}
+        self.queued_seconds = 0.0
+        self.max_queued_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, queued: List[float], inference_seconds: float) -> None:
+        with self.lock:
+            self.batches += 1
+            self.requests += len(queued)
+            self.sizes[len(queued)] = self.sizes.get(len(queued), 0) + 1
+            self.queued_seconds += sum(queued)
+            self.max_queued_seconds = max(self.max_queued_seconds, max(queued))
+            self.inference_seconds += inference_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "batch_sizes": dict(sorted(self.sizes.items())),
+                "mean_batch_size": (
+                    self.requests / self.batches if self.batches else 0.0
+                ),
+                "mean_queued_ms": (
+                    1000 * self.queued_seconds / self.requests if self.requests else 0.0
+                ),
+                "max_queued_ms": 1000 * self.max_queued_seconds,
+                "inference_seconds": self.inference_seconds,
+            }
+
+
+class BatchScheduler(object):
+    def __init__(
+        self,
+        get_model: Callable[[], Any],
+        max_batch_size: int = 8,
+        max_wait: float = 0.02,
+    ):
+        # called from the worker, so the model can be loaded lazily
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.metrics = BatchMetrics()
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._pid = None
+        self._thread = None
+
+    def submit(self, audio: np.ndarray, sampling_rate: int) -> Future:
+        request = _Request(audio, sampling_rate)
+        with self._condition:
+            self._start()
+            self._pending.append(request)
+            self._condition.notify()
+        return request.future
+
+    def transcribe(self, audio: np.ndarray, sampling_rate: int) -> str:
+        return self.submit(audio, sampling_rate).result()
+
+    def _start(self) -> None:
+        # threads do not survive a fork, each process starts its own worker
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="batching", daemon=True)
+        self._thread.start()
+
+    def _next_batch(self) -> List[_Request]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            first = self._pending.popleft()
+            batch = [first]
+            deadline = first.queued + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                # clips at another rate wait for a batch of their own
+                matching = [
+                    request
+                    for request in self._pending
+                    if request.sampling_rate == first.sampling_rate
+                ]
+                for request in matching[: self.max_batch_size - len(batch)]:
+                    self._pending.remove(request)
+                    batch.append(request)
+
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # requests cancelled while they were queued, e.g. after a timeout
+            batch = [
+                request
+                for request in self._next_batch()
+                if request.future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                transcripts = self.get_model().speech_to_text(
+                    [request.audio for request in batch], batch[0].sampling_rate
+                )
+            except Exception as e:
+                logger.exception("batch of %d failed", len(batch))
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self.metrics.record(
+                [started - request.queued for request in batch],
+                time.monotonic() - started,
+            )
+            for request, transcript in zip(batch, transcripts):
+                request.future.set_result(transcript)
@@ -0,0 +1,107 @@
+"""
+Long-form transcription with overlapping windows.
+
+Whisper sees at most 30 seconds of audio, anything after that is cut off by
+the feature extractor. split_windows cuts longer audio into windows of that
+length, starting stride seconds apart, so consecutive windows overlap by
+window - stride seconds. The windows are independent, so they go through
+generate as one batch (or through the BatchScheduler alongside other
+requests) instead of one after another.
+
+The words spoken in an overlap appear at the end of one transcript and the
+start of the next. stitch finds the alignment of the two where the most words
+agree and keeps the first half of the overlap from the left transcript and
+the second half from the right one, away from the window edges where words
+are cut in two. The search is bounded by overlap_words, the most words an
+overlap can hold at a brisk speaking rate, so it stays linear in the length
+of the audio.
+"""
+
+import math
+import string
+from typing import List, Optional
+
+import numpy as np
+
+WINDOW_SECONDS = 30.0
+STRIDE_SECONDS = 25.0
+# fast speech, conversational English is closer to 2.5
+WORDS_PER_SECOND = 3.0
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+def split_windows(
+    audio: np.ndarray,
+    sampling_rate: int,
+    window: float = WINDOW_SECONDS,
+    stride: float = STRIDE_SECONDS,
+) -> List[np.ndarray]:
+    """Views of audio, window seconds long and stride seconds apart."""
+    if not 0 < stride <= window:
+        raise ValueError(f"stride must be in (0, {window}], got {stride}")
+
+    window_length = int(window * sampling_rate)
+    stride_length = int(stride * sampling_rate)
+    windows = []
+    start = 0
+    while True:
+        windows.append(audio[start : start + window_length])
+        if start + window_length >= len(audio):
+            break
+        start += stride_length
+    return windows
+
+
+def overlap_words(
+    window: float = WINDOW_SECONDS, stride: float = STRIDE_SECONDS
+) -> int:
+    """The most words spoken in the overlap of two consecutive windows."""
+    return math.ceil((window - stride) * WORDS_PER_SECOND)
+
+
+def _normalize(word: str) -> str:
+    return word.lower().translate(_PUNCTUATION)
+
+
+def merge(
+    left: List[str], right: List[str], max_overlap: Optional[int] = None
+) -> List[str]:
+    """Join two word lists, dropping the words they share at the seam."""
+    limit = min(len(left), len(right))
+    if max_overlap is not None:
+        limit = min(limit, max_overlap)
+    tail = [_normalize(word) for word in left[len(left) - limit :]]
+    head = [_normalize(word) for word in right[:limit]]
+
+    best, overlap = (0, 0.0), 0
+    for length in range(1, limit + 1):
+        matches = sum(a == b for a, b in zip(tail[limit - length :], head[:length]))
+        # more than half of the aligned words have to agree
+        if 2 * matches <= length:
+            continue
+        score = (matches, matches / length)
+        if score > best:
+            best, overlap = score, length
+
+    if not overlap:
+        return left + right
+    middle = overlap // 2
+    return left[: len(left) - overlap + middle] + right[middle:]
+
+
+def join(transcripts: List[str]) -> str:
+    """Join the transcripts of clips cut apart at pauses."""
+    if len(transcripts) == 1:
+        return transcripts[0]
+    return " ".join(text.strip() for text in transcripts if text.strip())
+
+
+def stitch(transcripts: List[str], max_overlap: Optional[int] = None) -> str:
+    """Join the transcripts of consecutive overlapping windows."""
+    if len(transcripts) == 1:
+        return transcripts[0]
+    words = []
+    for transcript in transcripts:
+        words = merge(words, transcript.split(), max_overlap)
+    return " ".join(words)
@@ -1,4 +1,4 @@
-from whisper import Whisper
+from .whisper import Whisper
 
 
 def main():
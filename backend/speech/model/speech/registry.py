@@ -0,0 +1,148 @@
+"""
+Shared, lazily loaded speech models.
+
+Loading Whisper downloads and deserializes the processor and the weights,
+which takes seconds and hundreds of megabytes per copy. The registry loads
+each model once per process: on first use, on a background thread started by
+the readiness check, or ahead of time with preload().
+
+Preloading in a server's master process before it forks its workers
+(gunicorn --preload) lets every worker share the weights copy-on-write. The
+model only runs in eval mode under torch.inference_mode, so nothing writes to
+the weight tensors, and gc.freeze() moves the loaded objects out of the
+collector's reach so collections in the workers do not dirty their pages.
+
+A model is ready in a process once it has run a warmup inference there. The
+warmup is skipped when preloading, since thread pools started before a fork
+do not survive it, and each worker warms up on its own instead. Load and
+warmup times are recorded, so cold starts are explicit.
+"""
+
+import gc
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+UNLOADED = "unloaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+def load_whisper(name: str):
+    # imported on first load, importing torch and transformers is slow too
+    from .whisper import Whisper
+
+    return Whisper(name)
+
+
+class ModelEntry(object):
+    def __init__(self, name: str, factory: Callable[[str], Any]):
+        self.name = name
+        self.factory = factory
+        self.model = None
+        self.error = None
+        self.loading = False
+        self.load_seconds = None
+        self.warmup_seconds = None
+        # the process the model was warmed up in, forked workers warm up again
+        self.warm_pid = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.model is not None and self.warm_pid == os.getpid():
+            return READY
+        if self.loading:
+            return LOADING
+        if self.error is not None:
+            return FAILED
+        return UNLOADED
+
+    def load(self, warmup: bool = True):
+        if self.model is not None and (not warmup or self.warm_pid == os.getpid()):
+            return self.model
+
+        with self.lock:
+            self.loading = True
+            try:
+                if self.model is None:
+                    start = time.monotonic()
+                    self.model = self.factory(self.name)
+                    self.load_seconds = time.monotonic() - start
+                    logger.info("loaded %s in %.2fs", self.name, self.load_seconds)
+
+                if warmup and self.warm_pid != os.getpid():
+                    start = time.monotonic()
+                    self.model.warmup()
+                    self.warmup_seconds = time.monotonic() - start
+                    self.warm_pid = os.getpid()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+                raise
+            finally:
+                self.loading = False
+
+        return self.model
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.name,
+            "state": self.state,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+            "pid": os.getpid(),
+        }
+
+
+class ModelRegistry(object):
+    def __init__(self, default: str, factory: Callable[[str], Any] = load_whisper):
+        self.default = default
+        self.factory = factory
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def entry(self, name: Optional[str] = None) -> ModelEntry:
+        name = name or self.default
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._entries[name] = ModelEntry(name, self.factory)
+            return entry
+
+    def get(self, name: Optional[str] = None):
+        """The model, loading and warming it up on first use in this process."""
+        return self.entry(name).load()
+
+    def load_async(self, name: Optional[str] = None) -> None:
+        entry = self.entry(name)
+        if entry.state in (UNLOADED, FAILED):
+            entry.loading = True
+            thread = threading.Thread(target=self._load, args=(entry,), daemon=True)
+            thread.start()
+
+    def _load(self, entry: ModelEntry) -> None:
+        try:
+            entry.load()
+        except Exception:
+            logger.exception("loading %s failed", entry.name)
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> None:
+        """Load models before the server forks its workers."""
+        for name in names or [self.default]:
+            self.entry(name).load(warmup=False)
+        # keep the collector from touching, and so copying, the shared pages
+        gc.collect()
+        gc.freeze()
+
+    def ready(self, name: Optional[str] = None) -> bool:
+        return self.entry(name).state == READY
+
+    def status(self, name: Optional[str] = None) -> Dict[str, Any]:
+        return self.entry(name).to_dict()
@@ -0,0 +1,349 @@
+"""
+Streaming live transcription.
+
+An audio source is any iterable of float32 mono chunks: MicrophoneSource
+reads PortAudio through pyaudio, FileSource plays back a recording at real
+time and stands in for a microphone in tests, and QueueSource yields what
+another thread puts in, like the frames of a WebSocket. A reader thread puts the chunks
+on a queue; the transcriber blocks on that queue, so it sleeps while nothing
+arrives, and copies them into a preallocated ring buffer.
+
+Every step seconds of new audio, the current segment (everything since the
+last finalized transcript) is transcribed again and reported as a partial
+transcript. Once the segment reaches max_segment seconds, or the source ends,
+its last transcript is reported as final and the next segment starts. Events
+go to a callback, or are read with ``async for event in transcriber.events()``.
+
+The ring buffer holds two segments. When inference falls further behind than
+that, the audio the buffer no longer holds is dropped: the segment moves up to
+the oldest sample still held, so timestamps stay right, and the loss is
+logged and counted in dropped.
+
+With a VoiceActivityDetector, only the speech in a segment is transcribed,
+a segment without speech is dropped without running the model, and a pause
+after speech finalizes the segment right away instead of at max_segment.
+"""
+
+import queue
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Callable, Iterable, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from .audio import SAMPLING_RATE, decode
+from .vad import VoiceActivityDetector
+
+logger = logging.getLogger(__name__)
+
+
+class Transcript(NamedTuple):
+    text: str
+    final: bool
+    # seconds since the start of the stream
+    start: float
+    end: float
+
+
+class RingBuffer(object):
+    """The last capacity samples of a stream, addressed by absolute position."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float32)
+        # samples written so far, the position after the newest sample
+        self.end = 0
+
+    @property
+    def start(self) -> int:
+        return max(0, self.end - self.capacity)
+
+    def write(self, samples: np.ndarray) -> None:
+        if len(samples) > self.capacity:
+            self.end += len(samples) - self.capacity
+            samples = samples[-self.capacity :]
+        i = self.end % self.capacity
+        first = min(len(samples), self.capacity - i)
+        self.data[i : i + first] = samples[:first]
+        self.data[: len(samples) - first] = samples[first:]
+        self.end += len(samples)
+
+    def read(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Samples from start to end, or from the oldest one still held."""
+        end = self.end if end is None else min(end, self.end)
+        start = max(start, self.start)
+        if start >= end:
+            return np.zeros(0, dtype=np.float32)
+        i = start % self.capacity
+        j = i + end - start
+        if j <= self.capacity:
+            return self.data[i:j].copy()
+        return np.concatenate((self.data[i:], self.data[: j - self.capacity]))
+
+
+class FileSource(object):
+    """Plays back a recording in chunks, like a microphone would."""
+
+    def __init__(
+        self,
+        audio: np.ndarray,
+        sampling_rate: int = SAMPLING_RATE,
+        chunk_seconds: float = 0.1,
+        realtime: bool = True,
+    ):
+        self.audio = audio
+        self.chunk = max(1, int(chunk_seconds * sampling_rate))
+        self.chunk_seconds = self.chunk / sampling_rate
+        self.realtime = realtime
+        self._closed = threading.Event()
+
+    @classmethod
+    def from_file(cls, file_path: str, sampling_rate: int = SAMPLING_RATE, **kwargs):
+        with open(file_path, "rb") as f:
+            buffer = f.read()
+        format = file_path.rsplit(".", 1)[-1].lower()
+        return cls(decode(buffer, format, sampling_rate), sampling_rate, **kwargs)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for i in range(0, len(self.audio), self.chunk):
+            # waiting on the event sleeps just like a blocking read
+            if self.realtime and self._closed.wait(self.chunk_seconds):
+                return
+            if self._closed.is_set():
+                return
+            yield self.audio[i : i + self.chunk]
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+class MicrophoneSource(object):
+    """16-bit PortAudio input, read with blocking reads."""
+
+    def __init__(self, sampling_rate: int = SAMPLING_RATE, chunk: int = 1024):
+        self.sampling_rate = sampling_rate
+        self.chunk = chunk
+        self._closed = threading.Event()
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        # imported here, servers that only stream from clients need no PortAudio
+        import pyaudio
+
+        audio = pyaudio.PyAudio()
+        stream = audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sampling_rate,
+            input=True,
+            frames_per_buffer=self.chunk,
+        )
+        try:
+            while not self._closed.is_set():
+                try:
+                    data = stream.read(self.chunk, exception_on_overflow=False)
+                except OSError as e:
+                    if e.errno == -9981:
+                        logger.warning("input overflowed, skipping")
+                        continue
+                    raise
+                yield np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+        finally:
+            stream.stop_stream()
+            stream.close()
+            audio.terminate()
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+class QueueSource(object):
+    """Chunks pushed by another thread, e.g. from a network connection."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        # samples put so far
+        self.samples = 0
+
+    def put(self, chunk: np.ndarray) -> None:
+        self.samples += len(chunk)
+        self._queue.put(chunk)
+
+    def end(self) -> None:
+        self._queue.put(None)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    close = end
+
+
+class StreamingTranscriber(object):
+    def __init__(
+        self,
+        model,
+        source: Iterable[np.ndarray],
+        sampling_rate: int = SAMPLING_RATE,
+        step: float = 1.0,
+        max_segment: float = 10.0,
+        vad: Optional[VoiceActivityDetector] = None,
+    ):
+        # anything with speech_to_text(clips, sampling_rate)
+        self.model = model
+        self.source = source
+        self.sampling_rate = sampling_rate
+        self.step = int(step * sampling_rate)
+        self.max_segment = int(max_segment * sampling_rate)
+        self.vad = vad
+        if vad is not None:
+            self._pause = int(vad.min_silence * sampling_rate)
+            self._onset = int((vad.min_speech + vad.padding) * sampling_rate)
+        # room for a segment that grew while an inference was running
+        self.buffer = RingBuffer(2 * self.max_segment)
+        # samples overwritten before they were transcribed
+        self.dropped = 0
+        # samples of the stream that were transcribed, skipped or dropped
+        self.transcribed = 0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+
+    def _read(self) -> None:
+        try:
+            for chunk in self.source:
+                if self._stopped.is_set():
+                    break
+                self._queue.put(chunk)
+        except Exception:
+            logger.exception("audio source failed")
+        finally:
+            self._queue.put(None)
+
+    def _transcribe(self, audio: np.ndarray, start: int, end: int) -> Transcript:
+        text = (
+            self.model.speech_to_text(audio, self.sampling_rate)[0]
+            if len(audio)
+            else ""
+        )
+        return Transcript(
+            text, False, start / self.sampling_rate, end / self.sampling_rate
+        )
+
+    def run(self, on_event: Callable[[Transcript], None]) -> None:
+        """Transcribe until the source ends or stop() is called."""
+        reader = threading.Thread(target=self._read, name="audio-source", daemon=True)
+        reader.start()
+
+        segment = self.transcribed = 0
+        partial = None
+        ended = False
+        while not ended:
+            # blocks, nothing runs until audio arrives
+            chunk = self._queue.get()
+            chunks = [chunk]
+            # catch up on everything that arrived during the last inference
+            while chunk is not None:
+                try:
+                    chunk = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                chunks.append(chunk)
+            for chunk in chunks:
+                if chunk is None:
+                    ended = True
+                    break
+                self.buffer.write(chunk)
+            if self._stopped.is_set():
+                break
+
+            if segment < self.buffer.start:
+                # inference fell behind by more than the buffer holds
+                lost = self.buffer.start - segment
+                self.dropped += lost
+                logger.warning(
+                    "transcription is behind, dropped %.1f s of audio",
+                    lost / self.sampling_rate,
+                )
+                segment = self.buffer.start
+                self.transcribed = max(self.transcribed, segment)
+                partial = None
+
+            end = self.buffer.end
+            final = ended or end - segment >= self.max_segment
+            if not final and end - self.transcribed < self.step:
+                continue
+
+            audio = self.buffer.read(segment, end)
+            start, stop = 0, len(audio)
+            if self.vad is not None:
+                speech = self.vad.segments(audio, self.sampling_rate)
+                if not speech:
+                    # nothing said, no inference; only a tail that may hold
+                    # the onset of speech is kept
+                    keep = max(segment, end - self._onset)
+                    if keep > segment:
+                        self.vad.metrics.record(keep - segment, 0, self.sampling_rate)
+                    segment, self.transcribed = keep, end
+                    partial = None
+                    continue
+                start, stop = speech[0][0], speech[-1][1]
+                # a pause after the speech ends the utterance
+                final = final or len(audio) - stop >= self._pause
+
+            if end > self.transcribed or partial is None:
+                event = self._transcribe(
+                    audio[start:stop], segment + start, segment + stop
+                )
+            else:
+                event = partial
+            self.transcribed = end
+
+            if final:
+                if self.vad is not None:
+                    self.vad.metrics.record(
+                        len(audio), stop - start, self.sampling_rate
+                    )
+                if event.text.strip():
+                    on_event(event._replace(final=True))
+                segment = end
+                partial = None
+            else:
+                if partial is None or event.text != partial.text:
+                    on_event(event)
+                partial = event
+
+    def stop(self) -> None:
+        self._stopped.set()
+        # wakes run up if it is waiting for audio
+        self._queue.put(None)
+        close = getattr(self.source, "close", None)
+        if close is not None:
+            close()
+
+    async def events(self) -> AsyncIterator[Transcript]:
+        """The events of run, which runs on a thread while they are read."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        done = object()
+
+        def run() -> None:
+            try:
+                self.run(
+                    lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+                )
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, done)
+
+        thread = threading.Thread(target=run, name="transcriber", daemon=True)
+        thread.start()
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield event
+        finally:
+            self.stop()
@@ -0,0 +1,175 @@
+"""
+Voice activity detection.
+
+Whisper costs the same for a 30-second window of silence as for one full of
+speech, and voice commands are mostly padding around a short utterance. The
+detector cuts audio into short frames and asks a model which of them hold
+speech. Neighbouring speech frames separated by less than min_silence are
+joined into regions, regions shorter than min_speech are dropped as clicks,
+and every region is padded on both sides so word onsets and endings survive.
+
+Leading and trailing silence is trimmed that way, long pauses are cut out,
+and audio without any region is never transcribed. split packs the regions of
+an upload into as few clips as fit Whisper's window. The metrics report how
+much audio was skipped.
+
+The default EnergyModel calls a frame speech when it is loud enough, or
+somewhat quieter but with the high zero-crossing rate of fricatives. Any
+callable taking (frames, sampling_rate) and returning one bool per frame can
+replace it, e.g. a wrapper around a neural VAD.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+Model = Callable[[np.ndarray, int], np.ndarray]
+
+
+class EnergyModel(object):
+    def __init__(
+        self,
+        threshold_db: float = -40.0,
+        zcr_threshold: float = 0.25,
+        margin_db: float = 10.0,
+    ):
+        # dBFS of the frame RMS, full scale being samples in [-1, 1]
+        self.threshold_db = threshold_db
+        self.zcr_threshold = zcr_threshold
+        self.margin_db = margin_db
+
+    def __call__(self, frames: np.ndarray, sampling_rate: int) -> np.ndarray:
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+        energy_db = 20 * np.log10(np.maximum(rms, 1e-10))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return (energy_db > self.threshold_db) | (
+            (energy_db > self.threshold_db - self.margin_db)
+            & (zcr > self.zcr_threshold)
+        )
+
+
+class VADMetrics(object):
+    def __init__(self):
+        self.clips = 0
+        self.skipped_clips = 0
+        self.audio_seconds = 0.0
+        self.speech_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, samples: int, speech_samples: int, sampling_rate: int) -> None:
+        with self.lock:
+            self.clips += 1
+            self.skipped_clips += speech_samples == 0
+            self.audio_seconds += samples / sampling_rate
+            self.speech_seconds += speech_samples / sampling_rate
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            skipped = self.audio_seconds - self.speech_seconds
+            return {
+                "clips": self.clips,
+                "skipped_clips": self.skipped_clips,
+                "audio_seconds": self.audio_seconds,
+                "speech_seconds": self.speech_seconds,
+                "skipped_seconds": skipped,
+                "skipped_fraction": (
+                    skipped / self.audio_seconds if self.audio_seconds else 0.0
+                ),
+            }
+
+
+class VoiceActivityDetector(object):
+    def __init__(
+        self,
+        model: Optional[Model] = None,
+        frame_seconds: float = 0.03,
+        min_silence: float = 0.5,
+        min_speech: float = 0.1,
+        padding: float = 0.2,
+    ):
+        self.model = model or EnergyModel()
+        self.frame_seconds = frame_seconds
+        self.min_silence = min_silence
+        self.min_speech = min_speech
+        self.padding = padding
+        self.metrics = VADMetrics()
+
+    def speech_frames(
+        self, audio: np.ndarray, sampling_rate: int
+    ) -> Tuple[np.ndarray, int]:
+        """One bool per frame, and the frame length in samples."""
+        frame = max(1, int(self.frame_seconds * sampling_rate))
+        count = len(audio) // frame
+        frames = np.asarray(audio[: count * frame], dtype=np.float32).reshape(
+            count, frame
+        )
+        if not count:
+            return np.zeros(0, dtype=bool), frame
+        return np.asarray(self.model(frames, sampling_rate), dtype=bool), frame
+
+    def segments(self, audio: np.ndarray, sampling_rate: int) -> List[Tuple[int, int]]:
+        """Sample ranges of the speech in audio, padded and without long pauses."""
+        speech, frame = self.speech_frames(audio, sampling_rate)
+        edges = np.flatnonzero(
+            np.diff(np.concatenate(([0], speech.view(np.int8), [0])))
+        )
+        regions = list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+        min_silence = self.min_silence / self.frame_seconds
+        min_speech = self.min_speech / self.frame_seconds
+        padding = int(round(self.padding / self.frame_seconds))
+
+        merged = []
+        for start, stop in regions:
+            if merged and start - merged[-1][1] < min_silence:
+                merged[-1][1] = stop
+            else:
+                merged.append([start, stop])
+
+        segments = []
+        for start, stop in merged:
+            if stop - start < min_speech:
+                continue
+            start = max(0, start - padding) * frame
+            stop = min(len(audio), (stop + padding) * frame)
+            if segments and start <= segments[-1][1]:
+                segments[-1] = (segments[-1][0], stop)
+            else:
+                segments.append((start, stop))
+        return segments
+
+    def split(
+        self, audio: np.ndarray, sampling_rate: int, max_length: Optional[float] = None
+    ) -> List[np.ndarray]:
+        """
+        The speech in audio, packed into clips of at most max_length seconds
+        where it can be cut at a pause. No clips when nothing was said.
+        """
+        segments = self.segments(audio, sampling_rate)
+        limit = int(max_length * sampling_rate) if max_length else None
+
+        clips, current, length = [], [], 0
+        for start, stop in segments:
+            if current and limit and length + stop - start > limit:
+                clips.append(np.concatenate(current))
+                current, length = [], 0
+            current.append(audio[start:stop])
+            length += stop - start
+        if current:
+            clips.append(np.concatenate(current))
+
+        self.metrics.record(len(audio), sum(len(clip) for clip in clips), sampling_rate)
+        return clips
+
+
+def detector_from_env() -> Optional[VoiceActivityDetector]:
+    """The detector configured by VAD_THRESHOLD_DB and friends, None if VAD=0."""
+    if os.environ.get("VAD", "1") != "1":
+        return None
+    return VoiceActivityDetector(
+        EnergyModel(threshold_db=float(os.environ.get("VAD_THRESHOLD_DB", -40))),
+        min_silence=float(os.environ.get("VAD_MIN_SILENCE_MS", 500)) / 1000,
+    )
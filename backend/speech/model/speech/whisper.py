@@ -1,7 +1,7 @@
 """
-This script continuously listens for audio input, processes the audio in 5-second chunks, and 
-transcribes the speech using the "openai/whisper" model series with the Transformers pipeline 
-and chunking enabled.
+This script continuously listens for audio input and streams it through the
+"openai/whisper" model series with Transformers, printing partial transcripts
+every second and a final one every few seconds.
 
 https://huggingface.co/openai/whisper-tiny
 """
@@ -9,20 +9,85 @@ https://huggingface.co/openai/whisper-tiny
 import os
 import io
 import string
-import pyaudio
+import torch
 import numpy as np
 import soundfile as sf
-from scipy.io import wavfile
-from typing import List
-from queue import Queue
-from threading import Thread
+from typing import Iterable, List, Optional, Tuple, Union
+from .audio import decode, resample, to_mono
+from .longform import join, overlap_words, split_windows, stitch
+from .streaming import MicrophoneSource, StreamingTranscriber, Transcript
+from .vad import detector_from_env
 from transformers import WhisperProcessor, WhisperForConditionalGeneration
 
 
+class LogMelFeatures(object):
+    """
+    Whisper's log-mel input features for a whole batch of clips at once.
+    Clips are downmixed, resampled to the model's rate and padded or cut to
+    the 30-second window into one tensor; a single batched STFT and one
+    matrix product with the mel filterbank replace the processor's clip by
+    clip loop. The window and filterbank are built once. The output matches
+    WhisperFeatureExtractor up to float32 rounding.
+    """
+
+    def __init__(self, feature_extractor):
+        self.n_fft = feature_extractor.n_fft
+        self.hop_length = feature_extractor.hop_length
+        self.n_samples = feature_extractor.n_samples
+        self.sampling_rate = feature_extractor.sampling_rate
+
+        filters = np.asarray(feature_extractor.mel_filters, dtype=np.float32)
+        # stored as (n_mels, n_freqs) or transposed depending on the version
+        if filters.shape[0] == self.n_fft // 2 + 1:
+            filters = filters.T
+        self.filters = torch.from_numpy(np.ascontiguousarray(filters))
+        self.window = torch.hann_window(self.n_fft)
+
+    def pad(self, clips: List[np.ndarray]) -> torch.Tensor:
+        batch = np.zeros((len(clips), self.n_samples), dtype=np.float32)
+        for i, clip in enumerate(clips):
+            clip = clip[: self.n_samples]
+            batch[i, : len(clip)] = clip
+        return torch.from_numpy(batch)
+
+    def __call__(self, clips: List[np.ndarray], sampling_rate: int) -> torch.Tensor:
+        waveforms = self.pad(
+            [
+                resample(to_mono(np.asarray(clip)), sampling_rate, self.sampling_rate)
+                for clip in clips
+            ]
+        )
+        stft = torch.stft(
+            waveforms,
+            self.n_fft,
+            self.hop_length,
+            window=self.window,
+            center=True,
+            pad_mode="reflect",
+            return_complex=True,
+        )
+        # the last frame is dropped, as by the feature extractor
+        power = stft[..., :-1].abs() ** 2
+        mel = self.filters @ power
+
+        log_spec = torch.clamp(mel, min=1e-10).log10()
+        peak = log_spec.amax(dim=(1, 2), keepdim=True)
+        log_spec = torch.maximum(log_spec, peak - 8.0)
+        return (log_spec + 4.0) / 4.0
+
+
 class Whisper(object):
     def __init__(self, model: str = "openai/whisper-tiny"):
+        # live transcripts are finalized every SECONDS, partials every STREAM_STEP
         self.seconds = int(os.environ.get("SECONDS", 5))
+        self.step = float(os.environ.get("STREAM_STEP", 1))
+        # seconds between the starts of overlapping windows in long audio
+        self.stride = float(os.environ.get("LONG_FORM_STRIDE", 25))
         self.sampling_rate = int(os.environ.get("SAMPLING_RATE", 16000))
+        # silence is cut out of live audio before inference unless VAD=0
+        self.vad = detector_from_env()
+        # and out of files only with UPLOAD_VAD=1, as for uploads
+        self.file_vad = self.vad if os.environ.get("UPLOAD_VAD", "0") == "1" else None
         self.pretrained_model = model
 
         self.processor = WhisperProcessor.from_pretrained(self.pretrained_model)
@@ -30,36 +95,14 @@ class Whisper(object):
             self.pretrained_model
         )
         self.model.config.forced_decoder_ids = None
+        # inference only, the weights are never written and can be shared
+        self.model.eval()
+        self.features = LogMelFeatures(self.processor.feature_extractor)
 
-    # Record user audio
-    def record_audio(
-        self,
-        queue: Queue,
-        chunk: int = 1024,
-        channels: int = 1,
-        rate: int = 16000,
-        format: int = pyaudio.paInt16,
-    ) -> None:
-        audio = pyaudio.PyAudio()
-        stream = audio.open(
-            format=format,
-            channels=channels,
-            rate=rate,
-            input=True,
-            frames_per_buffer=chunk,
-        )
-
-        print("Listening...")
-
-        while True:
-            try:
-                data = stream.read(chunk, exception_on_overflow=False)
-                queue.put(data)
-            except OSError as e:
-                if e.errno == -9981:
-                    print("Input overflowed. Skipping...")
-                else:
-                    raise e
+    def warmup(self) -> None:
+        """Run one inference so the first request does not pay for it."""
+        silence = np.zeros(self.sampling_rate, dtype=np.float32)
+        self.speech_to_text(silence, self.sampling_rate)
 
     def convert_wav_to_flac(self, wav_data: np.ndarray, sample_rate: int) -> np.ndarray:
         flac_data = io.BytesIO()
@@ -70,73 +113,87 @@ class Whisper(object):
 
         return flac_data_array
 
-    def speech_to_text(self, data: np.ndarray, sampling_rate: int) -> List[str]:
-        input_features = self.processor(
-            data, sampling_rate=sampling_rate, return_tensors="pt"
-        ).input_features
-        predicted_ids = self.model.generate(input_features)
+    def speech_to_text(
+        self, data: Union[np.ndarray, List[np.ndarray]], sampling_rate: int
+    ) -> List[str]:
+        # a list of clips is padded and decoded as one batch
+        clips = data if isinstance(data, list) else [data]
+        with torch.inference_mode():
+            input_features = self.features(clips, sampling_rate)
+            predicted_ids = self.model.generate(input_features)
         return self.processor.batch_decode(predicted_ids, skip_special_tokens=True)
 
-    def transcribe(self, file_path: str) -> str:
-        sampling_rate, data = wavfile.read(file_path)
-        data = self.convert_wav_to_flac(data, sampling_rate)
-
-        return self.speech_to_text(data, sampling_rate)
-
-    def transcribe_audio(self):
-        # Initialize the recording thread and queue
-        record_queue = Queue()
-        record_thread = Thread(target=self.record_audio, args=(record_queue,))
-        record_thread.daemon = True
-        record_thread.start()
-
-        # Set up continuous streaming
-        buffer = []
-        buffer_len = 0
-        buffer_max_len = self.seconds * self.sampling_rate
-
-        print("Starting transcription loop...")
-
-        pattern = r"[^\w\s]"
-
-        while True:
-            if not record_queue.empty():
-                # Retrieve the recorded data and append it to the buffer
-                data = record_queue.get()
-                data_np = np.frombuffer(data, dtype=np.int16)
-                buffer.append(data_np)
-                buffer_len += len(data_np)
-
-                # Check if the buffer is full
-                if buffer_len >= buffer_max_len:
-                    # Concatenate the buffered data into a single array
-                    audio_input = np.concatenate(buffer, axis=0)
-
-                    # Save the audio input to a temporary file
-                    temp_filename = "temp.wav"
-                    sf.write(
-                        temp_filename, audio_input, self.sampling_rate, subtype="PCM_16"
-                    )
-
-                    sampling_rate, data = wavfile.read("temp.wav")
-                    data = self.convert_wav_to_flac(data, sampling_rate)
-
-                    transcription = self.speech_to_text(data, sampling_rate)
-
-                    # TODO: Trigger is for development purposes only. Remove later.
-                    print("Transcription:", transcription)
-                    trigger = (
-                        transcription[0]
-                        .lower()
-                        .translate(str.maketrans("", "", string.punctuation))
-                        .strip()
-                    )
-
-                    if trigger == "stop":
-                        os.remove(temp_filename)
-                        break
-
-                    # Clear the buffer and remove the temporary file
-                    buffer = []
-                    buffer_len = 0
-                    os.remove(temp_filename)
+    def load_audio(self, file_path: str) -> Tuple[np.ndarray, int]:
+        with open(file_path, "rb") as f:
+            buffer = f.read()
+        format = file_path.rsplit(".", 1)[-1].lower()
+        return decode(buffer, format, self.sampling_rate), self.sampling_rate
+
+    def speech_to_text_long(
+        self,
+        data: Union[np.ndarray, List[np.ndarray]],
+        sampling_rate: int,
+        stride: Optional[float] = None,
+        batch_size: int = 8,
+    ) -> List[str]:
+        """
+        Transcribe audio of any length in overlapping 30-second windows. The
+        windows of a list of clips are batched together and the clips'
+        transcripts joined.
+        """
+        clips = data if isinstance(data, list) else [data]
+        window = self.features.n_samples / self.features.sampling_rate
+        stride = stride or self.stride
+        windows = [split_windows(clip, sampling_rate, window, stride) for clip in clips]
+
+        flat = [w for clip_windows in windows for w in clip_windows]
+        transcripts = []
+        for i in range(0, len(flat), batch_size):
+            transcripts.extend(
+                self.speech_to_text(flat[i : i + batch_size], sampling_rate)
+            )
+
+        max_overlap = overlap_words(window, stride)
+        texts = []
+        for clip_windows in windows:
+            texts.append(stitch(transcripts[: len(clip_windows)], max_overlap))
+            transcripts = transcripts[len(clip_windows) :]
+        return [join(texts)]
+
+    def transcribe(self, file_path: str, stride: Optional[float] = None) -> List[str]:
+        data, sampling_rate = self.load_audio(file_path)
+        if self.file_vad is not None:
+            window = self.features.n_samples / self.features.sampling_rate
+            data = self.file_vad.split(data, sampling_rate, window)
+            if not data:
+                # nothing was said, the model is not run
+                return [""]
+
+        return self.speech_to_text_long(data, sampling_rate, stride)
+
+    def transcribe_audio(self, source: Optional[Iterable[np.ndarray]] = None) -> None:
+        # the microphone unless another source, like a FileSource, is given
+        if source is None:
+            source = MicrophoneSource(self.sampling_rate)
+        transcriber = StreamingTranscriber(
+            self,
+            source,
+            self.sampling_rate,
+            step=self.step,
+            max_segment=self.seconds,
+            vad=self.vad,
+        )
+
+        def on_event(event: Transcript) -> None:
+            # TODO: Trigger is for development purposes only. Remove later.
+            print("Transcription:" if event.final else "Partial:", event.text)
+            trigger = (
+                event.text.lower()
+                .translate(str.maketrans("", "", string.punctuation))
+                .strip()
+            )
+            if event.final and trigger == "stop":
+                transcriber.stop()
+
+        print("Listening...")
+        transcriber.run(on_event)
@@ -0,0 +1,59 @@
+import io
+import os
+import shutil
+import numpy as np
+import pytest
+import soundfile as sf
+from model.speech.audio import AudioDecodeError, StreamDecoder, decode
+
+TEST_WAV = os.path.join(os.path.dirname(__file__), "test.wav")
+
+
+def encode(data, rate, format):
+    buffer = io.BytesIO()
+    sf.write(buffer, data, rate, format=format)
+    return buffer.getvalue()
+
+
+def test_decode_wav():
+    with open(TEST_WAV, "rb") as f:
+        buffer = f.read()
+    reference, rate = sf.read(TEST_WAV, dtype="float32")
+
+    audio = decode(buffer, "wav")
+    assert audio.dtype == np.float32 and audio.ndim == 1
+    assert abs(len(audio) - len(reference) * 16000 / rate) <= 1
+
+
+def test_downmix_and_resample():
+    rate = 44100
+    t = np.arange(rate) / rate
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+    stereo = np.stack([tone, tone], axis=1)
+
+    audio = decode(encode(stereo, rate, "FLAC"), "flac")
+    assert audio.dtype == np.float32 and audio.shape == (16000,)
+    # the tone survives resampling
+    spectrum = np.abs(np.fft.rfft(audio))
+    assert abs(np.argmax(spectrum) - 440) <= 1
+
+
+def test_invalid_audio():
+    with pytest.raises(AudioDecodeError):
+        decode(b"not audio", "mp3")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_stream_decoder():
+    rate = 48000
+    t = np.arange(2 * rate) / rate
+    buffer = encode(0.5 * np.sin(2 * np.pi * 440 * t), rate, "OGG")
+
+    chunks = []
+    decoder = StreamDecoder("ogg", chunks.append)
+    # fed in pieces, the way a client sends them
+    for i in range(0, len(buffer), 1000):
+        decoder.feed(buffer[i : i + 1000])
+    decoder.close()
+    audio = np.concatenate(chunks)
+    assert audio.dtype == np.float32 and abs(len(audio) - 32000) < 1600
@@ -0,0 +1,83 @@
+import time
+import threading
+import numpy as np
+import pytest
+from model.speech.batching import BatchScheduler
+
+
+class FakeModel(object):
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.batches = []
+
+    def speech_to_text(self, clips, sampling_rate):
+        self.batches.append(len(clips))
+        time.sleep(self.delay)
+        if any(clip.size == 0 for clip in clips):
+            raise ValueError("empty clip")
+        return [f"{sampling_rate}:{clip[0]:.0f}" for clip in clips]
+
+
+def transcribe_concurrently(scheduler, clips, sampling_rate=16000):
+    results = [None] * len(clips)
+
+    def run(i):
+        results[i] = scheduler.transcribe(clips[i], sampling_rate)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(clips))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_batches_concurrent_requests():
+    model = FakeModel()
+    scheduler = BatchScheduler(lambda: model, max_batch_size=4, max_wait=0.05)
+    clips = [np.full(16000, i, dtype=np.float32) for i in range(8)]
+
+    results = transcribe_concurrently(scheduler, clips)
+    assert results == [f"16000:{i}" for i in range(8)]
+    assert max(model.batches) > 1 and all(size <= 4 for size in model.batches)
+
+    metrics = scheduler.metrics.to_dict()
+    assert metrics["requests"] == 8
+    assert metrics["mean_batch_size"] > 1
+    assert metrics["max_queued_ms"] >= 0
+
+
+def test_max_wait():
+    model = FakeModel(delay=0.0)
+    scheduler = BatchScheduler(lambda: model, max_batch_size=8, max_wait=0.02)
+    start = time.monotonic()
+    assert scheduler.transcribe(np.ones(10, dtype=np.float32), 16000) == "16000:1"
+    # a lone request waits at most max_wait for company
+    assert time.monotonic() - start < 0.5
+    assert model.batches == [1]
+
+
+def test_sampling_rates_and_errors():
+    model = FakeModel(delay=0.0)
+    scheduler = BatchScheduler(lambda: model, max_batch_size=8, max_wait=0.05)
+    futures = [
+        scheduler.submit(np.ones(10, dtype=np.float32), 16000),
+        scheduler.submit(np.ones(10, dtype=np.float32), 8000),
+        scheduler.submit(np.ones(10, dtype=np.float32), 16000),
+    ]
+    assert [future.result() for future in futures] == ["16000:1", "8000:1", "16000:1"]
+
+    with pytest.raises(ValueError):
+        scheduler.transcribe(np.array([], dtype=np.float32), 16000)
+
+
+def test_cancelled_requests_are_skipped():
+    model = FakeModel(delay=0.2)
+    scheduler = BatchScheduler(lambda: model, max_batch_size=1, max_wait=0.0)
+    running = scheduler.submit(np.ones(10, dtype=np.float32), 16000)
+    time.sleep(0.05)
+    cancelled = scheduler.submit(np.full(10, 2, dtype=np.float32), 16000)
+    assert cancelled.cancel()
+    assert scheduler.transcribe(np.full(10, 3, dtype=np.float32), 16000) == "16000:3"
+    assert running.result() == "16000:1"
+    assert model.batches == [1, 1]
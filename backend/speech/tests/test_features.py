@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+from transformers import WhisperFeatureExtractor
+from model.speech.audio import resample
+from model.speech.whisper import LogMelFeatures
+
+
+@pytest.fixture(scope="module")
+def feature_extractor():
+    return WhisperFeatureExtractor.from_pretrained(
+        os.environ.get("MODEL", "openai/whisper-tiny")
+    )
+
+
+def clip(seconds, rate=16000, frequency=440.0):
+    t = np.arange(int(seconds * rate)) / rate
+    return (0.3 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def test_matches_feature_extractor(feature_extractor):
+    features = LogMelFeatures(feature_extractor)
+    clips = [clip(1.5), clip(4.0, frequency=880.0), clip(35.0)]
+
+    expected = feature_extractor(
+        clips, sampling_rate=16000, return_tensors="np"
+    ).input_features
+    actual = features(clips, 16000).numpy()
+    assert actual.shape == expected.shape == (3, 80, 3000)
+    np.testing.assert_allclose(actual, expected, atol=1e-3)
+
+
+def test_resamples(feature_extractor):
+    features = LogMelFeatures(feature_extractor)
+    audio = clip(2.0, rate=44100)
+
+    expected = feature_extractor(
+        [resample(audio, 44100, 16000)], sampling_rate=16000, return_tensors="np"
+    ).input_features
+    np.testing.assert_allclose(features([audio], 44100).numpy(), expected, atol=1e-3)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from model.speech.longform import merge, overlap_words, split_windows, stitch
+
+
+def test_split_windows():
+    audio = np.arange(70 * 100, dtype=np.float32)
+    windows = split_windows(audio, 100, window=30.0, stride=25.0)
+    assert [len(window) for window in windows] == [3000, 3000, 2000]
+    assert [window[0] for window in windows] == [0, 2500, 5000]
+    # the windows cover the audio and overlap by five seconds
+    assert windows[-1][-1] == audio[-1]
+    assert windows[0][-500:].tolist() == windows[1][:500].tolist()
+
+
+def test_split_short_audio():
+    audio = np.ones(1000, dtype=np.float32)
+    windows = split_windows(audio, 100)
+    assert len(windows) == 1 and windows[0] is not audio and len(windows[0]) == 1000
+
+    with pytest.raises(ValueError):
+        split_windows(audio, 100, window=30.0, stride=31.0)
+
+
+def test_merge_overlap():
+    left = "the quick brown fox jumps over".split()
+    right = "Fox jumps over the lazy dog.".split()
+    assert merge(left, right) == "the quick brown fox jumps over the lazy dog.".split()
+
+
+def test_merge_with_cut_words():
+    # the words at the window edges are cut in two and recognized differently
+    left = "one two three four five six sev".split()
+    right = "ree four five six seven eight nine".split()
+    assert (
+        " ".join(merge(left, right)) == "one two three four five six seven eight nine"
+    )
+
+
+def test_merge_without_overlap():
+    assert merge(["hello"], ["world"]) == ["hello", "world"]
+    assert merge([], ["world"]) == ["world"]
+
+
+def test_stitch():
+    transcripts = [
+        " Mr. Quilter is the apostle of the middle",
+        " of the middle classes and we are glad",
+        " we are glad to welcome his gospel.",
+    ]
+    assert stitch(transcripts) == (
+        "Mr. Quilter is the apostle of the middle classes and we are glad to welcome "
+        "his gospel."
+    )
+    assert stitch([" Hello."]) == " Hello."
+
+
+def test_overlap_words():
+    assert overlap_words(30.0, 25.0) == 15
+    assert overlap_words(30.0, 30.0) == 0
+
+    # the seam is only searched within max_overlap words
+    left = "a b c d e f g".split()
+    right = "e f g h i".split()
+    assert merge(left, right, overlap_words(1.0, 0.0)) == "a b c d e f g h i".split()
+    assert merge(left, right, overlap_words(0.5, 0.0)) == left + right
@@ -0,0 +1,65 @@
+import os
+import time
+import pytest
+from model.speech.registry import FAILED, READY, UNLOADED, ModelRegistry
+
+
+class FakeModel(object):
+    def __init__(self, name):
+        self.name = name
+        self.warmups = 0
+
+    def warmup(self):
+        self.warmups += 1
+
+
+class Factory(object):
+    def __init__(self, fail=False):
+        self.loads = 0
+        self.fail = fail
+
+    def __call__(self, name):
+        self.loads += 1
+        if self.fail:
+            raise RuntimeError("download failed")
+        return FakeModel(name)
+
+
+def test_lazy_load():
+    factory = Factory()
+    registry = ModelRegistry("whisper-tiny", factory)
+    assert factory.loads == 0
+    assert registry.status()["state"] == UNLOADED
+
+    model = registry.get()
+    assert registry.get() is model
+    assert factory.loads == 1 and model.warmups == 1
+    status = registry.status()
+    assert status["state"] == READY and status["load_seconds"] is not None
+
+
+def test_preload_defers_warmup():
+    registry = ModelRegistry("whisper-tiny", Factory())
+    registry.preload()
+    entry = registry.entry()
+    assert entry.model.warmups == 0 and not registry.ready()
+
+    # a forked worker warms up in its own process
+    entry.warm_pid = -1
+    registry.get()
+    assert entry.model.warmups == 1 and entry.warm_pid == os.getpid()
+
+
+def test_load_async():
+    registry = ModelRegistry("whisper-tiny", Factory())
+    registry.load_async()
+    for _ in range(100):
+        if registry.ready():
+            break
+        time.sleep(0.01)
+    assert registry.ready()
+
+    failing = ModelRegistry("whisper-tiny", Factory(fail=True))
+    with pytest.raises(RuntimeError):
+        failing.get()
+    assert failing.status()["state"] == FAILED
@@ -0,0 +1,113 @@
+import json
+import time
+import asyncio
+import numpy as np
+from backend.api.stream import TranscriptionSocket, to_samples
+from model.speech.vad import VoiceActivityDetector
+
+RATE = 16000
+
+
+class FakeModel(object):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def speech_to_text(self, audio, sampling_rate):
+        self.calls.append(len(audio) / sampling_rate)
+        time.sleep(self.delay)
+        return [f" {len(audio) / sampling_rate:.1f}s"]
+
+
+def speech(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def pcm16(audio):
+    return (audio * 32767).astype("<i2").tobytes()
+
+
+async def connect(socket, frames, query=b"format=pcm16&rate=16000", interval=0.0):
+    """Runs one connection, returning the messages the server sent."""
+    incoming = asyncio.Queue()
+    sent = []
+
+    async def receive():
+        return await incoming.get()
+
+    async def send(message):
+        sent.append(message)
+
+    async def client():
+        await incoming.put({"type": "websocket.connect"})
+        for frame in frames:
+            await asyncio.sleep(interval)
+            if isinstance(frame, str):
+                await incoming.put({"type": "websocket.receive", "text": frame})
+            else:
+                await incoming.put({"type": "websocket.receive", "bytes": frame})
+
+    task = asyncio.create_task(client())
+    scope = {"type": "websocket", "path": "/ws/transcribe/", "query_string": query}
+    await asyncio.wait_for(socket(scope, receive, send), 30)
+    task.cancel()
+    return sent
+
+
+def transcripts(sent):
+    return [json.loads(m["text"]) for m in sent if m["type"] == "websocket.send"]
+
+
+def test_to_samples():
+    data = pcm16(np.array([0.5, -0.5], dtype=np.float32))
+    samples, remainder = to_samples(data[:3], "pcm16", b"")
+    assert len(samples) == 1 and len(remainder) == 1
+    samples, remainder = to_samples(data[3:], "pcm16", remainder)
+    assert abs(samples[0] + 0.5) < 1e-3 and remainder == b""
+
+
+def test_stream_transcripts():
+    socket = TranscriptionSocket(
+        FakeModel(), VoiceActivityDetector(min_silence=0.3, padding=0.1), step=0.5
+    )
+    audio = np.concatenate(
+        [np.zeros(RATE // 2), speech(1.0), np.zeros(RATE), speech(0.5)]
+    ).astype(np.float32)
+    # 100 ms frames, sent a little faster than real time
+    frames = [pcm16(audio[i : i + 1600]) for i in range(0, len(audio), 1600)]
+    sent = asyncio.run(connect(socket, frames + ['{"type": "end"}'], interval=0.02))
+
+    assert sent[0] == {"type": "websocket.accept"}
+    assert sent[-1] == {"type": "websocket.close", "code": 1000}
+    messages = transcripts(sent)
+    finals = [m for m in messages if m["type"] == "final"]
+    lengths = [float(m["text"][:-1]) for m in finals]
+    # the second utterance runs to the end of the stream, padded only in front
+    assert len(lengths) == 2
+    assert abs(lengths[0] - 1.2) < 0.1 and abs(lengths[1] - 0.6) < 0.1
+    # the first utterance is final before the stream ends
+    assert messages.index(finals[0]) < len(messages) - 1
+    assert socket.connections == 0
+
+
+def test_connection_limit():
+    socket = TranscriptionSocket(FakeModel(), max_connections=0)
+    sent = asyncio.run(connect(socket, []))
+    assert transcripts(sent)[0]["type"] == "error"
+    assert sent[-1] == {"type": "websocket.close", "code": 1013}
+
+
+def test_unsupported_format():
+    socket = TranscriptionSocket(FakeModel())
+    sent = asyncio.run(connect(socket, [], query=b"format=mp3"))
+    assert sent[-1] == {"type": "websocket.close", "code": 1003}
+
+
+def test_backpressure():
+    # a model far slower than the audio arrives, nothing is read while behind
+    socket = TranscriptionSocket(FakeModel(delay=1.0), max_lag=0.5, lag_timeout=0.2)
+    frames = [pcm16(speech(1.0))] * 5
+    sent = asyncio.run(connect(socket, frames))
+    assert sent[-1] == {"type": "websocket.close", "code": 1013}
+    assert "faster" in transcripts(sent)[-1]["error"]
@@ -0,0 +1,113 @@
+import time
+import asyncio
+import numpy as np
+import pytest
+from model.speech.streaming import FileSource, RingBuffer, StreamingTranscriber
+
+
+class FakeModel(object):
+    def __init__(self, delay: float = 0.0):
+        self.calls = []
+        self.delay = delay
+
+    def speech_to_text(self, audio, sampling_rate):
+        time.sleep(self.delay)
+        self.calls.append(len(audio))
+        return [f"{len(audio) / sampling_rate:.1f}s"]
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(10)
+    buffer.write(np.arange(7, dtype=np.float32))
+    buffer.write(np.arange(7, 15, dtype=np.float32))
+    assert (buffer.start, buffer.end) == (5, 15)
+    assert buffer.read(0).tolist() == list(range(5, 15))
+    assert buffer.read(8, 12).tolist() == [8, 9, 10, 11]
+
+    buffer.write(np.arange(15, 40, dtype=np.float32))
+    assert buffer.read(0).tolist() == list(range(30, 40))
+    assert len(buffer.read(40)) == 0
+
+
+def test_partial_and_final_events():
+    audio = np.ones(int(2.5 * 16000), dtype=np.float32)
+    source = FileSource(audio, chunk_seconds=0.1)
+    transcriber = StreamingTranscriber(FakeModel(), source, step=1.0, max_segment=2.0)
+
+    events = []
+    transcriber.run(events.append)
+    finals = [event for event in events if event.final]
+    partials = [event for event in events if not event.final]
+    # every final segment is reported once and together they cover the stream
+    assert [(event.start, event.end) for event in finals] == [(0.0, 2.0), (2.0, 2.5)]
+    assert [event.text for event in finals] == ["2.0s", "0.5s"]
+    assert partials and all(event.end < 2.0 for event in partials)
+
+
+def test_falling_behind_drops_audio():
+    # audio arrives far faster than the model transcribes it
+    audio = np.ones(5 * 16000, dtype=np.float32)
+    source = FileSource(audio, chunk_seconds=0.1, realtime=False)
+    transcriber = StreamingTranscriber(
+        FakeModel(delay=0.2), source, step=0.1, max_segment=0.5
+    )
+
+    events = []
+    transcriber.run(events.append)
+    assert transcriber.dropped > 0
+    for event in events:
+        # the timestamps cover the audio that was transcribed
+        assert event.text == f"{event.end - event.start:.1f}s"
+    finals = [event for event in events if event.final]
+    assert finals[-1].end == 5.0
+    assert sum(event.end - event.start for event in finals) == pytest.approx(
+        5.0 - transcriber.dropped / 16000
+    )
+
+
+def test_transcribed_position():
+    audio = np.ones(int(2.5 * 16000), dtype=np.float32)
+    source = FileSource(audio, chunk_seconds=0.1, realtime=False)
+    transcriber = StreamingTranscriber(FakeModel(), source, step=1.0, max_segment=2.0)
+
+    positions = []
+    speech_to_text = transcriber.model.speech_to_text
+    transcriber.model.speech_to_text = lambda clips, rate: (
+        positions.append((transcriber.transcribed, transcriber.buffer.end)),
+        speech_to_text(clips, rate),
+    )[1]
+    transcriber.run(lambda event: None)
+
+    # audio in the buffer only counts once its inference is done
+    assert positions and all(transcribed < end for transcribed, end in positions)
+    assert transcriber.transcribed == len(audio)
+
+
+def test_idle_and_stop():
+    # a minute of audio arriving in real time, stopped after the first event
+    source = FileSource(np.zeros(60 * 16000, dtype=np.float32), chunk_seconds=0.1)
+    transcriber = StreamingTranscriber(FakeModel(), source, step=1.0)
+
+    events = []
+
+    def on_event(event):
+        events.append(event)
+        transcriber.stop()
+
+    start, cpu = time.monotonic(), time.process_time()
+    transcriber.run(on_event)
+    assert len(events) == 1 and time.monotonic() - start < 5
+    # waiting for audio does not spin
+    assert time.process_time() - cpu < 0.5
+
+
+def test_async_events():
+    audio = np.ones(16000, dtype=np.float32)
+
+    async def collect():
+        source = FileSource(audio, chunk_seconds=0.1, realtime=False)
+        transcriber = StreamingTranscriber(FakeModel(), source, max_segment=5.0)
+        return [event async for event in transcriber.events()]
+
+    events = asyncio.run(collect())
+    assert events[-1].final and events[-1].text == "1.0s"
@@ -0,0 +1,90 @@
+import numpy as np
+from model.speech.streaming import FileSource, StreamingTranscriber
+from model.speech.vad import EnergyModel, VoiceActivityDetector
+
+RATE = 16000
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.float32)
+
+
+def tone(seconds, amplitude=0.1):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+class FakeModel(object):
+    def __init__(self):
+        self.calls = []
+
+    def speech_to_text(self, audio, sampling_rate):
+        self.calls.append(len(audio) / sampling_rate)
+        return [f"{len(audio) / sampling_rate:.1f}s"]
+
+
+def test_energy_model():
+    rng = np.random.default_rng(0)
+    # a quiet fricative is noisy, a hum as quiet as it is not speech
+    hiss = (0.008 * rng.standard_normal(RATE)).astype(np.float32)
+    hum = tone(1.0, amplitude=0.008)
+    model = EnergyModel()
+    assert model(hiss[: 33 * 480].reshape(33, 480), RATE).all()
+    assert not model(hum[: 33 * 480].reshape(33, 480), RATE).any()
+    assert model(tone(0.99).reshape(33, 480), RATE).all()
+
+
+def test_trim_and_split_on_pauses():
+    vad = VoiceActivityDetector(min_silence=0.5, padding=0.1)
+    audio = np.concatenate(
+        [silence(2), tone(1), silence(0.3), tone(1), silence(2), tone(1)]
+    )
+
+    segments = [
+        (start / RATE, stop / RATE) for start, stop in vad.segments(audio, RATE)
+    ]
+    # the short pause is kept, the long one is cut
+    assert len(segments) == 2
+    assert abs(segments[0][0] - 1.9) < 0.05 and abs(segments[0][1] - 4.4) < 0.05
+    assert abs(segments[1][0] - 6.2) < 0.05 and abs(segments[1][1] - 7.3) < 0.05
+
+    clips = vad.split(audio, RATE, max_length=30.0)
+    assert len(clips) == 1 and abs(len(clips[0]) / RATE - 3.6) < 0.1
+    assert len(vad.split(audio, RATE, max_length=3.0)) == 2
+
+    metrics = vad.metrics.to_dict()
+    assert metrics["clips"] == 2 and metrics["skipped_clips"] == 0
+    assert abs(metrics["skipped_seconds"] - 2 * (7.3 - 3.6)) < 0.2
+
+
+def test_silence_is_skipped():
+    vad = VoiceActivityDetector()
+    rng = np.random.default_rng(0)
+    # clicks shorter than min_speech are not speech either
+    audio = (0.001 * rng.standard_normal(5 * RATE)).astype(np.float32)
+    audio[RATE : RATE + 480] = 0.5
+    assert vad.split(audio, RATE) == []
+    assert vad.metrics.to_dict()["skipped_clips"] == 1
+    assert vad.metrics.to_dict()["skipped_fraction"] == 1.0
+
+
+def test_streaming_with_vad():
+    audio = np.concatenate([silence(2), tone(1), silence(1), tone(0.5), silence(3)])
+    model = FakeModel()
+    vad = VoiceActivityDetector(min_silence=0.5, padding=0.1)
+    source = FileSource(audio, chunk_seconds=0.1)
+    transcriber = StreamingTranscriber(
+        model, source, step=0.5, max_segment=10.0, vad=vad
+    )
+
+    events = []
+    transcriber.run(events.append)
+    finals = [event for event in events if event.final]
+    # each utterance is finalized after its pause, not when the stream ends
+    lengths = [float(event.text[:-1]) for event in finals]
+    assert len(lengths) == 2
+    assert abs(lengths[0] - 1.2) < 0.1 and abs(lengths[1] - 0.7) < 0.1
+    assert abs(finals[0].start - 1.9) < 0.05 and finals[1].end < 5.0
+    # the model never sees more than an utterance and its padding
+    assert max(model.calls) <= 1.25
+    assert vad.metrics.to_dict()["skipped_seconds"] > 4
@@ -0,0 +1,79 @@
+import io
+import os
+import json
+import time
+import numpy as np
+import pytest
+import soundfile as sf
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from backend.api import speech
+from model.speech.batching import BatchScheduler
+from model.speech.registry import ModelRegistry
+
+
+class FakeModel(object):
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+
+    def warmup(self):
+        pass
+
+    def speech_to_text(self, clips, sampling_rate):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [f"{len(clip) / sampling_rate:.1f}s" for clip in clips]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    registry = ModelRegistry("fake", lambda name: model)
+    monkeypatch.setattr(speech, "registry", registry)
+    monkeypatch.setattr(speech, "scheduler", BatchScheduler(registry.get, max_wait=0.0))
+    return model
+
+
+def upload(audio):
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, 16000, format="WAV")
+    file = SimpleUploadedFile("clip.wav", buffer.getvalue())
+    response = speech.transcribe_audio(
+        RequestFactory().post("/transcribe/", {"file": file})
+    )
+    return response.status_code, json.loads(response.content)
+
+
+def test_quiet_upload_is_transcribed(model):
+    # well below the detector's threshold, but still speech
+    t = np.arange(16000) / 16000
+    quiet = (0.001 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    assert upload(quiet) == (200, {"transcription": ["1.0s"], "vad_skipped": False})
+
+
+def test_timeout_and_failures(model, monkeypatch):
+    audio = np.zeros(16000, dtype=np.float32)
+    monkeypatch.setattr(speech, "TRANSCRIBE_TIMEOUT", 0.1)
+    model.delay = 0.5
+    status, body = upload(audio)
+    assert status == 504
+
+    # the request that timed out is still running, the next one waits for it
+    monkeypatch.setattr(speech, "TRANSCRIBE_TIMEOUT", 5.0)
+    model.delay, model.error = 0.0, ValueError("bad input")
+    status, body = upload(audio)
+    assert status == 500 and "bad input" in body["error"]
+
+    def load(name):
+        raise OSError("gone")
+
+    broken = ModelRegistry("missing", load)
+    monkeypatch.setattr(speech, "registry", broken)
+    monkeypatch.setattr(speech, "scheduler", BatchScheduler(broken.get, max_wait=0.0))
+    status, body = upload(audio)
+    assert status == 503 and "gone" in body["error"]